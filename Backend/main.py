@@ -1,16 +1,97 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
+from contextlib import asynccontextmanager
+from collections import deque
 import httpx
 import os
+import sys
+import time
 from dotenv import load_dotenv
 from typing import Optional
 from pydantic import BaseModel
 from urllib.parse import urlencode
 
+# Request coalescing is shared with the RAG services in Rag/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Rag"))
+
+from common.singleflight import SingleFlight, normalize_text, request_key
+
 load_dotenv()
 
-app = FastAPI(title="Google OAuth API")
+# HTTP/2 needs the optional `h2` package; fall back to HTTP/1.1 keep-alive without it
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Upstream connection pool configuration
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+GOOGLE_HTTP2 = os.getenv("GOOGLE_HTTP2", "true").lower() == "true" and HTTP2_AVAILABLE
+GOOGLE_TIMEOUT = float(os.getenv("GOOGLE_TIMEOUT", "10"))
+RAG_TIMEOUT = float(os.getenv("RAG_TIMEOUT", "30"))
+
+# RAG model endpoints
+RAG_TIMETABLE_URL = os.getenv("RAG_TIMETABLE_URL", "http://localhost:8001/generate_timetable")
+RAG_TIMETABLE_STREAM_URL = os.getenv("RAG_TIMETABLE_STREAM_URL", "http://localhost:8001/generate_timetable/stream")
+RAG_TIMETABLE_BATCH_URL = os.getenv("RAG_TIMETABLE_BATCH_URL", "http://localhost:8001/generate_timetable/batch")
+RAG_WELLNESS_URL = os.getenv("RAG_WELLNESS_URL", "http://localhost:8001/analyze_wellness")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Open one pooled client per upstream for the lifetime of the app so that
+    TCP/TLS connections are reused across requests instead of per handler call
+    """
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    app.state.google_client = httpx.AsyncClient(
+        http2=GOOGLE_HTTP2,
+        limits=limits,
+        timeout=httpx.Timeout(GOOGLE_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+    )
+    app.state.rag_client = httpx.AsyncClient(
+        limits=limits,
+        timeout=httpx.Timeout(RAG_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+    )
+    try:
+        yield
+    finally:
+        await app.state.google_client.aclose()
+        await app.state.rag_client.aclose()
+
+
+app = FastAPI(title="Google OAuth API", lifespan=lifespan)
+
+# Recent time-to-first-byte samples (ms) for streamed RAG responses
+stream_ttfb_ms = deque(maxlen=1000)
+
+# Identical RAG requests that arrive while one is in flight share its response
+rag_inflight = SingleFlight()
+
+
+async def post_rag_json(client: httpx.AsyncClient, url: str, payload: dict, text_fields: tuple = ()) -> dict:
+    """
+    POST to a RAG service and return its JSON, coalescing identical in-flight requests.
+    `text_fields` are free text compared ignoring case, punctuation and spacing; the rest
+    of the payload (user_id in particular) has to match exactly.
+    """
+    async def send():
+        response = await client.post(url, json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    key_payload = {key: normalize_text(value) if key in text_fields else value for key, value in payload.items()}
+    result, _ = await rag_inflight.do(request_key(url, key_payload), send)
+    return result
 
 # CORS configuration
 app.add_middleware(
@@ -41,6 +122,27 @@ class TimetableInput(BaseModel):
     study_hours_per_day: int
     exam_dates: Optional[dict] = None
     preferences: Optional[dict] = None
+    structured: bool = False  # Ask the RAG service for validated JSON as well as markdown
+
+
+class TimetableBatchInput(BaseModel):
+    requests: list[TimetableInput]
+
+
+def rag_timetable_request(timetable_data: TimetableInput) -> dict:
+    """
+    The RAG service's TaskInput for a timetable form: it plans from a natural-language
+    `query`, so the subjects, hours, exam dates and preferences are written out as one
+    """
+    query = (f"Create a study timetable for {', '.join(timetable_data.subjects)}, "
+             f"studying {timetable_data.study_hours_per_day} hours per day.")
+    if timetable_data.exam_dates:
+        query += " Exams: " + ", ".join(
+            f"{subject} on {day}" for subject, day in timetable_data.exam_dates.items()) + "."
+    if timetable_data.preferences:
+        query += " Preferences: " + ", ".join(
+            f"{name}: {value}" for name, value in timetable_data.preferences.items()) + "."
+    return {"query": query, "user_id": timetable_data.user_id, "structured": timetable_data.structured}
 
 
 class WellnessInput(BaseModel):
@@ -79,7 +181,7 @@ async def google_login():
 
 
 @app.get("/auth/google/callback")
-async def google_callback_get(code: str = None, error: str = None):
+async def google_callback_get(request: Request, code: str = None, error: str = None):
     """
     Handle Google OAuth callback (GET request from Google)
     Redirects to frontend with tokens or error
@@ -95,164 +197,156 @@ async def google_callback_get(code: str = None, error: str = None):
     if not GOOGLE_CLIENT_ID or not GOOGLE_CLIENT_SECRET:
         raise HTTPException(status_code=500, detail="Google OAuth not configured")
     
-    async with httpx.AsyncClient() as client:
-        # Exchange code for access token
-        token_data = {
-            "code": code,
-            "client_id": GOOGLE_CLIENT_ID,
-            "client_secret": GOOGLE_CLIENT_SECRET,
-            "redirect_uri": GOOGLE_REDIRECT_URI,
-            "grant_type": "authorization_code",
+    client = request.app.state.google_client
+    # Exchange code for access token
+    token_data = {
+        "code": code,
+        "client_id": GOOGLE_CLIENT_ID,
+        "client_secret": GOOGLE_CLIENT_SECRET,
+        "redirect_uri": GOOGLE_REDIRECT_URI,
+        "grant_type": "authorization_code",
+    }
+    
+    try:
+        token_response = await client.post(GOOGLE_TOKEN_URL, data=token_data)
+        token_response.raise_for_status()
+        tokens = token_response.json()
+        
+        access_token = tokens.get("access_token")
+        if not access_token:
+            raise HTTPException(status_code=400, detail="Failed to get access token")
+        
+        # Get user info
+        headers = {"Authorization": f"Bearer {access_token}"}
+        user_response = await client.get(GOOGLE_USERINFO_URL, headers=headers)
+        user_response.raise_for_status()
+        user_info = user_response.json()
+        
+        # Redirect to frontend with tokens
+        params = {
+            "access_token": access_token,
+            "refresh_token": tokens.get("refresh_token", ""),
+            "user_id": user_info.get("id"),
+            "user_email": user_info.get("email"),
+            "user_name": user_info.get("name"),
+            "user_picture": user_info.get("picture"),
         }
+        frontend_url = f"https://studybuddy-asi5.onrender.com?{urlencode(params)}"
+        return RedirectResponse(url=frontend_url)
         
-        try:
-            token_response = await client.post(GOOGLE_TOKEN_URL, data=token_data)
-            token_response.raise_for_status()
-            tokens = token_response.json()
-            
-            access_token = tokens.get("access_token")
-            if not access_token:
-                raise HTTPException(status_code=400, detail="Failed to get access token")
-            
-            # Get user info
-            headers = {"Authorization": f"Bearer {access_token}"}
-            user_response = await client.get(GOOGLE_USERINFO_URL, headers=headers)
-            user_response.raise_for_status()
-            user_info = user_response.json()
-            
-            # Redirect to frontend with tokens
-            params = {
-                "access_token": access_token,
-                "refresh_token": tokens.get("refresh_token", ""),
-                "user_id": user_info.get("id"),
-                "user_email": user_info.get("email"),
-                "user_name": user_info.get("name"),
-                "user_picture": user_info.get("picture"),
-            }
-            frontend_url = f"https://studybuddy-asi5.onrender.com?{urlencode(params)}"
-            return RedirectResponse(url=frontend_url)
-            
-        except httpx.HTTPStatusError as e:
-            error_msg = f"Google API error: {e.response.text}"
-            frontend_url = f"https://studybuddy-asi5.onrender.com?error={error_msg}"
-            return RedirectResponse(url=frontend_url)
-        except Exception as e:
-            error_msg = f"Internal error: {str(e)}"
-            frontend_url = f"https://studybuddy-asi5.onrender.com?error={error_msg}"
-            return RedirectResponse(url=frontend_url)
+    except httpx.HTTPStatusError as e:
+        error_msg = f"Google API error: {e.response.text}"
+        frontend_url = f"https://studybuddy-asi5.onrender.com?error={error_msg}"
+        return RedirectResponse(url=frontend_url)
+    except Exception as e:
+        error_msg = f"Internal error: {str(e)}"
+        frontend_url = f"https://studybuddy-asi5.onrender.com?error={error_msg}"
+        return RedirectResponse(url=frontend_url)
 
 
 @app.post("/auth/google/callback")
-async def google_callback_post(token_request: TokenRequest):
+async def google_callback_post(request: Request, token_request: TokenRequest):
     """
     Exchange authorization code for access token and get user info (POST endpoint for direct API calls)
     """
     if not GOOGLE_CLIENT_ID or not GOOGLE_CLIENT_SECRET:
         raise HTTPException(status_code=500, detail="Google OAuth not configured")
     
-    async with httpx.AsyncClient() as client:
-        # Exchange code for access token
-        token_data = {
-            "code": token_request.code,
-            "client_id": GOOGLE_CLIENT_ID,
-            "client_secret": GOOGLE_CLIENT_SECRET,
-            "redirect_uri": GOOGLE_REDIRECT_URI,
-            "grant_type": "authorization_code",
-        }
+    client = request.app.state.google_client
+    # Exchange code for access token
+    token_data = {
+        "code": token_request.code,
+        "client_id": GOOGLE_CLIENT_ID,
+        "client_secret": GOOGLE_CLIENT_SECRET,
+        "redirect_uri": GOOGLE_REDIRECT_URI,
+        "grant_type": "authorization_code",
+    }
+    
+    try:
+        token_response = await client.post(GOOGLE_TOKEN_URL, data=token_data)
+        token_response.raise_for_status()
+        tokens = token_response.json()
         
-        try:
-            token_response = await client.post(GOOGLE_TOKEN_URL, data=token_data)
-            token_response.raise_for_status()
-            tokens = token_response.json()
-            
-            access_token = tokens.get("access_token")
-            if not access_token:
-                raise HTTPException(status_code=400, detail="Failed to get access token")
-            
-            # Get user info
-            headers = {"Authorization": f"Bearer {access_token}"}
-            user_response = await client.get(GOOGLE_USERINFO_URL, headers=headers)
-            user_response.raise_for_status()
-            user_info = user_response.json()
-            
-            return {
-                "success": True,
-                "user": {
-                    "id": user_info.get("id"),
-                    "email": user_info.get("email"),
-                    "name": user_info.get("name"),
-                    "picture": user_info.get("picture"),
-                    "verified_email": user_info.get("verified_email"),
-                },
-                "tokens": {
-                    "access_token": access_token,
-                    "refresh_token": tokens.get("refresh_token"),
-                    "expires_in": tokens.get("expires_in"),
-                }
+        access_token = tokens.get("access_token")
+        if not access_token:
+            raise HTTPException(status_code=400, detail="Failed to get access token")
+        
+        # Get user info
+        headers = {"Authorization": f"Bearer {access_token}"}
+        user_response = await client.get(GOOGLE_USERINFO_URL, headers=headers)
+        user_response.raise_for_status()
+        user_info = user_response.json()
+        
+        return {
+            "success": True,
+            "user": {
+                "id": user_info.get("id"),
+                "email": user_info.get("email"),
+                "name": user_info.get("name"),
+                "picture": user_info.get("picture"),
+                "verified_email": user_info.get("verified_email"),
+            },
+            "tokens": {
+                "access_token": access_token,
+                "refresh_token": tokens.get("refresh_token"),
+                "expires_in": tokens.get("expires_in"),
             }
-            
-        except httpx.HTTPStatusError as e:
-            raise HTTPException(
-                status_code=e.response.status_code,
-                detail=f"Google API error: {e.response.text}"
-            )
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+        }
+        
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(
+            status_code=e.response.status_code,
+            detail=f"Google API error: {e.response.text}"
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
 
 
 @app.get("/auth/user")
-async def get_user_info(access_token: str):
+async def get_user_info(request: Request, access_token: str):
     """
     Get user info using access token
     """
-    async with httpx.AsyncClient() as client:
-        try:
-            headers = {"Authorization": f"Bearer {access_token}"}
-            user_response = await client.get(GOOGLE_USERINFO_URL, headers=headers)
-            user_response.raise_for_status()
-            user_info = user_response.json()
-            
-            return {
-                "success": True,
-                "user": {
-                    "id": user_info.get("id"),
-                    "email": user_info.get("email"),
-                    "name": user_info.get("name"),
-                    "picture": user_info.get("picture"),
-                    "verified_email": user_info.get("verified_email"),
-                }
+    client = request.app.state.google_client
+    try:
+        headers = {"Authorization": f"Bearer {access_token}"}
+        user_response = await client.get(GOOGLE_USERINFO_URL, headers=headers)
+        user_response.raise_for_status()
+        user_info = user_response.json()
+        
+        return {
+            "success": True,
+            "user": {
+                "id": user_info.get("id"),
+                "email": user_info.get("email"),
+                "name": user_info.get("name"),
+                "picture": user_info.get("picture"),
+                "verified_email": user_info.get("verified_email"),
             }
-        except httpx.HTTPStatusError as e:
-            raise HTTPException(
-                status_code=e.response.status_code,
-                detail="Invalid or expired token"
-            )
+        }
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(
+            status_code=e.response.status_code,
+            detail="Invalid or expired token"
+        )
 
 
 @app.post("/rag/timetable_input")
-async def timetable_input(timetable_data: TimetableInput):
+async def timetable_input(request: Request, timetable_data: TimetableInput):
     """
     Endpoint to receive timetable input from frontend and forward to RAG model
     """
     try:
-        # TODO: Replace with your actual RAG model endpoint URL
-        RAG_MODEL_URL = os.getenv("RAG_TIMETABLE_URL", "http://localhost:8001/generate_timetable")
+        client = request.app.state.rag_client
+        # Forward the data to the RAG model endpoint
+        result = await post_rag_json(client, RAG_TIMETABLE_URL, timetable_data.model_dump())
+        
+        return {
+            "success": True,
+            "message": "Timetable generation request processed",
+            "data": result
+        }
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # Forward the data to the RAG model endpoint
-            response = await client.post(
-                RAG_MODEL_URL,
-                json=timetable_data.model_dump()
-            )
-            response.raise_for_status()
-            result = response.json()
-            
-            return {
-                "success": True,
-                "message": "Timetable generation request processed",
-                "data": result
-            }
-            
     except httpx.HTTPStatusError as e:
         raise HTTPException(
             status_code=e.response.status_code,
@@ -270,30 +364,100 @@ async def timetable_input(timetable_data: TimetableInput):
         )
 
 
+async def relay_rag_stream(request: Request, url: str, payload: dict) -> StreamingResponse:
+    """
+    POST to a streaming RAG endpoint and relay its Server-Sent Events to the frontend as they arrive
+    """
+    client = request.app.state.rag_client
+    started = time.perf_counter()
+    try:
+        upstream_request = client.build_request("POST", url, json=payload)
+        response = await client.send(upstream_request, stream=True)
+    except httpx.RequestError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Could not connect to RAG model service: {str(e)}"
+        )
+
+    if response.is_error:
+        error_body = await response.aread()
+        await response.aclose()
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=f"RAG model error: {error_body.decode(errors='replace')}"
+        )
+
+    async def relay():
+        first_chunk = True
+        try:
+            async for chunk in response.aiter_raw():
+                if first_chunk:
+                    stream_ttfb_ms.append((time.perf_counter() - started) * 1000)
+                    first_chunk = False
+                yield chunk
+        finally:
+            await response.aclose()
+
+    return StreamingResponse(
+        relay(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/rag/timetable_input/stream")
+async def timetable_input_stream(request: Request, timetable_data: TimetableInput):
+    """
+    Relay the RAG model's Server-Sent Events timetable stream to the frontend as it is generated
+    """
+    return await relay_rag_stream(request, RAG_TIMETABLE_STREAM_URL, rag_timetable_request(timetable_data))
+
+
+@app.post("/rag/timetable_input/batch")
+async def timetable_input_batch(request: Request, batch_data: TimetableBatchInput):
+    """
+    Generate timetables for many students in one call; results are relayed as
+    Server-Sent Events as each one finishes, followed by a `done` summary
+    """
+    payload = {"requests": [rag_timetable_request(timetable_data) for timetable_data in batch_data.requests]}
+    return await relay_rag_stream(request, RAG_TIMETABLE_BATCH_URL, payload)
+
+
+@app.get("/rag/metrics")
+async def rag_metrics():
+    """
+    Time-to-first-byte percentiles for streamed RAG responses and request coalescing counts
+    """
+    samples = sorted(stream_ttfb_ms)
+    if not samples:
+        return {"stream_ttfb_ms": {"count": 0}, "coalescing": rag_inflight.stats()}
+    return {
+        "stream_ttfb_ms": {
+            "count": len(samples),
+            "p50": round(samples[int(0.50 * (len(samples) - 1))], 2),
+            "p99": round(samples[int(0.99 * (len(samples) - 1))], 2),
+            "max": round(samples[-1], 2),
+        },
+        "coalescing": rag_inflight.stats(),
+    }
+
+
 @app.post("/rag/wellness")
-async def wellness_input(wellness_data: WellnessInput):
+async def wellness_input(request: Request, wellness_data: WellnessInput):
     """
     Endpoint to receive wellness input from frontend and forward to RAG model
     """
     try:
-        # TODO: Replace with your actual RAG model endpoint URL
-        RAG_MODEL_URL = os.getenv("RAG_WELLNESS_URL", "http://localhost:8001/analyze_wellness")
+        client = request.app.state.rag_client
+        # Forward the data to the RAG model endpoint
+        result = await post_rag_json(client, RAG_WELLNESS_URL, wellness_data.model_dump(), text_fields=("notes",))
+        
+        return {
+            "success": True,
+            "message": "Wellness analysis request processed",
+            "data": result
+        }
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # Forward the data to the RAG model endpoint
-            response = await client.post(
-                RAG_MODEL_URL,
-                json=wellness_data.model_dump()
-            )
-            response.raise_for_status()
-            result = response.json()
-            
-            return {
-                "success": True,
-                "message": "Wellness analysis request processed",
-                "data": result
-            }
-            
     except httpx.HTTPStatusError as e:
         raise HTTPException(
             status_code=e.response.status_code,
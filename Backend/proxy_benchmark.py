@@ -0,0 +1,137 @@
+"""
+Latency benchmark for the proxy endpoints.
+Starts a local stub upstream (standing in for the RAG service and Google's userinfo
+endpoint), points the app at it and fires --requests calls, --concurrency at a time,
+at /rag/timetable_input and /auth/user. Each endpoint is measured twice: with the
+pooled clients opened in `lifespan`, and with a fresh AsyncClient per call (how the
+handlers used to work), and p50/p99 latency is reported for both.
+
+The stub is plain HTTP on localhost, so the per-call numbers only include a TCP
+handshake; against Google over TLS the gap is larger.
+
+Usage:
+    python proxy_benchmark.py --requests 500 --concurrency 20 --upstream-delay 5
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+USERINFO = {"id": "1", "email": "bench@example.com", "name": "Bench", "picture": "", "verified_email": True}
+
+
+def start_stub(delay: float) -> ThreadingHTTPServer:
+    """Keep-alive HTTP/1.1 server answering GET with a userinfo body and POST with a timetable"""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def reply(self, body: dict):
+            time.sleep(delay)
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self.reply(USERINFO)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.reply({"timetable": "| Time | Activity | Task/Subject | Priority | Notes |"})
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class PerRequestClient:
+    """Drop-in for the pooled clients that opens and closes a client on every call"""
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+
+    async def get(self, url, **kwargs):
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            return await client.get(url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            return await client.post(url, **kwargs)
+
+
+def percentile(samples: list, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def measure(proxy: httpx.AsyncClient, endpoint: str, count: int, concurrency: int) -> list:
+    slots = asyncio.Semaphore(concurrency)
+
+    async def call(i: int) -> float:
+        async with slots:
+            started = time.perf_counter()
+            if endpoint == "/auth/user":
+                response = await proxy.get(endpoint, params={"access_token": f"token-{i}"})
+            else:
+                # Distinct payloads so single-flight coalescing doesn't skew the numbers
+                response = await proxy.post(endpoint, json={
+                    "user_id": f"bench-{i}", "subjects": ["maths"], "study_hours_per_day": 4})
+            response.raise_for_status()
+            return (time.perf_counter() - started) * 1000
+
+    return await asyncio.gather(*(call(i) for i in range(count)))
+
+
+async def run(main, args) -> list:
+    rows = []
+    async with main.lifespan(main.app):
+        pooled = (main.app.state.google_client, main.app.state.rag_client)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://proxy", timeout=60) as proxy:
+            for mode in ("pooled", "per-request"):
+                if mode == "per-request":
+                    main.app.state.google_client = PerRequestClient(main.GOOGLE_TIMEOUT)
+                    main.app.state.rag_client = PerRequestClient(main.RAG_TIMEOUT)
+                for endpoint in ("/rag/timetable_input", "/auth/user"):
+                    # Warm-up round so the pooled run isn't charged for opening its connections
+                    await measure(proxy, endpoint, args.concurrency, args.concurrency)
+                    samples = await measure(proxy, endpoint, args.requests, args.concurrency)
+                    rows.append((endpoint, mode, statistics.median(samples), percentile(samples, 0.99)))
+        main.app.state.google_client, main.app.state.rag_client = pooled
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="p50/p99 latency of the proxy endpoints against a stub upstream")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--upstream-delay", type=float, default=5.0, help="Milliseconds the stub waits per call")
+    args = parser.parse_args()
+
+    stub = start_stub(args.upstream_delay / 1000)
+    base = f"http://127.0.0.1:{stub.server_address[1]}"
+
+    import main
+    main.RAG_TIMETABLE_URL = f"{base}/generate_timetable"
+    main.GOOGLE_USERINFO_URL = f"{base}/oauth2/v2/userinfo"
+
+    try:
+        rows = asyncio.run(run(main, args))
+    finally:
+        stub.shutdown()
+
+    print(f"{args.requests} requests per run, concurrency {args.concurrency}, "
+          f"stub delay {args.upstream_delay:.1f}ms")
+    print(f"{'endpoint':<22} {'clients':<12} {'p50 ms':>8} {'p99 ms':>8}")
+    for endpoint, mode, p50, p99 in rows:
+        print(f"{endpoint:<22} {mode:<12} {p50:8.2f} {p99:8.2f}")
@@ -0,0 +1,67 @@
+"""
+Throughput and memory benchmark for PDF ingestion.
+Writes a synthetic study-material PDF (--pages pages of text), ingests it with
+ingest_pdf into an in-memory ChromaDB collection and reports pages/sec, chunks/sec
+and the process's peak resident memory (ru_maxrss). Run it again with a larger
+--pages to check that peak memory stays flat while the page count grows.
+
+Usage:
+    python ingest_benchmark.py --pages 500 --batch-size 64 --backend onnx
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import chromadb
+
+# Helpers shared by the RAG services live in Rag/common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.embedder import EMBEDDING_BACKENDS, create_embedding_function
+from common.sample_pdf import write_sample_pdf
+from ingestion import DEFAULT_BATCH_SIZE, ingest_pdf
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory so far; ru_maxrss is in KiB on Linux and bytes on macOS"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest a generated PDF and report throughput and peak memory")
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="Processes used to extract page text")
+    parser.add_argument("--backend", default="sentence-transformers", choices=EMBEDDING_BACKENDS)
+    args = parser.parse_args()
+
+    collection = chromadb.Client().create_collection(
+        name="ingest_benchmark",
+        embedding_function=create_embedding_function(args.backend)
+    )
+    # Load the embedding model first so it isn't part of the measurement
+    collection.add(ids=["warm-up"], documents=["warm-up"])
+    collection.delete(ids=["warm-up"])
+    baseline = peak_rss_mb()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sample.pdf")
+        write_sample_pdf(path, args.pages)
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        started = time.perf_counter()
+        result = ingest_pdf(collection, path, "sample.pdf", "Benchmark",
+                            batch_size=args.batch_size, extract_workers=args.workers)
+        elapsed = time.perf_counter() - started
+
+    print(f"{args.pages} pages ({size_mb:.1f} MB), batch size {args.batch_size}, "
+          f"{args.workers} extract worker(s), {args.backend}")
+    print(f"chunks              {result['chunks']:8d}")
+    print(f"seconds             {elapsed:8.2f}")
+    print(f"pages/sec           {result['pages_per_second']:8.2f}")
+    print(f"chunks/sec          {result['chunks_per_second']:8.2f}")
+    print(f"peak RSS before     {baseline:8.1f} MB")
+    print(f"peak RSS after      {peak_rss_mb():8.1f} MB")
@@ -0,0 +1,132 @@
+"""
+Streaming PDF ingestion for study materials.
+Pages are extracted one at a time, cut into overlapping chunks and written to
+ChromaDB in fixed-size batches, so a large syllabus never has to be held in
+memory as one string and each `add` embeds a whole batch at once.
+Chunk ids are content hashes: chunks that are already stored are skipped with
+one bulk lookup per batch, so re-uploading an unchanged file embeds nothing.
+"""
+from datetime import datetime
+import time
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional, Union
+
+import PyPDF2
+
+from common.dedup import add_new_chunks, make_chunk_id, remove_stale_chunks
+from common.pdf_extract import iter_page_texts
+
+# Same windows as before: 1000-character chunks starting every 800 characters
+CHUNK_SIZE = 1000
+CHUNK_STEP = 800
+DEFAULT_BATCH_SIZE = 64
+
+
+def iter_pdf_pages(reader: PyPDF2.PdfReader) -> Iterator[str]:
+    """Yield the text of each PDF page as it is extracted"""
+    for page in reader.pages:
+        yield (page.extract_text() or "") + "\n"
+
+
+def iter_chunks(pages: Iterable[str], size: int = CHUNK_SIZE, step: int = CHUNK_STEP) -> Iterator[str]:
+    """Cut a stream of page texts into overlapping windows, keeping at most one window buffered"""
+    buffer = ""
+    for text in pages:
+        buffer += text
+        while len(buffer) >= size:
+            yield buffer[:size]
+            buffer = buffer[step:]
+    while buffer:
+        yield buffer[:size]
+        buffer = buffer[step:]
+
+
+def ingest_pdf(
+    collection,
+    source: Union[str, BinaryIO],
+    filename: str,
+    subject: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    progress: Optional[Callable[[int, int, int], None]] = None,
+    extract_workers: int = 1,
+    replace: bool = False,
+    keyword_index=None,
+) -> dict:
+    """
+    Extract, chunk and store a PDF (path or file object) in `collection`, one `add` per batch.
+    Blocking - run it off the event loop. `progress(pages_processed, total_pages, chunks_stored)`
+    is called after every page and every batch, and may raise to abort the ingest.
+    When `source` is a path, large files are extracted by `extract_workers` processes.
+    With `replace`, chunks from earlier uploads of `filename` that are no longer in the
+    file are deleted (unless another file still contains them), so re-ingesting an edited
+    file only embeds the changed chunks.
+    A `keyword_index` kept alongside the collection is updated with the same chunks.
+    Returns page and chunk counts, elapsed seconds and throughput.
+    """
+    started = time.perf_counter()
+    upload_date = datetime.now().isoformat()
+    reader = PyPDF2.PdfReader(source)
+    total_pages = len(reader.pages)
+
+    documents, metadatas, ids = [], [], []
+    seen_ids = set()
+    stored = 0
+    embedded = 0
+    pages_processed = 0
+
+    def report():
+        if progress:
+            progress(pages_processed, total_pages, stored)
+
+    if isinstance(source, str):
+        page_texts = iter_page_texts(source, total_pages, workers=extract_workers)
+    else:
+        page_texts = iter_pdf_pages(reader)
+
+    def counted_pages():
+        nonlocal pages_processed
+        for text in page_texts:
+            pages_processed += 1
+            report()
+            yield text
+
+    def flush():
+        nonlocal stored, embedded
+        if not documents:
+            return
+        embedded += add_new_chunks(collection, documents, metadatas, ids, key="filename")
+        if keyword_index is not None:
+            keyword_index.add(ids, documents)
+        seen_ids.update(ids)
+        stored += len(documents)
+        documents.clear()
+        metadatas.clear()
+        ids.clear()
+        report()
+
+    for i, chunk in enumerate(iter_chunks(counted_pages())):
+        documents.append(chunk)
+        metadatas.append({
+            "type": "study_material",
+            "subject": subject,
+            "filename": filename,
+            "chunk": i,
+            "upload_date": upload_date
+        })
+        ids.append(make_chunk_id(chunk, prefix="material"))
+        if len(documents) >= batch_size:
+            flush()
+    flush()
+
+    removed = remove_stale_chunks(collection, filename, seen_ids, keyword_index, key="filename") if replace else 0
+
+    elapsed = time.perf_counter() - started
+    return {
+        "pages": total_pages,
+        "chunks": stored,
+        "embedded": embedded,
+        "skipped_existing": stored - embedded,
+        "removed_stale": removed,
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(total_pages / elapsed, 2) if elapsed else 0.0,
+        "chunks_per_second": round(stored / elapsed, 2) if elapsed else 0.0,
+    }
@@ -1,5 +1,6 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
 from typing import List, Optional
 import google.generativeai as genai
 import os
@@ -8,13 +9,88 @@ import chromadb
 from chromadb.utils import embedding_functions
 import json
 from datetime import datetime
-import PyPDF2
-import io
+import asyncio
+import functools
+import hashlib
+import shutil
+import sys
+import time
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# Helpers shared with the other RAG service live in Rag/common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.metrics import metrics
+from common.embedder import EMBEDDING_BACKENDS, MODEL_NAME, EmbeddingCache, LazyEmbeddingFunction, create_embedding_function
+from common.semantic_cache import SemanticCache
+from ingestion import ingest_pdf
+from common.jobs import Job, JobQueue, QueueFull
+from retention import DEFAULT_POLICY, directory_size, sweep_collection
+from rerank import rerank
+from common.prompt_budget import ContextBudget, count_tokens
+from common.keyword_index import KeywordIndex, hybrid_query
+from preferences import PreferenceStore, format_preferences
+from scheduler import config_from_preferences, render_markdown, schedule_tasks
+from schemas import FrogAnalysis, Plan, Task, Timetable, json_output
+from common.singleflight import SingleFlight, normalize_text, request_key
 
 # Load API key
 load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
+# Gemini model shared by all endpoints
+GEMINI_MODEL = "gemini-2.5-flash"
+gemini_model = genai.GenerativeModel(GEMINI_MODEL)
+
+# Concurrency limits for blocking work so one slow request can't stall the event loop
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+CHROMA_WORKERS = int(os.getenv("CHROMA_WORKERS", "4"))
+llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+chroma_executor = ThreadPoolExecutor(max_workers=CHROMA_WORKERS, thread_name_prefix="chromadb")
+
+# Number of chunks embedded and inserted per ChromaDB `add` during uploads
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+# Processes used to extract text from large PDFs (1 = always serial)
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+# Token budget for retrieved context in each endpoint's prompt
+PROMPT_CONTEXT_TOKENS = {
+    "identify_frogs": int(os.getenv("IDENTIFY_FROGS_CONTEXT_TOKENS", "600")),
+    "generate_timetable": int(os.getenv("TIMETABLE_CONTEXT_TOKENS", "1200")),
+    "etf_recommendations": int(os.getenv("RECOMMENDATIONS_CONTEXT_TOKENS", "1000")),
+}
+
+
+async def generate_content(prompt: str, **kwargs):
+    """Call Gemini through the async API, capped at LLM_CONCURRENCY in-flight requests"""
+    async with llm_semaphore:
+        return await gemini_model.generate_content_async(prompt, **kwargs)
+
+
+async def stream_content(prompt: str, **kwargs):
+    """Yield Gemini output text chunks as they arrive"""
+    async with llm_semaphore:
+        response = await gemini_model.generate_content_async(prompt, stream=True, **kwargs)
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+
+async def run_chroma(func, *args, **kwargs):
+    """Run a synchronous ChromaDB call on the bounded worker pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(chroma_executor, functools.partial(func, *args, **kwargs))
+
+
+def record_prompt(endpoint: str, prompt: str, budget: ContextBudget) -> str:
+    """Report the size of an assembled prompt and what its context budget dropped"""
+    metrics.observe(f"prompt_tokens_{endpoint}", count_tokens(prompt))
+    metrics.incr("prompt_context_duplicates_dropped", budget.dropped_duplicates)
+    metrics.incr("prompt_context_truncated", budget.truncated)
+    return prompt
+
 # Initialize ChromaDB for RAG - Timetable Memory System
 # Store database persistently in the time_manager folder
 import os
@@ -23,63 +99,344 @@ CHROMA_DB_PATH = os.path.join(os.path.dirname(__file__), "chromadb_storage")
 # Create persistent ChromaDB client
 chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
 
+# When the embedding model is loaded: "background" (warm up after startup; /ready reports 503
+# until done), "eager" (warm up before serving) or "lazy" (on the first request that needs it)
+EMBEDDING_LOAD = os.getenv("EMBEDDING_LOAD", "background")
+# How all-MiniLM-L6-v2 is run: "sentence-transformers" (PyTorch), "onnx" or "onnx-int8" (ONNX Runtime).
+# Vectors are compatible across backends, so it can be switched without re-embedding collections.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence-transformers")
+if EMBEDDING_BACKEND not in EMBEDDING_BACKENDS:
+    raise ValueError(f"EMBEDDING_BACKEND must be one of {', '.join(EMBEDDING_BACKENDS)}")
+
+
+def load_embedding_function():
+    try:
+        return create_embedding_function(EMBEDDING_BACKEND)
+    except Exception as e:
+        # Fallback to default embedding if sentence-transformers fails
+        print(f"Warning: Using default embeddings due to: {e}")
+        return embedding_functions.DefaultEmbeddingFunction()
+
+
+# One embedder shared by every collection and the response cache, loaded outside of import.
+# Its cache means text that was embedded recently (repeated queries, fixed strings) isn't embedded again.
+embedding_function = LazyEmbeddingFunction(
+    load_embedding_function,
+    model_id=f"{MODEL_NAME}/{EMBEDDING_BACKEND}",
+    cache=EmbeddingCache(
+        max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+        path=os.getenv("EMBEDDING_CACHE_PATH") or None
+    )
+)
+
 # Collection for storing successful timetables and user patterns
-try:
-    timetable_memory = chroma_client.get_or_create_collection(
-        name="timetable_memory",
-        embedding_function=embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
-        )
+timetable_memory = chroma_client.get_or_create_collection(
+    name="timetable_memory",
+    embedding_function=embedding_function
+)
+
+# Collection for study materials (optional)
+study_materials = chroma_client.get_or_create_collection(
+    name="study_materials",
+    embedding_function=embedding_function
+)
+# BM25 keyword index over study_materials, fused with vector search for exact terms like course codes
+keyword_index = KeywordIndex(os.path.join(os.path.dirname(__file__), "study_materials_keywords.sqlite3"))
+# Candidates taken from each retriever before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+print(f"✅ ChromaDB initialized successfully at: {CHROMA_DB_PATH}")
+
+# Per-user timetable memory
+def user_collection_name(user_id: str) -> str:
+    """ChromaDB-safe collection name for a user's timetable memory"""
+    return f"timetable_memory_{hashlib.sha256(user_id.encode('utf-8')).hexdigest()[:24]}"
+
+
+@functools.lru_cache(maxsize=1024)
+def get_user_memory(user_id: Optional[str]):
+    """
+    Timetable memory partitioned per user: each user gets their own collection, so
+    retrieval cost depends on one user's history and results never cross users.
+    Requests without a user_id use the shared `timetable_memory` collection.
+    """
+    if not user_id:
+        return timetable_memory
+    return chroma_client.get_or_create_collection(
+        name=user_collection_name(user_id),
+        embedding_function=embedding_function,
+        metadata={"user_id": user_id}
     )
-    
-    # Collection for study materials (optional)
-    study_materials = chroma_client.get_or_create_collection(
-        name="study_materials",
-        embedding_function=embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
-        )
+
+# Latest preference of each type per user, read directly when building prompts
+preference_store = PreferenceStore(
+    os.path.join(os.path.dirname(__file__), "preferences.sqlite3"),
+    cache_size=int(os.getenv("PREFERENCE_CACHE_SIZE", "1024"))
+)
+
+# Cache of generated timetables for repeated or near-duplicate queries
+response_cache = SemanticCache(
+    embed=embedding_function,
+    max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "256")),
+    ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL", "3600")),
+    similarity_threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+)
+
+# Identical timetable requests that arrive while one is being generated share its result
+inflight = SingleFlight()
+
+# Fixed Eat That Frog retrieval queries used when building prompts. Their results only
+# change when study_materials does, so they are memoized instead of re-queried per request.
+ETF_QUERIES = {
+    "frog_analysis": "ABCDE method priority eat that frog Brian Tracy",
+    "timetable": "eat that frog first thing morning productivity",
+    "recommendations": "Brian Tracy productivity tips morning routine",
+}
+etf_context_cache = {}
+etf_context_version = 0
+
+
+async def get_etf_context(name: str) -> dict:
+    """Return the study_materials results for a fixed ETF query, memoized until the collection changes"""
+    results = etf_context_cache.get(name)
+    if results is not None:
+        metrics.incr("etf_context_hits")
+        return results
+
+    metrics.incr("etf_context_misses")
+    version = etf_context_version
+    results = await run_chroma(
+        study_materials.query,
+        query_texts=[ETF_QUERIES[name]],
+        n_results=3
     )
-    print(f"✅ ChromaDB initialized successfully at: {CHROMA_DB_PATH}")
-except Exception as e:
-    # Fallback to default embedding if sentence-transformers fails
-    print(f"Warning: Using default embeddings due to: {e}")
-    timetable_memory = chroma_client.get_or_create_collection(name="timetable_memory")
-    study_materials = chroma_client.get_or_create_collection(name="study_materials")
-    print(f"✅ ChromaDB initialized with default embeddings at: {CHROMA_DB_PATH}")
+    # Don't keep results that raced with an upload
+    if version == etf_context_version:
+        etf_context_cache[name] = results
+    return results
+
+
+def invalidate_study_context():
+    """Drop memoized ETF results and cached responses after study_materials has been modified"""
+    global etf_context_version
+    etf_context_version += 1
+    etf_context_cache.clear()
+    # Materials are shared, so every user's cached timetables and analyses were built from the old ones
+    response_cache.clear()
+
+# Background ingestion jobs: uploads are saved to disk and processed by a worker pool
+UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
+job_queue = JobQueue(
+    state_path=os.path.join(os.path.dirname(__file__), "ingest_jobs.json"),
+    workers=int(os.getenv("INGEST_WORKERS", "2")),
+    max_pending=int(os.getenv("INGEST_QUEUE_SIZE", "16")),
+)
+
+
+def run_study_material_job(job: Job) -> dict:
+    """Ingest an uploaded PDF into study_materials, reporting progress on the job"""
+    params = job.params
+    try:
+        stats = ingest_pdf(
+            study_materials,
+            params["path"],
+            params["filename"],
+            params["subject"],
+            batch_size=INGEST_BATCH_SIZE,
+            progress=lambda pages, total, chunks: job.report(
+                pages_processed=pages, total_pages=total, chunks_embedded=chunks
+            ),
+            extract_workers=PDF_EXTRACT_WORKERS,
+            replace=params.get("replace", False),
+            keyword_index=keyword_index
+        )
+    finally:
+        invalidate_study_context()
+    metrics.observe("ingest_chunks_per_second", stats["chunks_per_second"])
+    metrics.observe("ingest_pages_per_second", stats["pages_per_second"])
+    return stats
+
+
+def remove_uploaded_file(job: Job):
+    if os.path.exists(job.params["path"]):
+        os.remove(job.params["path"])
+
+
+job_queue.register("study_material", run_study_material_job, cleanup=remove_uploaded_file)
+
+# Retention sweep over timetable memory (expiry, compaction, per-type caps); 0 disables the schedule
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", str(6 * 3600)))
+last_retention_sweep = None
+
+
+def timetable_memory_collections() -> list:
+    """The shared timetable_memory collection plus every per-user one"""
+    # list_collections() returns names on newer ChromaDB releases and Collection objects on older ones
+    names = [getattr(c, "name", c) for c in chroma_client.list_collections()]
+    return [
+        chroma_client.get_collection(name=name, embedding_function=embedding_function)
+        for name in names if name.startswith("timetable_memory")
+    ]
+
+
+def run_retention_sweep() -> dict:
+    """Apply the retention policy to every timetable memory collection; blocking"""
+    global last_retention_sweep
+    started = time.perf_counter()
+    size_before = directory_size(CHROMA_DB_PATH)
+    totals = {"collections": 0, "removed": 0, "expired": 0, "compacted": 0, "capped": 0,
+              "summaries_written": 0, "bytes_reclaimed_estimate": 0}
+    for collection in timetable_memory_collections():
+        stats = sweep_collection(collection, DEFAULT_POLICY)
+        totals["collections"] += 1
+        for key, value in stats.items():
+            totals[key] += value
+
+    size_after = directory_size(CHROMA_DB_PATH)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    metrics.incr("retention_sweeps")
+    metrics.incr("retention_entries_removed", totals["removed"])
+    metrics.incr("retention_entries_compacted", totals["compacted"])
+    metrics.incr("retention_bytes_reclaimed_estimate", totals["bytes_reclaimed_estimate"])
+    metrics.observe("retention_sweep_ms", elapsed_ms)
+
+    last_retention_sweep = {
+        **totals,
+        # SQLite and HNSW files reuse freed space rather than shrinking, so the on-disk
+        # delta can be 0 even when entries were removed
+        "storage_bytes_before": size_before,
+        "storage_bytes_after": size_after,
+        "seconds": round(elapsed_ms / 1000, 3),
+        "finished_at": datetime.now().isoformat(),
+    }
+    return last_retention_sweep
+
+
+async def retention_loop():
+    while True:
+        await asyncio.sleep(RETENTION_INTERVAL_SECONDS)
+        try:
+            await run_chroma(run_retention_sweep)
+        except Exception as e:
+            print(f"Warning: retention sweep failed: {e}")
+
+
+PREFERENCES_MIGRATED_KEY = "migrated_from_memory"
+
+
+def migrate_preferences() -> int:
+    """
+    Move preferences stored as timetable memory documents into the preference store.
+    Runs once: the store records when it finished, and later startups skip the scan.
+    """
+    if preference_store.get_meta(PREFERENCES_MIGRATED_KEY):
+        return 0
+    moved = 0
+    for collection in timetable_memory_collections():
+        stored = collection.get(where={"type": "user_preference"}, include=["metadatas"])
+        if not stored["ids"]:
+            continue
+        user_id = (collection.metadata or {}).get("user_id")
+        # Oldest first, so the newest value of each type wins
+        for metadata in sorted(stored["metadatas"], key=lambda m: m.get("date", "")):
+            preference_store.set(
+                user_id,
+                metadata["preference_type"],
+                str(metadata.get("preference_value", "")),
+                metadata.get("description", ""),
+                updated_at=metadata.get("date")
+            )
+        collection.delete(ids=stored["ids"])
+        moved += len(stored["ids"])
+    preference_store.set_meta(PREFERENCES_MIGRATED_KEY, datetime.now().isoformat())
+    return moved
+
+
+def warm_up_embedder():
+    try:
+        embedding_function.warm_up()
+    except Exception as e:
+        print(f"Warning: embedding model warm-up failed: {e}")
+        return
+    metrics.observe("embedder_warm_up_ms", embedding_function.warm_up_seconds * 1000)
+    print(f"Embedding model ready in {embedding_function.warm_up_seconds:.1f}s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if EMBEDDING_LOAD == "eager":
+        await run_chroma(warm_up_embedder)
+    elif EMBEDDING_LOAD == "background":
+        asyncio.get_running_loop().run_in_executor(None, warm_up_embedder)
+    reindexed = await run_chroma(keyword_index.sync, study_materials)
+    if reindexed:
+        print(f"Rebuilt the keyword index over {reindexed} study material chunks")
+    migrated = await run_chroma(migrate_preferences)
+    if migrated:
+        print(f"Moved {migrated} user preferences out of timetable memory")
+    backfilled = await run_chroma(backfill_completion_days)
+    if backfilled:
+        print(f"Indexed {backfilled} existing frog completions by day")
+    await job_queue.start()
+    retention_task = asyncio.create_task(retention_loop()) if RETENTION_INTERVAL_SECONDS > 0 else None
+    try:
+        yield
+    finally:
+        if retention_task:
+            retention_task.cancel()
+        await job_queue.stop()
 
 # FastAPI app
-app = FastAPI(title="Smart Time Management Assistant with RAG")
+app = FastAPI(title="Smart Time Management Assistant with RAG", lifespan=lifespan)
 
 # Pydantic models for input
 class TaskInput(BaseModel):
     query: str  # Natural language input like "tomorrow maths exam, day after tomorrow project submission"
+    user_id: Optional[str] = None  # Scopes memory and cached responses to one user
+    bypass_cache: bool = False  # Force a fresh Gemini call even if a similar query was answered recently
+    structured: bool = False  # Return validated JSON (FrogAnalysis / Timetable) instead of only text
+
+class TimetableBatchInput(BaseModel):
+    requests: List[TaskInput]  # e.g. one entry per student in a class
 
-class Task(BaseModel):
-    name: str
-    deadline: str
-    priority: str  # A, B, C, D, E (Eat That Frog ABCDE method)
-    difficulty: int  # 1-10 scale
-    importance: int  # 1-10 scale
-    estimated_hours: int
-    description: Optional[str] = ""
+class ScheduleInput(BaseModel):
+    query: str = ""  # Natural language tasks, parsed by Gemini when `tasks` isn't given
+    tasks: Optional[List[Task]] = None  # Already-structured tasks; no LLM call is made
+    start_date: Optional[str] = None  # YYYY-MM-DD, defaults to today
+    user_id: Optional[str] = None
+
+def parse_model_output(schema, text: str):
+    """Validate a JSON reply against `schema`; a malformed reply is the model's fault, hence 502"""
+    try:
+        return schema.model_validate_json(text)
+    except ValidationError as e:
+        metrics.incr("structured_output_invalid")
+        raise HTTPException(status_code=502, detail=f"Model returned invalid {schema.__name__} JSON: {e}")
+
+
+def analysis_cache_scope(user_id: Optional[str]) -> str:
+    """Response cache scope of structured frog analyses, shared by /identify_frogs/ and /plan/"""
+    return (user_id or "") + "\x00analysis"
 
-class FrogAnalysis(BaseModel):
-    tasks: List[Task]
-    apply_eat_that_frog: bool = True
 
 @app.post("/identify_frogs/")
 async def identify_frogs(task_input: TaskInput):
     """Identify the 'frogs' (most important/difficult tasks) using Eat That Frog principles"""
     try:
+        embedding = None
+        if task_input.structured and not task_input.bypass_cache:
+            cached, embedding = await run_chroma(
+                response_cache.get, task_input.query, analysis_cache_scope(task_input.user_id)
+            )
+            if cached is not None:
+                return {"frog_analysis": cached, "methodology": "Eat That Frog ABCDE Method", "cached": True}
+
         # Get Eat That Frog knowledge from RAG
-        etf_context = study_materials.query(
-            query_texts=["ABCDE method priority eat that frog Brian Tracy"],
-            n_results=3
-        )
+        etf_context = await get_etf_context("frog_analysis")
         
+        budget = ContextBudget(PROMPT_CONTEXT_TOKENS["identify_frogs"])
         etf_knowledge = ""
         if etf_context['documents'] and etf_context['documents'][0]:
-            etf_knowledge = "Based on Eat That Frog principles:\n" + "\n".join(etf_context['documents'][0][:2])
+            etf_knowledge = "Based on Eat That Frog principles:\n" + "\n".join(budget.take(etf_context['documents'][0][:2]))
         
         prompt = f"""
         You are an expert in Brian Tracy's "Eat That Frog!" methodology. Analyze these tasks and identify the "frogs":
@@ -104,157 +461,664 @@ async def identify_frogs(task_input: TaskInput):
         
         Return a JSON structure identifying each task with its frog analysis.
         """
+        record_prompt("identify_frogs", prompt, budget)
         
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        response = model.generate_content(prompt)
+        if task_input.structured:
+            response = await generate_content(prompt, generation_config=json_output(FrogAnalysis))
+            analysis = parse_model_output(FrogAnalysis, response.text).model_dump()
+            await run_chroma(
+                response_cache.put, task_input.query, analysis, analysis_cache_scope(task_input.user_id), embedding
+            )
+            return {"frog_analysis": analysis, "methodology": "Eat That Frog ABCDE Method", "cached": False}
+
+        response = await generate_content(prompt)
         
         return {"frog_analysis": response.text, "methodology": "Eat That Frog ABCDE Method"}
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Past memory entries fetched per timetable request, and how many of them survive re-ranking
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "3"))
+RERANK_HALF_LIFE_DAYS = float(os.getenv("RERANK_HALF_LIFE_DAYS", "60"))
+# Only past timetables and their monthly summaries are re-ranked: feedback entries carry
+# the same rating as the timetable they rate and would otherwise crowd it out
+RERANK_WHERE = {"type": {"$in": ["generated_timetable", "timetable_summary"]}}
+
+
+# Output instructions that end the timetable prompt
+MARKDOWN_TIMETABLE_FORMAT = """
+    **IMPORTANT: Return the timetable in TABLE FORMAT using markdown tables.**
+    
+    Format each day like this:
+    
+    ## Monday, October 7, 2025
+    | Time | Activity | Task/Subject | Priority | Notes |
+    |------|----------|--------------|----------|-------|
+    | 7:00 AM - 8:00 AM | Morning Routine | - | - | Breakfast, get ready, review day |
+    | 8:00 AM - 10:00 AM | 🐸 FROG SESSION | Maths Exam Prep | A | Most important task first! |
+    | 10:00 AM - 10:15 AM | Break | - | - | Short energy break |
+    | 10:15 AM - 12:00 PM | 🐸 FROG SESSION | Project Work | A | Second most important |
+    
+    Continue this table format for each day until all deadlines are met.
+    Include realistic time for meals, breaks, and sleep.
+    Make it actionable and specific with clear time slots.
+"""
+STRUCTURED_TIMETABLE_FORMAT = """
+    **Return the timetable as JSON**: one entry per day until all deadlines are met, each with
+    its date (YYYY-MM-DD), weekday name and time blocks in order. Every block has start and end
+    times like "8:00 AM", the activity ("🐸 FROG SESSION", "Break", "Lunch", ...), the task or
+    subject and its ABCDE priority (both null for breaks, meals and routines), whether it is a
+    frog, and short notes.
+    Include realistic time for meals, breaks, and sleep.
+"""
+# /plan/ asks for the task analysis and the timetable in the same reply
+PLAN_FORMAT = """
+    **Return JSON with two parts.** `analysis`: every task with its ABCDE priority, deadline
+    (YYYY-MM-DD), difficulty (1-10), importance (1-10) and estimated hours. `timetable`: built
+    from exactly that analysis - one entry per day until all deadlines are met, each with its
+    date (YYYY-MM-DD), weekday name and time blocks in order. Every block has start and end
+    times like "8:00 AM", the activity ("🐸 FROG SESSION", "Break", "Lunch", ...), the task or
+    subject and its ABCDE priority (both null for breaks, meals and routines), whether it is a
+    frog, and short notes.
+    Include realistic time for meals, breaks, and sleep.
+"""
+
+
+def format_analysis(analysis: dict) -> str:
+    """Prompt section with a frog analysis that was already done for this query"""
+    lines = ["Task analysis already done for this input (schedule exactly these tasks and priorities):"]
+    for task in analysis["tasks"]:
+        lines.append(f"- {task['name']}: priority {task['priority']}, deadline {task['deadline']}, "
+                     f"difficulty {task['difficulty']}/10, importance {task['importance']}/10, "
+                     f"about {task['estimated_hours']}h")
+    return "\n".join(lines) + "\n"
+
+
+async def build_timetable_prompt(query: str, memory, preferences: dict, candidates: Optional[dict] = None,
+                                 output_format: str = MARKDOWN_TIMETABLE_FORMAT,
+                                 analysis: Optional[dict] = None) -> str:
+    """
+    Retrieve past timetables and Eat That Frog context and assemble the timetable prompt.
+    `preferences` comes from the preference store; `candidates` is a single-query memory
+    result that was already retrieved (batch, /plan/); `analysis` is a FrogAnalysis to build on.
+    """
+    # Over-fetch past timetables, then keep the best by similarity × rating × recency
+    if candidates is None:
+        candidates = await run_chroma(
+            memory.query,
+            query_texts=[query],
+            n_results=RERANK_CANDIDATES,
+            where=RERANK_WHERE,
+            include=["documents", "metadatas", "distances"]
+        )
+    retrieved = rerank(candidates, RERANK_TOP_K, half_life_days=RERANK_HALF_LIFE_DAYS)
+    metrics.observe("timetable_context_docs", len(retrieved))
+    
+    # Get Eat That Frog principles from study materials
+    etf_context = await get_etf_context("timetable")
+    
+    # Prepare context from retrieved documents, within the prompt's token budget
+    budget = ContextBudget(PROMPT_CONTEXT_TOKENS["generate_timetable"])
+    past_docs = budget.take([hit['document'] for hit in retrieved])
+    context_info = ""
+    if past_docs:
+        context_info = "Here are similar past timetables and patterns that worked well for you:\n\n"
+        for doc in past_docs:
+            context_info += f"- {doc}\n"
+        context_info += "\nUse these insights to create a better personalized schedule.\n"
+    
+    # Add Eat That Frog context
+    etf_info = ""
+    if etf_context['documents'] and etf_context['documents'][0]:
+        etf_info = "\nEat That Frog! Principles to apply:\n"
+        for doc in budget.take(etf_context['documents'][0], max_tokens=300, max_doc_tokens=100):
+            etf_info += f"- {doc}\n"
+    
+    prompt = f"""
+    You are a smart AI time management assistant trained in Brian Tracy's "Eat That Frog!" methodology. Today is October 7, 2025.
+    
+    The user has given you this natural language input: "{query}"
+    
+    {format_preferences(preferences)}
+    {format_analysis(analysis) if analysis else ""}
+    {context_info}
+    {etf_info}
+    
+    **EAT THAT FROG! METHODOLOGY - APPLY THESE PRINCIPLES:**
+    
+    1. **Identify the Frog**: Find the most important, difficult task (A priority)
+    2. **ABCDE Method**: Categorize all tasks:
+       - A: Must do (serious consequences if not done)
+       - B: Should do (mild consequences)
+       - C: Nice to do (no consequences)
+       - D: Delegate
+       - E: Eliminate
+    3. **Eat the Ugliest Frog First**: Schedule A-priority tasks in the morning when energy is highest
+    4. **Apply 80/20 Rule**: Focus on the 20% of tasks that give 80% of results
+    5. **Single Handling**: Complete one task before moving to the next
+    6. **Prepare Thoroughly**: Plan the night before
+    
+    Your task:
+    1. Parse the input to identify tasks and their relative dates (tomorrow, day after tomorrow, next week, etc.)
+    2. Convert relative dates to actual dates starting from today (October 7, 2025)
+    3. **PRIORITIZE using ABCDE method** - identify which tasks are frogs (A priorities)
+    4. **Schedule frogs FIRST** - put most important tasks in morning slots (8-11 AM)
+    5. Create a detailed hour-by-hour timetable with "frog sessions" clearly marked
+    6. Include preparation time, breaks, meals, and realistic allocations
+    7. Apply the 80/20 rule to focus on high-impact activities
+    8. Mark which tasks are "FROGS 🐸" in the timetable
+    
+    {output_format}
+    """
+    return record_prompt("generate_timetable", prompt, budget)
+
+
+async def remember_timetable(query: str, timetable: str, memory) -> str:
+    """Store a generated timetable for future learning and reference"""
+    timetable_id = f"timetable_{datetime.now().timestamp()}"
+    await run_chroma(
+        memory.add,
+        documents=[f"Query: {query}\nGenerated Timetable: {timetable[:500]}..."],
+        metadatas=[{
+            "type": "generated_timetable", 
+            "query": query,
+            "date": datetime.now().isoformat(),
+            "rating": 0  # Will be updated when user provides feedback
+        }],
+        ids=[timetable_id]
+    )
+    return timetable_id
+
+
+def day_number(moment: datetime) -> int:
+    """Calendar day as an int (YYYYMMDD) so ChromaDB can range-filter on it"""
+    return int(moment.strftime("%Y%m%d"))
+
+
+def parse_report_date(value: str) -> datetime:
+    if value == "today":
+        return datetime.now()
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def backfill_completion_days():
+    """Add the numeric `day` field to frog completions stored before it existed"""
+    completions = timetable_memory.get(where={"type": "frog_completion"}, include=["metadatas"])
+    ids, metadatas = [], []
+    for completion_id, metadata in zip(completions["ids"], completions["metadatas"]):
+        if "day" in metadata or "date" not in metadata:
+            continue
+        moment = datetime.fromisoformat(metadata["date"])
+        ids.append(completion_id)
+        metadatas.append({**metadata, "day": day_number(moment), "day_of_week": moment.strftime("%A")})
+    if ids:
+        timetable_memory.update(ids=ids, metadatas=metadatas)
+    return len(ids)
+
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Format one Server-Sent Events message"""
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+def response_cache_scope(user_id: Optional[str], structured: bool = False) -> str:
+    """Cached responses are per user, and structured ones are kept apart from text-only ones"""
+    return (user_id or "") + ("\x00structured" if structured else "")
+
+
+def timetable_format(task_input: TaskInput) -> str:
+    return STRUCTURED_TIMETABLE_FORMAT if task_input.structured else MARKDOWN_TIMETABLE_FORMAT
+
+
+async def complete_timetable(prompt: str, structured: bool) -> dict:
+    """Generate a timetable; structured replies are validated and also rendered as markdown tables"""
+    if not structured:
+        response = await generate_content(prompt)
+        return {"timetable": response.text}
+    response = await generate_content(prompt, generation_config=json_output(Timetable))
+    schedule = parse_model_output(Timetable, response.text).model_dump()
+    return {"timetable": render_markdown(schedule), "schedule": schedule}
+
+
 @app.post("/generate_timetable/")
 async def generate_timetable(task_input: TaskInput):
     try:
-        # Retrieve relevant timetable patterns and past successful schedules
-        retrieved_context = timetable_memory.query(
-            query_texts=[task_input.query],
-            n_results=5
+        cache_scope = response_cache_scope(task_input.user_id, task_input.structured)
+        embedding = None
+        if not task_input.bypass_cache:
+            cached, embedding = await run_chroma(response_cache.get, task_input.query, cache_scope)
+            if cached is not None:
+                return {**cached, "cached": True}
+
+        async def generate():
+            memory = await run_chroma(get_user_memory, task_input.user_id)
+            preferences = await run_chroma(preference_store.get_all, task_input.user_id)
+            prompt = await build_timetable_prompt(
+                task_input.query, memory, preferences, output_format=timetable_format(task_input)
+            )
+
+            started = time.perf_counter()
+            completion = await complete_timetable(prompt, task_input.structured)
+            metrics.observe("timetable_generation_ms", (time.perf_counter() - started) * 1000)
+            
+            timetable_id = await remember_timetable(task_input.query, completion["timetable"], memory)
+            result = {**completion, "timetable_id": timetable_id}
+            await run_chroma(response_cache.put, task_input.query, result, cache_scope, embedding)
+            return result
+
+        # Requests for the same query while it is being generated wait for that generation
+        key = request_key(
+            "generate_timetable", task_input.user_id, normalize_text(task_input.query), task_input.structured
         )
-        
-        # Get Eat That Frog principles from study materials
-        etf_context = study_materials.query(
-            query_texts=["eat that frog first thing morning productivity"],
-            n_results=3
+        result, coalesced = await inflight.do(key, generate)
+        if coalesced:
+            metrics.incr("timetable_requests_coalesced")
+
+        return {**result, "cached": False, "coalesced": coalesced}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/generate_timetable/stream")
+async def generate_timetable_stream(task_input: TaskInput):
+    """Stream the timetable as Server-Sent Events while Gemini generates it (markdown only; `structured` is ignored)"""
+    try:
+        cache_scope = task_input.user_id or ""
+        cached, embedding = None, None
+        if not task_input.bypass_cache:
+            cached, embedding = await run_chroma(response_cache.get, task_input.query, cache_scope)
+        memory = await run_chroma(get_user_memory, task_input.user_id)
+        prompt = None
+        if cached is None:
+            preferences = await run_chroma(preference_store.get_all, task_input.user_id)
+            prompt = await build_timetable_prompt(task_input.query, memory, preferences)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def event_stream():
+        started = time.perf_counter()
+        parts = []
+        try:
+            if cached is not None:
+                yield sse_event({"text": cached["timetable"]})
+                yield sse_event({"timetable_id": cached["timetable_id"], "cached": True}, event="done")
+                return
+
+            async for text in stream_content(prompt):
+                if not parts:
+                    metrics.observe("timetable_stream_ttfb_ms", (time.perf_counter() - started) * 1000)
+                parts.append(text)
+                yield sse_event({"text": text})
+
+            metrics.observe("timetable_generation_ms", (time.perf_counter() - started) * 1000)
+
+            # Memory is written once, after the whole timetable has been received
+            timetable = "".join(parts)
+            timetable_id = await remember_timetable(task_input.query, timetable, memory)
+            await run_chroma(
+                response_cache.put,
+                task_input.query,
+                {"timetable": timetable, "timetable_id": timetable_id},
+                cache_scope,
+                embedding
+            )
+            yield sse_event({"timetable_id": timetable_id, "cached": False}, event="done")
+        except Exception as e:
+            metrics.incr("timetable_stream_errors")
+            yield sse_event({"detail": str(e)}, event="error")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Batch timetable generation
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "100"))
+# Gemini calls in flight per batch, so one large batch can't take every LLM_CONCURRENCY slot
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+
+
+def lookup_batch_cache(inputs: List[TaskInput], embeddings: list) -> list:
+    """Cached timetable (or None) for every input, using pre-computed query embeddings"""
+    return [
+        None if task_input.bypass_cache
+        else response_cache.get(task_input.query, response_cache_scope(task_input.user_id, task_input.structured), embedding)[0]
+        for task_input, embedding in zip(inputs, embeddings)
+    ]
+
+
+def retrieve_batch_candidates(inputs: List[TaskInput], embeddings: list) -> list:
+    """
+    Re-ranking candidates for every input, with one multi-query ChromaDB call per user's memory.
+    `embeddings` are of the queries as written, like the stored documents they are compared with.
+    """
+    by_user = defaultdict(list)
+    for position, task_input in enumerate(inputs):
+        by_user[task_input.user_id or ""].append(position)
+
+    candidates = [None] * len(inputs)
+    for user_id, positions in by_user.items():
+        results = get_user_memory(user_id or None).query(
+            query_embeddings=[embeddings[position] for position in positions],
+            n_results=RERANK_CANDIDATES,
+            where=RERANK_WHERE,
+            include=["documents", "metadatas", "distances"]
         )
-        
-        # Prepare context from retrieved documents
-        context_info = ""
-        if retrieved_context['documents'] and retrieved_context['documents'][0]:
-            context_info = "Here are similar past timetables and patterns that worked well for you:\n\n"
-            for doc in retrieved_context['documents'][0]:
-                context_info += f"- {doc}\n"
-            context_info += "\nUse these insights to create a better personalized schedule.\n"
-        
-        # Add Eat That Frog context
-        etf_info = ""
-        if etf_context['documents'] and etf_context['documents'][0]:
-            etf_info = "\nEat That Frog! Principles to apply:\n"
-            for doc in etf_context['documents'][0]:
-                etf_info += f"- {doc[:200]}...\n"
-        
-        prompt = f"""
-        You are a smart AI time management assistant trained in Brian Tracy's "Eat That Frog!" methodology. Today is October 7, 2025.
-        
-        The user has given you this natural language input: "{task_input.query}"
-        
-        {context_info}
-        {etf_info}
-        
-        **EAT THAT FROG! METHODOLOGY - APPLY THESE PRINCIPLES:**
-        
-        1. **Identify the Frog**: Find the most important, difficult task (A priority)
-        2. **ABCDE Method**: Categorize all tasks:
-           - A: Must do (serious consequences if not done)
-           - B: Should do (mild consequences)
-           - C: Nice to do (no consequences)
-           - D: Delegate
-           - E: Eliminate
-        3. **Eat the Ugliest Frog First**: Schedule A-priority tasks in the morning when energy is highest
-        4. **Apply 80/20 Rule**: Focus on the 20% of tasks that give 80% of results
-        5. **Single Handling**: Complete one task before moving to the next
-        6. **Prepare Thoroughly**: Plan the night before
-        
-        Your task:
-        1. Parse the input to identify tasks and their relative dates (tomorrow, day after tomorrow, next week, etc.)
-        2. Convert relative dates to actual dates starting from today (October 7, 2025)
-        3. **PRIORITIZE using ABCDE method** - identify which tasks are frogs (A priorities)
-        4. **Schedule frogs FIRST** - put most important tasks in morning slots (8-11 AM)
-        5. Create a detailed hour-by-hour timetable with "frog sessions" clearly marked
-        6. Include preparation time, breaks, meals, and realistic allocations
-        7. Apply the 80/20 rule to focus on high-impact activities
-        8. Mark which tasks are "FROGS 🐸" in the timetable
-        
-        **IMPORTANT: Return the timetable in TABLE FORMAT using markdown tables.**
-        
-        Format each day like this:
-        
-        ## Monday, October 7, 2025
-        | Time | Activity | Task/Subject | Priority | Notes |
-        |------|----------|--------------|----------|-------|
-        | 7:00 AM - 8:00 AM | Morning Routine | - | - | Breakfast, get ready, review day |
-        | 8:00 AM - 10:00 AM | 🐸 FROG SESSION | Maths Exam Prep | A | Most important task first! |
-        | 10:00 AM - 10:15 AM | Break | - | - | Short energy break |
-        | 10:15 AM - 12:00 PM | 🐸 FROG SESSION | Project Work | A | Second most important |
-        
-        Continue this table format for each day until all deadlines are met.
-        Include realistic time for meals, breaks, and sleep.
-        Make it actionable and specific with clear time slots.
-        """
+        for row, position in enumerate(positions):
+            candidates[position] = {key: [results[key][row]] for key in ("documents", "metadatas", "distances")}
+    return candidates
 
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        response = model.generate_content(prompt)
-        
-        # Store this timetable for future learning and reference
-        timetable_memory.add(
-            documents=[f"Query: {task_input.query}\nGenerated Timetable: {response.text[:500]}..."],
-            metadatas=[{
-                "type": "generated_timetable", 
-                "query": task_input.query,
-                "date": datetime.now().isoformat(),
-                "rating": 0  # Will be updated when user provides feedback
-            }],
-            ids=[f"timetable_{datetime.now().timestamp()}"]
+
+@app.post("/generate_timetable/batch")
+async def generate_timetable_batch(batch: TimetableBatchInput):
+    """
+    Generate timetables for many inputs at once (e.g. a whole class), streamed back as
+    Server-Sent Events in completion order: a `result` or `error` event per input (with its
+    `index` in the request), then a `done` event with throughput in timetables/minute.
+    """
+    inputs = batch.requests
+    if not inputs or len(inputs) > BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"A batch must contain 1-{BATCH_MAX_SIZE} requests")
+
+    started = time.perf_counter()
+    try:
+        # All queries are embedded in one call per purpose: the cache compares normalized text,
+        # retrieval the raw queries (only of cache misses) against the documents in memory
+        embeddings = await run_chroma(response_cache.embed_many, [task_input.query for task_input in inputs])
+        cached = await run_chroma(lookup_batch_cache, inputs, embeddings)
+        pending = [i for i, value in enumerate(cached) if value is None]
+        query_embeddings = await run_chroma(embedding_function, [inputs[i].query for i in pending]) if pending else []
+        candidates = await run_chroma(
+            retrieve_batch_candidates,
+            [inputs[i] for i in pending],
+            query_embeddings
         )
+        preferences = await run_chroma(preference_store.get_many, [inputs[i].user_id for i in pending])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        return {"timetable": response.text}
+    semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def generate_one(index: int, candidate: dict):
+        task_input = inputs[index]
+        try:
+            async with semaphore:
+                memory = await run_chroma(get_user_memory, task_input.user_id)
+                prompt = await build_timetable_prompt(
+                    task_input.query, memory, preferences[task_input.user_id or ""], candidates=candidate,
+                    output_format=timetable_format(task_input)
+                )
+                completion = await complete_timetable(prompt, task_input.structured)
+            timetable_id = await remember_timetable(task_input.query, completion["timetable"], memory)
+            result = {**completion, "timetable_id": timetable_id}
+            await run_chroma(
+                response_cache.put, task_input.query, result,
+                response_cache_scope(task_input.user_id, task_input.structured), embeddings[index]
+            )
+            return index, result, None
+        except Exception as e:
+            return index, None, e
+
+    async def event_stream():
+        succeeded, failed = 0, 0
+        tasks = [asyncio.create_task(generate_one(i, candidate)) for i, candidate in zip(pending, candidates)]
+        try:
+            for index, value in enumerate(cached):
+                if value is not None:
+                    succeeded += 1
+                    yield sse_event({"index": index, **value, "cached": True}, event="result")
+
+            for next_done in asyncio.as_completed(tasks):
+                index, result, error = await next_done
+                if error is not None:
+                    failed += 1
+                    metrics.incr("batch_timetable_errors")
+                    yield sse_event({"index": index, "detail": str(error)}, event="error")
+                else:
+                    succeeded += 1
+                    yield sse_event({"index": index, **result, "cached": False}, event="result")
+
+            elapsed = time.perf_counter() - started
+            per_minute = succeeded / elapsed * 60 if elapsed else 0.0
+            metrics.observe("batch_timetables_per_minute", per_minute)
+            yield sse_event({
+                "requested": len(inputs),
+                "succeeded": succeeded,
+                "failed": failed,
+                "cached": len(inputs) - len(pending),
+                "seconds": round(elapsed, 3),
+                "timetables_per_minute": round(per_minute, 2)
+            }, event="done")
+        finally:
+            # Stop outstanding generations if the client went away
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def extract_tasks(query: str, today) -> List[Task]:
+    """Have Gemini turn a natural-language query into Task objects (the only LLM step of /schedule_timetable/)"""
+    prompt = f"""
+    Today is {today.strftime("%A, %B %d, %Y")}. Extract every task from this input: "{query}"
+    
+    Give each task's deadline as YYYY-MM-DD, difficulty and importance on a 1-10 scale and the hours it needs.
+    Convert relative dates (tomorrow, next week, ...) to actual dates and set the priority with the
+    Eat That Frog ABCDE method: A must do, B should do, C nice to do, D delegate, E eliminate.
+    """
+    response = await generate_content(prompt, generation_config=json_output(FrogAnalysis))
+    return parse_model_output(FrogAnalysis, response.text).tasks
+
+
+@app.post("/schedule_timetable/")
+async def schedule_timetable(schedule_input: ScheduleInput):
+    """
+    Build the timetable with the local scheduler: Gemini only parses the query into tasks
+    (skipped when `tasks` are given), then slots are allocated deterministically in milliseconds.
+    Returns the structured schedule plus the same markdown tables as /generate_timetable/.
+    """
+    try:
+        start = datetime.now().date()
+        try:
+            if schedule_input.start_date:
+                start = datetime.strptime(schedule_input.start_date, "%Y-%m-%d").date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="start_date must be YYYY-MM-DD")
+        timings = {}
+
+        tasks = schedule_input.tasks
+        if tasks is None:
+            if not schedule_input.query.strip():
+                raise HTTPException(status_code=400, detail="Provide a query or a list of tasks")
+            started = time.perf_counter()
+            tasks = await extract_tasks(schedule_input.query, start)
+            timings["parse_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+        preferences = await run_chroma(preference_store.get_all, schedule_input.user_id)
+        started = time.perf_counter()
+        schedule = schedule_tasks(tasks, start, config_from_preferences(preferences))
+        timings["schedule_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        metrics.observe("schedule_ms", timings["schedule_ms"])
+
+        timetable = render_markdown(schedule)
+        memory = await run_chroma(get_user_memory, schedule_input.user_id)
+        query = schedule_input.query or ", ".join(task.name for task in tasks)
+        timetable_id = await remember_timetable(query, timetable, memory)
 
+        return {
+            "tasks": [task.model_dump() for task in tasks],
+            "schedule": schedule,
+            "timetable": timetable,
+            "timetable_id": timetable_id,
+            "timings": timings
+        }
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/upload_study_material/")
-async def upload_study_material(file: UploadFile = File(...), subject: str = "general"):
-    """Upload PDF study materials, syllabi, or notes to enhance RAG context"""
+@app.post("/plan/")
+async def plan(task_input: TaskInput):
+    """
+    Frog analysis and timetable for one query in a single pipeline: context is retrieved once,
+    then one Gemini call returns both the analysis and the timetable built from it. When the
+    query was already analysed (here or by /identify_frogs/ with structured=true) the cached
+    analysis is reused and Gemini only lays out the timetable. Reports per-stage timings.
+    """
+    try:
+        timings = {}
+        started = stage = time.perf_counter()
+
+        def lap(name: str):
+            nonlocal stage
+            now = time.perf_counter()
+            timings[f"{name}_ms"] = round((now - stage) * 1000, 2)
+            metrics.observe(f"plan_{name}_ms", timings[f"{name}_ms"])
+            stage = now
+
+        # Retrieve: every lookup runs concurrently. The cache compares normalized text, while
+        # timetable memory is searched with the query as written, like the documents it holds.
+        memory = await run_chroma(get_user_memory, task_input.user_id)
+        embedding = (await run_chroma(response_cache.embed_many, [task_input.query]))[0]
+
+        async def cached_analysis():
+            if task_input.bypass_cache:
+                return None
+            cached, _ = await run_chroma(
+                response_cache.get, task_input.query, analysis_cache_scope(task_input.user_id), embedding
+            )
+            return cached
+
+        analysis, candidates, preferences, _ = await asyncio.gather(
+            cached_analysis(),
+            run_chroma(
+                memory.query,
+                query_texts=[task_input.query],
+                n_results=RERANK_CANDIDATES,
+                where=RERANK_WHERE,
+                include=["documents", "metadatas", "distances"]
+            ),
+            run_chroma(preference_store.get_all, task_input.user_id),
+            get_etf_context("timetable")
+        )
+        analysis_cached = analysis is not None
+        prompt = await build_timetable_prompt(
+            task_input.query, memory, preferences, candidates=candidates,
+            output_format=STRUCTURED_TIMETABLE_FORMAT if analysis_cached else PLAN_FORMAT,
+            analysis=analysis
+        )
+        lap("retrieve")
+
+        # Generate: one round trip, for the timetable alone or for analysis + timetable
+        if analysis_cached:
+            response = await generate_content(prompt, generation_config=json_output(Timetable))
+            schedule = parse_model_output(Timetable, response.text).model_dump()
+        else:
+            response = await generate_content(prompt, generation_config=json_output(Plan))
+            result = parse_model_output(Plan, response.text)
+            analysis, schedule = result.analysis.model_dump(), result.timetable.model_dump()
+        lap("generate")
+
+        # Store: the analysis for later requests, the timetable in memory
+        if not analysis_cached:
+            await run_chroma(
+                response_cache.put, task_input.query, analysis, analysis_cache_scope(task_input.user_id), embedding
+            )
+        timetable = render_markdown(schedule)
+        timetable_id = await remember_timetable(task_input.query, timetable, memory)
+        lap("store")
+        timings["total_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+        return {
+            "analysis": analysis,
+            "schedule": schedule,
+            "timetable": timetable,
+            "timetable_id": timetable_id,
+            "analysis_cached": analysis_cached,
+            "timings": timings
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/upload_study_material/", status_code=202)
+async def upload_study_material(file: UploadFile = File(...), subject: str = "general", replace: bool = False):
+    """Upload PDF study materials, syllabi, or notes to enhance RAG context (processed in the background).
+    Chunks already stored are skipped; `replace` also drops chunks of an earlier version of this file."""
     try:
         if file.content_type != "application/pdf":
             raise HTTPException(status_code=400, detail="Only PDF files are supported")
         
-        # Read PDF content
-        content = await file.read()
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
-        
-        # Extract text from all pages
-        text_content = ""
-        for page in pdf_reader.pages:
-            text_content += page.extract_text() + "\n"
-        
-        # Split into chunks for better retrieval
-        chunks = [text_content[i:i+1000] for i in range(0, len(text_content), 800)]
-        
-        # Store in ChromaDB
-        for i, chunk in enumerate(chunks):
-            study_materials.add(
-                documents=[chunk],
-                metadatas=[{
-                    "type": "study_material",
-                    "subject": subject,
-                    "filename": file.filename,
-                    "chunk": i,
-                    "upload_date": datetime.now().isoformat()
-                }],
-                ids=[f"{file.filename}_{subject}_{i}_{datetime.now().timestamp()}"]
+        # Save the upload so the background job can read it after this request ends
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        filename = os.path.basename(file.filename)
+        path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}_{filename}")
+        with open(path, "wb") as buffer:
+            await asyncio.to_thread(shutil.copyfileobj, file.file, buffer)
+
+        try:
+            job = job_queue.submit(
+                "study_material",
+                {"path": path, "filename": filename, "subject": subject, "replace": replace}
             )
+        except QueueFull as e:
+            os.remove(path)
+            raise HTTPException(status_code=503, detail=str(e))
         
-        return {"message": f"Successfully uploaded {file.filename} with {len(chunks)} chunks", "subject": subject}
+        return {
+            "message": f"Queued {filename} for processing",
+            "subject": subject,
+            "job_id": job.id,
+            "status_url": f"/jobs/{job.id}"
+        }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/jobs/")
+async def list_jobs():
+    """List recent background ingestion jobs"""
+    return {"jobs": [job.to_dict() for job in reversed(list(job_queue.jobs.values()))]}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Progress of a background ingestion job: pages processed, chunks embedded and throughput"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running ingestion job (chunks already stored are kept)"""
+    job = job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
 @app.post("/add_study_note/")
 async def add_study_note(note: str, subject: str = "general", topic: str = ""):
     """Add text-based study notes or important information"""
     try:
-        study_materials.add(
+        note_id = f"note_{subject}_{datetime.now().timestamp()}"
+        await run_chroma(
+            study_materials.add,
             documents=[note],
             metadatas=[{
                 "type": "study_note",
@@ -262,8 +1126,10 @@ async def add_study_note(note: str, subject: str = "general", topic: str = ""):
                 "topic": topic,
                 "date": datetime.now().isoformat()
             }],
-            ids=[f"note_{subject}_{datetime.now().timestamp()}"]
+            ids=[note_id]
         )
+        await run_chroma(keyword_index.add, [note_id], [note])
+        invalidate_study_context()
         
         return {"message": "Study note added successfully", "subject": subject, "topic": topic}
     
@@ -271,29 +1137,39 @@ async def add_study_note(note: str, subject: str = "general", topic: str = ""):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/search_materials/")
-async def search_materials(query: str, n_results: int = 5):
-    """Search through stored study materials and notes"""
+async def search_materials(query: str, n_results: int = 5, hybrid: bool = True):
+    """Search through stored study materials and notes (vector + BM25 keyword search unless hybrid=false)"""
     try:
-        results = study_materials.query(
-            query_texts=[query],
-            n_results=n_results
+        started = time.perf_counter()
+        results = await run_chroma(
+            hybrid_query,
+            study_materials,
+            keyword_index if hybrid else None,
+            query,
+            n_results,
+            HYBRID_CANDIDATES
         )
+        metrics.observe("search_materials_ms", (time.perf_counter() - started) * 1000)
         
         return {
             "query": query,
             "results": results['documents'][0] if results['documents'] else [],
-            "metadata": results['metadatas'][0] if results['metadatas'] else []
+            "metadata": results['metadatas'][0] if results['metadatas'] else [],
+            "retrieval": "hybrid" if hybrid else "vector"
         }
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/complete_frog/")
-async def complete_frog(task_name: str, completion_time: str, difficulty_actual: int, notes: str = ""):
+async def complete_frog(task_name: str, completion_time: str, difficulty_actual: int, notes: str = "", user_id: Optional[str] = None):
     """Mark a frog (important task) as completed - builds momentum and tracks productivity"""
     try:
+        memory = await run_chroma(get_user_memory, user_id)
         # Store frog completion for momentum tracking
-        timetable_memory.add(
+        now = datetime.now()
+        await run_chroma(
+            memory.add,
             documents=[f"🐸 FROG COMPLETED: {task_name} at {completion_time}. Difficulty: {difficulty_actual}/10. Notes: {notes}"],
             metadatas=[{
                 "type": "frog_completion",
@@ -301,10 +1177,11 @@ async def complete_frog(task_name: str, completion_time: str, difficulty_actual:
                 "completion_time": completion_time,
                 "difficulty_actual": difficulty_actual,
                 "notes": notes,
-                "date": datetime.now().isoformat(),
-                "day_of_week": datetime.now().strftime("%A")
+                "date": now.isoformat(),
+                "day": day_number(now),  # YYYYMMDD, for date-range filters
+                "day_of_week": now.strftime("%A")
             }],
-            ids=[f"frog_done_{datetime.now().timestamp()}"]
+            ids=[f"frog_done_{now.timestamp()}"]
         )
         
         return {
@@ -317,43 +1194,66 @@ async def complete_frog(task_name: str, completion_time: str, difficulty_actual:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/daily_frog_report/")
-async def daily_frog_report(date: str = "today"):
-    """Get report of frogs completed and productivity momentum"""
+async def daily_frog_report(date: str = "today", end_date: Optional[str] = None, day_of_week: Optional[str] = None,
+                            user_id: Optional[str] = None):
+    """Get report of frogs completed and productivity momentum for a date or date range (YYYY-MM-DD)"""
     try:
-        if date == "today":
-            date = datetime.now().strftime("%Y-%m-%d")
+        memory = await run_chroma(get_user_memory, user_id)
+        try:
+            start = parse_report_date(date)
+            end = parse_report_date(end_date) if end_date else start
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Dates must be 'today' or YYYY-MM-DD")
+        if end < start:
+            raise HTTPException(status_code=400, detail="end_date must not be before date")
         
-        # Search for completed frogs
-        completed_frogs = timetable_memory.query(
-            query_texts=["frog completed task"],
-            n_results=10
+        # Completions are answered by metadata filters, not similarity search
+        conditions = [
+            {"type": "frog_completion"},
+            {"day": {"$gte": day_number(start)}},
+            {"day": {"$lte": day_number(end)}}
+        ]
+        if day_of_week:
+            conditions.append({"day_of_week": day_of_week.capitalize()})
+        completed_frogs = await run_chroma(
+            memory.get,
+            where={"$and": conditions},
+            include=["documents", "metadatas"]
         )
         
-        # Count frogs completed in recent days
-        recent_completions = []
-        if completed_frogs['documents'] and completed_frogs['documents'][0]:
-            recent_completions = completed_frogs['documents'][0]
+        # Order completions chronologically
+        completions = sorted(
+            zip(completed_frogs['documents'], completed_frogs['metadatas']),
+            key=lambda item: item[1].get("date", "")
+        )
+        recent_completions = [document for document, _ in completions]
         
         return {
-            "date": date,
+            "date": start.strftime("%Y-%m-%d"),
+            "end_date": end.strftime("%Y-%m-%d"),
             "frogs_completed_recently": len(recent_completions),
             "recent_frog_completions": recent_completions,
+            "completions": [metadata for _, metadata in completions],
             "momentum_message": "Great job eating your frogs! 🐸" if recent_completions else "Time to identify and eat your first frog! 🐸",
             "productivity_trend": "Building momentum" if len(recent_completions) > 0 else "Ready to start"
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/rate_timetable/")
-async def rate_timetable(timetable_id: str, rating: int, feedback: str = ""):
+async def rate_timetable(timetable_id: str, rating: int, feedback: str = "", user_id: Optional[str] = None):
     """Rate a timetable's effectiveness (1-5 stars) for future learning"""
     try:
+        memory = await run_chroma(get_user_memory, user_id)
         if rating < 1 or rating > 5:
             raise HTTPException(status_code=400, detail="Rating must be between 1 and 5")
         
         # Store feedback for future timetable generation
-        timetable_memory.add(
+        await run_chroma(
+            memory.add,
             documents=[f"Timetable feedback: Rating {rating}/5. {feedback}"],
             metadatas=[{
                 "type": "timetable_feedback",
@@ -364,43 +1264,64 @@ async def rate_timetable(timetable_id: str, rating: int, feedback: str = ""):
             }],
             ids=[f"feedback_{timetable_id}_{datetime.now().timestamp()}"]
         )
+
+        # Write the rating back to the timetable itself so retrieval can re-rank by it
+        # (it may be gone already if retention compacted it into a monthly summary)
+        stored = await run_chroma(memory.get, ids=[timetable_id], include=["metadatas"])
+        if stored["ids"]:
+            await run_chroma(
+                memory.update,
+                ids=[timetable_id],
+                metadatas=[{**stored["metadatas"][0], "rating": rating, "rated_at": datetime.now().isoformat()}]
+            )
         
-        return {"message": f"Thank you! Rated {rating}/5 stars", "timetable_id": timetable_id}
+        return {
+            "message": f"Thank you! Rated {rating}/5 stars",
+            "timetable_id": timetable_id,
+            "timetable_updated": bool(stored["ids"])
+        }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/add_user_preference/")
-async def add_user_preference(preference_type: str, preference_value: str, description: str = ""):
-    """Store user preferences like 'best_study_time': '9AM-11AM' or 'break_duration': '15 minutes'"""
+async def add_user_preference(preference_type: str, preference_value: str, description: str = "", user_id: Optional[str] = None):
+    """Store user preferences like 'best_study_time': '9AM-11AM' or 'break_duration': '15 minutes'.
+    Setting a preference type again replaces its previous value."""
     try:
-        timetable_memory.add(
-            documents=[f"User preference: {preference_type} = {preference_value}. {description}"],
-            metadatas=[{
-                "type": "user_preference",
-                "preference_type": preference_type,
-                "preference_value": preference_value,
-                "description": description,
-                "date": datetime.now().isoformat()
-            }],
-            ids=[f"pref_{preference_type}_{datetime.now().timestamp()}"]
-        )
+        saved = await run_chroma(preference_store.set, user_id, preference_type, preference_value, description)
+        # Cached timetables were generated with the previous preferences
+        await run_chroma(response_cache.drop_scopes, [response_cache_scope(user_id, structured) for structured in (False, True)])
         
-        return {"message": "Preference saved", "type": preference_type, "value": preference_value}
+        return {"message": "Preference saved", "type": preference_type, "value": preference_value,
+                "updated_at": saved["updated_at"]}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/user_preferences/")
+async def get_user_preferences(user_id: Optional[str] = None):
+    """All of a user's current preferences, keyed by preference type"""
+    try:
+        return {"user_id": user_id, "preferences": await run_chroma(preference_store.get_all, user_id)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/get_memory_stats/")
-async def get_memory_stats():
+async def get_memory_stats(user_id: Optional[str] = None):
     """Check what's stored in ChromaDB memory"""
     try:
+        memory = await run_chroma(get_user_memory, user_id)
         # Get count of documents in each collection
-        timetable_count = timetable_memory.count()
-        materials_count = study_materials.count()
+        timetable_count = await run_chroma(memory.count)
+        materials_count = await run_chroma(study_materials.count)
+        preferences = await run_chroma(preference_store.get_all, user_id)
         
         # Get recent timetables
-        recent_timetables = timetable_memory.query(
+        recent_timetables = await run_chroma(
+            memory.query,
             query_texts=["recent timetable"],
             n_results=3
         )
@@ -408,6 +1329,7 @@ async def get_memory_stats():
         return {
             "timetable_memory_count": timetable_count,
             "study_materials_count": materials_count,
+            "user_preferences_count": len(preferences),
             "recent_timetables": recent_timetables['documents'][0] if recent_timetables['documents'] else [],
             "recent_metadata": recent_timetables['metadatas'][0] if recent_timetables['metadatas'] else [],
             "storage_location": "In-memory ChromaDB (persistent across app restarts)"
@@ -416,36 +1338,72 @@ async def get_memory_stats():
     except Exception as e:
         return {"error": str(e), "message": "ChromaDB collections might not be initialized yet"}
 
+@app.get("/ready")
+async def readiness():
+    """Readiness probe: 503 until the embedding model is loaded (unless it is loaded lazily)"""
+    ready = embedding_function.ready or EMBEDDING_LOAD == "lazy"
+    body = {"ready": ready, "embedding_load": EMBEDDING_LOAD, "embedder": embedding_function.status()}
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+@app.get("/metrics/")
+async def get_metrics():
+    """Request counters, latency percentiles and cache statistics for this service"""
+    return {
+        **metrics.snapshot(),
+        "response_cache": response_cache.stats(),
+        "embedding_cache": embedding_function.cache.stats(),
+        "coalescing": inflight.stats(),
+    }
+
+@app.post("/retention/sweep")
+async def retention_sweep():
+    """Run the timetable memory retention sweep now instead of waiting for the schedule"""
+    try:
+        return await run_chroma(run_retention_sweep)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/retention/")
+async def retention_status():
+    """Retention policy, schedule and the result of the last sweep"""
+    return {
+        "policy": DEFAULT_POLICY,
+        "interval_seconds": RETENTION_INTERVAL_SECONDS,
+        "last_sweep": last_retention_sweep,
+    }
+
 @app.get("/etf_recommendations/")
-async def get_etf_recommendations():
+async def get_etf_recommendations(user_id: Optional[str] = None):
     """Get personalized Eat That Frog recommendations based on your productivity patterns"""
     try:
+        memory = await run_chroma(get_user_memory, user_id)
         # Analyze productivity patterns
-        completed_frogs = timetable_memory.query(
+        completed_frogs = await run_chroma(
+            memory.query,
             query_texts=["frog completed productivity pattern"],
             n_results=5
         )
         
         # Get ETF principles from study materials
-        etf_principles = study_materials.query(
-            query_texts=["Brian Tracy productivity tips morning routine"],
-            n_results=3
-        )
+        etf_principles = await get_etf_context("recommendations")
+        preferences = await run_chroma(preference_store.get_all, user_id)
         
         # Analyze patterns
+        budget = ContextBudget(PROMPT_CONTEXT_TOKENS["etf_recommendations"])
         patterns_context = ""
         if completed_frogs['documents'] and completed_frogs['documents'][0]:
-            patterns_context = "Your productivity patterns:\n" + "\n".join(completed_frogs['documents'][0])
+            patterns_context = "Your productivity patterns:\n" + "\n".join(budget.take(completed_frogs['documents'][0], max_tokens=600))
         
         etf_context = ""
         if etf_principles['documents'] and etf_principles['documents'][0]:
-            etf_context = "Eat That Frog principles:\n" + "\n".join(etf_principles['documents'][0][:2])
+            etf_context = "Eat That Frog principles:\n" + "\n".join(budget.take(etf_principles['documents'][0][:2]))
         
         prompt = f"""
         Based on Brian Tracy's "Eat That Frog!" methodology and the user's productivity patterns, provide personalized recommendations.
         
         {patterns_context}
         
+        {format_preferences(preferences)}
         {etf_context}
         
         Provide 5 specific, actionable recommendations for improving productivity using ETF principles.
@@ -456,9 +1414,9 @@ async def get_etf_recommendations():
         4. Ways to eliminate time wasters
         5. Building momentum strategies
         """
+        record_prompt("etf_recommendations", prompt, budget)
         
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        response = model.generate_content(prompt)
+        response = await generate_content(prompt)
         
         return {
             "personalized_etf_recommendations": response.text,
@@ -470,27 +1428,28 @@ async def get_etf_recommendations():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/test_memory/")
-async def test_memory():
+async def test_memory(user_id: Optional[str] = None):
     """Test if RAG is remembering previous timetables"""
     try:
+        memory = await run_chroma(get_user_memory, user_id)
         # Search for any stored timetables
-        all_timetables = timetable_memory.query(
+        all_timetables = await run_chroma(
+            memory.query,
             query_texts=["timetable schedule exam"],
             n_results=10
         )
         
-        # Search for user preferences
-        preferences = timetable_memory.query(
-            query_texts=["user preference study time"],
-            n_results=5
-        )
+        # Preferences are keyed lookups, not a similarity search
+        preferences = await run_chroma(preference_store.get_all, user_id)
         
         return {
             "memory_test_results": {
                 "stored_timetables": len(all_timetables['documents'][0]) if all_timetables['documents'] else 0,
-                "stored_preferences": len(preferences['documents'][0]) if preferences['documents'] else 0,
+                "stored_preferences": len(preferences),
                 "sample_timetables": all_timetables['documents'][0][:2] if all_timetables['documents'] else [],
-                "sample_preferences": preferences['documents'][0] if preferences['documents'] else []
+                "sample_preferences": {
+                    preference_type: preference["value"] for preference_type, preference in preferences.items()
+                }
             },
             "status": "RAG memory is working" if all_timetables['documents'] and all_timetables['documents'][0] else "No timetables stored yet"
         }
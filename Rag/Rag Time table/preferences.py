@@ -0,0 +1,121 @@
+"""
+Keyed user-preference store.
+Preferences used to be free-text documents in timetable memory, found only when a
+similarity search happened to surface them, with stale values competing against new
+ones. Here each (user, preference_type) has exactly one value - the latest write
+wins - in a SQLite table, with an LRU cache of whole per-user preference maps so a
+prompt build costs a dictionary lookup.
+"""
+from collections import OrderedDict
+from datetime import datetime
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Optional
+
+
+class PreferenceStore:
+    def __init__(self, path: str, cache_size: int = 1024):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self.cache_size = cache_size
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS preferences ("
+                "user_id TEXT NOT NULL, preference_type TEXT NOT NULL, value TEXT NOT NULL, "
+                "description TEXT NOT NULL DEFAULT '', updated_at TEXT NOT NULL, "
+                "PRIMARY KEY (user_id, preference_type))"
+            )
+            # One-off bookkeeping, e.g. whether old memory documents were migrated
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    @staticmethod
+    def _user(user_id: Optional[str]) -> str:
+        # Requests without a user_id share one preference set, like the shared timetable memory
+        return user_id or ""
+
+    def set(self, user_id: Optional[str], preference_type: str, value: str, description: str = "",
+            updated_at: Optional[str] = None) -> dict:
+        """Store a preference, replacing any earlier value unless that one is newer"""
+        user = self._user(user_id)
+        updated_at = updated_at or datetime.now().isoformat()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO preferences (user_id, preference_type, value, description, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (user_id, preference_type) DO UPDATE SET "
+                "value = excluded.value, description = excluded.description, updated_at = excluded.updated_at "
+                "WHERE excluded.updated_at >= preferences.updated_at",
+                (user, preference_type, value, description, updated_at)
+            )
+            self._cache.pop(user, None)
+        return {"value": value, "description": description, "updated_at": updated_at}
+
+    def delete(self, user_id: Optional[str], preference_type: str) -> bool:
+        user = self._user(user_id)
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "DELETE FROM preferences WHERE user_id = ? AND preference_type = ?", (user, preference_type)
+            )
+            self._cache.pop(user, None)
+        return cursor.rowcount > 0
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (key, value)
+            )
+
+    def get_all(self, user_id: Optional[str]) -> Dict[str, dict]:
+        """All of a user's preferences as {preference_type: {value, description, updated_at}}"""
+        return self.get_many([user_id])[self._user(user_id)]
+
+    def get_many(self, user_ids: Iterable[Optional[str]]) -> Dict[str, Dict[str, dict]]:
+        """Preferences of several users at once; cache misses are loaded with one query"""
+        users = list(dict.fromkeys(self._user(user_id) for user_id in user_ids))
+        with self._lock:
+            result = {}
+            for user in users:
+                if user in self._cache:
+                    self._cache.move_to_end(user)
+                    result[user] = self._cache[user]
+            missing = [user for user in users if user not in result]
+            if missing:
+                loaded = {user: {} for user in missing}
+                placeholders = ", ".join("?" for _ in missing)
+                rows = self._db.execute(
+                    "SELECT user_id, preference_type, value, description, updated_at FROM preferences "
+                    f"WHERE user_id IN ({placeholders}) ORDER BY preference_type",
+                    missing
+                )
+                for user, preference_type, value, description, updated_at in rows:
+                    loaded[user][preference_type] = {
+                        "value": value, "description": description, "updated_at": updated_at
+                    }
+                for user, preferences in loaded.items():
+                    self._cache[user] = preferences
+                    result[user] = preferences
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return result
+
+
+def format_preferences(preferences: Dict[str, dict]) -> str:
+    """Prompt section listing a user's preferences (empty when there are none)"""
+    if not preferences:
+        return ""
+    lines = ["The user's stated preferences (always respect these):"]
+    for preference_type, preference in preferences.items():
+        line = f"- {preference_type}: {preference['value']}"
+        if preference["description"]:
+            line += f" ({preference['description']})"
+        lines.append(line)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,49 @@
+"""
+Feedback-weighted re-ranking of retrieved timetable memory.
+Nearest-neighbour search alone ignores how past timetables were rated, so more
+candidates are fetched than needed and scored by similarity × rating × recency;
+only the best few go into the prompt.
+"""
+from datetime import datetime
+from typing import List, Optional
+
+# Ratings are 1-5; unrated entries (0) are treated as neutral (3)
+NEUTRAL_RATING = 3
+
+
+def entry_rating(metadata: dict) -> float:
+    """Rating of a memory entry; monthly summaries carry the average of the timetables they replaced"""
+    if metadata.get("rated_count"):
+        return metadata["rating_total"] / metadata["rated_count"]
+    return metadata.get("rating") or NEUTRAL_RATING
+
+
+def rating_weight(rating: float) -> float:
+    """0.5 for a 1-star timetable, 1.0 for neutral, 1.5 for 5 stars"""
+    return 0.5 + (rating - 1) / 4
+
+
+def recency_weight(metadata: dict, now: datetime, half_life_days: float) -> float:
+    try:
+        age_days = (now - datetime.fromisoformat(metadata["date"])).total_seconds() / 86400
+    except (KeyError, TypeError, ValueError):
+        return 1.0
+    return 0.5 ** (max(age_days, 0) / half_life_days)
+
+
+def rerank(results: dict, top_k: int, half_life_days: float = 60, now: Optional[datetime] = None) -> List[dict]:
+    """
+    Score the hits of a single-query ChromaDB result (with distances and metadatas)
+    and return the best `top_k` as dicts of document, metadata and score.
+    """
+    if not results.get("documents") or not results["documents"][0]:
+        return []
+    now = now or datetime.now()
+    scored = []
+    for document, metadata, distance in zip(results["documents"][0], results["metadatas"][0], results["distances"][0]):
+        metadata = metadata or {}
+        similarity = 1 / (1 + distance)
+        score = similarity * rating_weight(entry_rating(metadata)) * recency_weight(metadata, now, half_life_days)
+        scored.append({"document": document, "metadata": metadata, "score": score})
+    scored.sort(key=lambda hit: hit["score"], reverse=True)
+    return scored[:top_k]
@@ -0,0 +1,140 @@
+"""
+Retention for timetable memory collections.
+Without it every generated timetable, rating and frog completion is
+kept forever and the HNSW index keeps growing. A sweep applies, per entry type:
+  - age-based expiry (max_age_days)
+  - compaction of old generated timetables into one summary document per month
+  - a cap on the number of entries kept (oldest removed first)
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+import os
+from typing import Optional
+
+DEFAULT_POLICY = {
+    "generated_timetable": {"max_entries": 200, "max_age_days": 180, "compact_after_days": 30},
+    "timetable_summary": {"max_entries": 24, "max_age_days": 730},
+    "timetable_feedback": {"max_entries": 500, "max_age_days": 365},
+    "frog_completion": {"max_entries": 2000, "max_age_days": 365},
+}
+# Timetables rated at least this highly are never compacted away
+KEEP_RATING = 4
+# Queries listed in a monthly summary
+SUMMARY_MAX_QUERIES = 30
+# Rough bytes per stored vector (384-dim float32) used to estimate reclaimed index size
+VECTOR_BYTES = 384 * 4
+
+
+def entry_time(metadata: dict) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(metadata["date"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def compact_timetables(collection, entries: list, cutoff: datetime) -> tuple:
+    """
+    Fold timetables older than `cutoff` (and not highly rated) into one summary per month.
+    Returns (ids removed, summaries written).
+    """
+    by_month = defaultdict(list)
+    for entry_id, document, metadata in entries:
+        moment = entry_time(metadata)
+        if moment is None or moment >= cutoff or (metadata.get("rating") or 0) >= KEEP_RATING:
+            continue
+        by_month[moment.strftime("%Y-%m")].append((entry_id, metadata))
+
+    removed, summaries = [], 0
+    for month, items in by_month.items():
+        summary_id = f"timetable_summary_{month}"
+        existing = collection.get(ids=[summary_id], include=["metadatas"])
+        previous = existing["metadatas"][0] if existing["ids"] else {}
+
+        queries = [q for q in previous.get("queries", "").split("\n") if q]
+        queries += [metadata.get("query", "") for _, metadata in items if metadata.get("query")]
+        queries = queries[-SUMMARY_MAX_QUERIES:]
+        ratings = [metadata["rating"] for _, metadata in items if metadata.get("rating")]
+        count = previous.get("timetable_count", 0) + len(items)
+        rating_total = previous.get("rating_total", 0) + sum(ratings)
+        rated_count = previous.get("rated_count", 0) + len(ratings)
+        rating = f"average rating {rating_total / rated_count:.1f}/5" if rated_count else "no ratings"
+
+        collection.upsert(
+            ids=[summary_id],
+            documents=[
+                f"Summary of {count} past timetables from {month} ({rating}). "
+                f"Requests included: " + "; ".join(queries)
+            ],
+            metadatas=[{
+                "type": "timetable_summary",
+                "month": month,
+                "date": max(metadata.get("date", "") for _, metadata in items),
+                "timetable_count": count,
+                "rating_total": rating_total,
+                "rated_count": rated_count,
+                "queries": "\n".join(queries),
+            }]
+        )
+        removed += [entry_id for entry_id, _ in items]
+        summaries += 1
+
+    if removed:
+        collection.delete(ids=removed)
+    return removed, summaries
+
+
+def sweep_collection(collection, policy: dict = DEFAULT_POLICY, now: Optional[datetime] = None) -> dict:
+    """Apply expiry, compaction and caps to one collection; blocking"""
+    now = now or datetime.now()
+    stats = {"expired": 0, "compacted": 0, "capped": 0, "summaries_written": 0, "bytes_reclaimed_estimate": 0}
+
+    for entry_type, rules in policy.items():
+        result = collection.get(where={"type": entry_type}, include=["metadatas", "documents"])
+        entries = list(zip(result["ids"], result["documents"], result["metadatas"]))
+        if not entries:
+            continue
+        sizes = {entry_id: len(document or "") + VECTOR_BYTES for entry_id, document, _ in entries}
+        removed = set()
+
+        max_age = rules.get("max_age_days")
+        if max_age is not None:
+            cutoff = now - timedelta(days=max_age)
+            expired = [entry_id for entry_id, _, metadata in entries
+                       if (entry_time(metadata) or now) < cutoff]
+            if expired:
+                collection.delete(ids=expired)
+                removed.update(expired)
+                stats["expired"] += len(expired)
+
+        compact_after = rules.get("compact_after_days")
+        if compact_after is not None:
+            remaining = [entry for entry in entries if entry[0] not in removed]
+            compacted, summaries = compact_timetables(collection, remaining, now - timedelta(days=compact_after))
+            removed.update(compacted)
+            stats["compacted"] += len(compacted)
+            stats["summaries_written"] += summaries
+
+        max_entries = rules.get("max_entries")
+        remaining = [entry for entry in entries if entry[0] not in removed]
+        if max_entries is not None and len(remaining) > max_entries:
+            remaining.sort(key=lambda entry: entry[2].get("date", ""))
+            overflow = [entry_id for entry_id, _, _ in remaining[:len(remaining) - max_entries]]
+            collection.delete(ids=overflow)
+            removed.update(overflow)
+            stats["capped"] += len(overflow)
+
+        stats["bytes_reclaimed_estimate"] += sum(sizes[entry_id] for entry_id in removed)
+
+    stats["removed"] = stats["expired"] + stats["compacted"] + stats["capped"]
+    return stats
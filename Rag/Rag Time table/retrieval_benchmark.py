@@ -0,0 +1,72 @@
+"""
+Relevance/latency benchmark for study-material retrieval.
+Loads a fixture corpus with labelled queries into an in-memory collection and
+keyword index, then reports recall@k, MRR and per-query latency for vector-only,
+keyword-only and hybrid (RRF-fused) retrieval.
+
+Usage:
+    python retrieval_benchmark.py --k 3 --backend sentence-transformers
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import chromadb
+
+# Helpers shared by the RAG services live in Rag/common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.embedder import EMBEDDING_BACKENDS, create_embedding_function
+from common.keyword_index import KeywordIndex, hybrid_query
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieval_fixture.json")
+
+
+def keyword_only(index: KeywordIndex, query: str, n_results: int) -> list:
+    return [doc_id for doc_id, _ in index.search(query, n_results)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare vector, keyword and hybrid retrieval")
+    parser.add_argument("--fixture", default=FIXTURE_PATH)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--candidates", type=int, default=20, help="Results per retriever before fusion")
+    parser.add_argument("--backend", default="sentence-transformers", choices=EMBEDDING_BACKENDS)
+    args = parser.parse_args()
+
+    with open(args.fixture, "r", encoding="utf-8") as f:
+        fixture = json.load(f)
+
+    collection = chromadb.Client().create_collection(
+        name="retrieval_benchmark",
+        embedding_function=create_embedding_function(args.backend)
+    )
+    ids, documents = list(fixture["documents"]), list(fixture["documents"].values())
+    collection.add(ids=ids, documents=documents)
+    index = KeywordIndex(":memory:")
+    index.add(ids, documents)
+
+    retrievers = {
+        "vector": lambda q: hybrid_query(collection, None, q, args.k)["ids"][0],
+        "keyword": lambda q: keyword_only(index, q, args.k),
+        "hybrid": lambda q: hybrid_query(collection, index, q, args.k, args.candidates)["ids"][0],
+    }
+    print(f"{len(ids)} documents, {len(fixture['queries'])} queries, k={args.k}")
+    print(f"{'retriever':<10}{'recall@k':>10}{'MRR':>8}{'avg ms':>9}{'p95 ms':>9}")
+    for name, retrieve in retrievers.items():
+        recalls, reciprocal_ranks, latencies = [], [], []
+        for item in fixture["queries"]:
+            relevant = set(item["relevant"])
+            started = time.perf_counter()
+            found = retrieve(item["query"])
+            latencies.append((time.perf_counter() - started) * 1000)
+            recalls.append(len(relevant & set(found)) / len(relevant))
+            ranks = [rank for rank, doc_id in enumerate(found, start=1) if doc_id in relevant]
+            reciprocal_ranks.append(1 / ranks[0] if ranks else 0.0)
+        latencies.sort()
+        p95 = latencies[int(0.95 * (len(latencies) - 1))]
+        print(f"{name:<10}{statistics.mean(recalls):>10.3f}{statistics.mean(reciprocal_ranks):>8.3f}"
+              f"{statistics.mean(latencies):>9.2f}{p95:>9.2f}")
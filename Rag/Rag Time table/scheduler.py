@@ -0,0 +1,315 @@
+"""
+Deterministic Eat That Frog scheduler.
+Allocates tasks (name, deadline, ABCDE priority, difficulty, importance,
+estimated_hours) to time slots locally instead of asking the LLM to lay out the
+timetable:
+  - the frog window (8-11 AM by default) goes to the biggest frogs first:
+    A tasks before B and C, then earliest deadline, then importance + difficulty
+  - the rest of the day is filled earliest-deadline-first, priority breaking ties
+  - a task is worked on until it is done (single handling), in sessions of at most
+    `session_minutes` separated by breaks, and only on days before its deadline
+  - D (delegate) and E (eliminate) tasks are listed but never scheduled
+The result is a plain dict, so it can be returned as JSON or rendered as the
+markdown tables the LLM used to produce.
+"""
+from datetime import date, datetime, timedelta
+import heapq
+import re
+from typing import Iterable, List, Optional, Tuple
+
+PRIORITY_RANK = {"A": 0, "B": 1, "C": 2}
+UNSCHEDULED_PRIORITIES = {"D": "delegate", "E": "eliminate"}
+DEFAULT_CONFIG = {
+    "day_start": "07:00",
+    "day_end": "22:00",
+    "frog_window": ("08:00", "11:00"),
+    "session_minutes": 120,
+    # Shorter gaps are left free rather than filled with a fragment of a longer task
+    "min_session_minutes": 30,
+    "break_minutes": 15,
+    # Blocks are multiples of this many minutes
+    "slot_minutes": 15,
+    "max_focus_hours_per_day": 9,
+    # Scheduling stops this many days after the start date, whatever the deadlines
+    "max_days": 120,
+    "fixed_blocks": [
+        ("Morning Routine", "07:00", "08:00", "Breakfast, get ready, review day"),
+        ("Lunch", "12:30", "13:30", "Meal and rest"),
+        ("Dinner", "19:00", "20:00", "Meal and wind down"),
+    ],
+}
+
+
+def parse_clock(value: str) -> Optional[int]:
+    """Minutes after midnight for '9AM', '9:30 pm' or '21:00'"""
+    match = re.fullmatch(r"\s*(\d{1,2})(?::(\d{2}))?\s*([ap]\.?m\.?)?\s*", value, re.IGNORECASE)
+    if not match:
+        return None
+    hours, minutes = int(match.group(1)), int(match.group(2) or 0)
+    suffix = (match.group(3) or "").lower()
+    if suffix.startswith("p") and hours < 12:
+        hours += 12
+    elif suffix.startswith("a") and hours == 12:
+        hours = 0
+    if hours > 23 or minutes > 59:
+        return None
+    return hours * 60 + minutes
+
+
+def format_clock(minutes: int) -> str:
+    hours, minutes = divmod(minutes, 60)
+    return f"{(hours - 1) % 12 + 1}:{minutes:02d} {'AM' if hours < 12 else 'PM'}"
+
+
+def parse_duration(value: str) -> Optional[int]:
+    """Minutes in '15 minutes', '1.5 hours' or '90'"""
+    match = re.search(r"(\d+(?:\.\d+)?)\s*(h|hour|hours|hr|hrs)?\b", value, re.IGNORECASE)
+    if not match:
+        return None
+    amount = float(match.group(1))
+    return int(amount * 60) if match.group(2) else int(amount)
+
+
+def config_from_preferences(preferences: dict, config: Optional[dict] = None) -> dict:
+    """
+    Apply stored user preferences ({type: {"value": ...}}) to a scheduler config.
+    Understood types: best_study_time ('9AM-11AM', used as the frog window),
+    break_duration, session_length, day_start and day_end; others are ignored.
+    """
+    config = dict(config or DEFAULT_CONFIG)
+
+    def value(key: str) -> str:
+        return (preferences.get(key) or {}).get("value", "")
+
+    window = re.split(r"\s*(?:-|–|to)\s*", value("best_study_time"))
+    if len(window) == 2 and None not in map(parse_clock, window):
+        config["frog_window"] = tuple(window)
+    for key, setting in (("break_duration", "break_minutes"), ("session_length", "session_minutes")):
+        minutes = parse_duration(value(key))
+        if minutes:
+            config[setting] = minutes
+    for key in ("day_start", "day_end"):
+        if parse_clock(value(key)) is not None:
+            config[key] = value(key)
+    return config
+
+
+def parse_deadline(value: str, start: date) -> Optional[date]:
+    """Deadline as a date ('YYYY-MM-DD...', 'today' or 'tomorrow'); None if it can't be read"""
+    value = (value or "").strip().lower()
+    if value == "today":
+        return start
+    if value == "tomorrow":
+        return start + timedelta(days=1)
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        return None
+
+
+def field(task, name: str):
+    """Task attribute, for pydantic models and plain dicts alike"""
+    return task[name] if isinstance(task, dict) else getattr(task, name)
+
+
+def fixed_blocks(config: dict) -> List[Tuple[int, int, str, str]]:
+    """(start, end, name, notes) of the fixed blocks, clipped to the day; blocks outside it are dropped"""
+    day_start, day_end = parse_clock(config["day_start"]), parse_clock(config["day_end"])
+    blocks = []
+    for name, start, end, notes in config["fixed_blocks"]:
+        start, end = max(parse_clock(start), day_start), min(parse_clock(end), day_end)
+        if start < end:
+            blocks.append((start, end, name, notes))
+    return sorted(blocks)
+
+
+def free_intervals(config: dict) -> List[Tuple[int, int, bool]]:
+    """(start, end, in_frog_window) gaps in a day around the fixed blocks"""
+    day_start, day_end = parse_clock(config["day_start"]), parse_clock(config["day_end"])
+    frog_start, frog_end = (parse_clock(t) for t in config["frog_window"])
+
+    gaps, cursor = [], day_start
+    for start, end, _, _ in fixed_blocks(config):
+        if start > cursor:
+            gaps.append((cursor, start))
+        cursor = max(cursor, end)
+    if cursor < day_end:
+        gaps.append((cursor, day_end))
+
+    # Split gaps at the frog window's edges so each interval is entirely inside or outside it
+    intervals = []
+    for start, end in gaps:
+        cuts = sorted({start, end} | {t for t in (frog_start, frog_end) if start < t < end})
+        for a, b in zip(cuts, cuts[1:]):
+            if b > a:
+                intervals.append((a, b, frog_start <= a and b <= frog_end))
+    return intervals
+
+
+def break_block(start: int, minutes: int) -> dict:
+    return {"start": start, "end": start + minutes, "activity": "Break",
+            "task": None, "priority": None, "frog": False, "notes": "Short energy break"}
+
+
+def schedule_tasks(tasks: Iterable, start: Optional[date] = None, config: Optional[dict] = None) -> dict:
+    """
+    Build an hour-by-hour timetable from `tasks` (Task models or dicts) starting on `start`.
+    Returns {"days": [{"date", "day", "blocks"}], "unscheduled", "skipped", "stats"}.
+    """
+    config = config or DEFAULT_CONFIG
+    start = start or date.today()
+    slot = config["slot_minutes"]
+    session = max(config["session_minutes"] - config["session_minutes"] % slot, slot)
+    horizon_end = start + timedelta(days=config["max_days"] - 1)
+
+    entries, skipped = [], []
+    for task in tasks:
+        priority = (field(task, "priority") or "C").strip().upper()[:1]
+        if priority in UNSCHEDULED_PRIORITIES:
+            skipped.append({"task": field(task, "name"), "priority": priority,
+                            "action": UNSCHEDULED_PRIORITIES[priority]})
+            continue
+        minutes = -(-int(round(field(task, "estimated_hours") * 60)) // slot) * slot
+        if minutes <= 0:
+            continue
+        deadline = parse_deadline(field(task, "deadline"), start)
+        # Work happens on days before the deadline; a deadline today still leaves today
+        last_day = min(max(deadline - timedelta(days=1), start), horizon_end) if deadline else horizon_end
+        entries.append({
+            "task": task,
+            "name": field(task, "name"),
+            "priority": PRIORITY_RANK.get(priority, 2),
+            "label": priority if priority in PRIORITY_RANK else "C",
+            "deadline": deadline,
+            "last_day": last_day,
+            "remaining": minutes,
+            "score": field(task, "importance") + field(task, "difficulty"),
+        })
+
+    # Both heaps hold every task; finished or overdue ones are dropped lazily when they reach the top
+    frog_heap = [(e["priority"], e["last_day"], -e["score"], i) for i, e in enumerate(entries)]
+    deadline_heap = [(e["last_day"], e["priority"], -e["score"], i) for i, e in enumerate(entries)]
+    heapq.heapify(frog_heap)
+    heapq.heapify(deadline_heap)
+
+    def next_task(heap: list, today: date) -> Optional[dict]:
+        while heap:
+            entry = entries[heap[0][-1]]
+            if entry["remaining"] > 0 and entry["last_day"] >= today:
+                return entry
+            heapq.heappop(heap)
+        return None
+
+    intervals = free_intervals(config)
+    fixed = fixed_blocks(config)
+    focus_cap = int(config["max_focus_hours_per_day"] * 60)
+    last_day = max((e["last_day"] for e in entries), default=start)
+
+    days, scheduled_minutes, sessions = [], 0, 0
+    today = start
+    while today <= last_day and next_task(deadline_heap, today):
+        blocks = [
+            {"start": s, "end": e, "activity": name, "task": None, "priority": None, "frog": False, "notes": notes}
+            for s, e, name, notes in fixed
+        ]
+        focus = 0
+        # Minutes worked without a break up to `run_end`: intervals split at the frog window's
+        # edges are adjacent, so a session ending at one continues into the next interval
+        run_length, run_end = 0, None
+        for interval_start, interval_end, in_frog_window in intervals:
+            cursor = interval_start
+            if cursor != run_end:
+                run_length = 0
+            heap = frog_heap if in_frog_window else deadline_heap
+            while interval_end - cursor >= slot and focus_cap - focus >= slot:
+                entry = next_task(heap, today)
+                if entry is None:
+                    break
+                wanted = max(min(entry["remaining"], config["min_session_minutes"]), slot)
+                if session - run_length < wanted:
+                    # The run carried over from the previous interval is used up; rest first
+                    if interval_end - cursor < config["break_minutes"] + wanted:
+                        break
+                    blocks.append(break_block(cursor, config["break_minutes"]))
+                    cursor += config["break_minutes"]
+                    run_length = 0
+                    continue
+                if min(interval_end - cursor, focus_cap - focus) < wanted:
+                    break
+                length = min(entry["remaining"], session - run_length, interval_end - cursor, focus_cap - focus)
+                length -= length % slot
+                frog = entry["label"] == "A"
+                blocks.append({
+                    "start": cursor,
+                    "end": cursor + length,
+                    "activity": "🐸 FROG SESSION" if frog else "Focus Session",
+                    "task": entry["name"],
+                    "priority": entry["label"],
+                    "frog": frog,
+                    "notes": "Most important task first!" if frog and in_frog_window else
+                             (f"Due {entry['deadline'].isoformat()}" if entry["deadline"] else ""),
+                })
+                entry["remaining"] -= length
+                cursor += length
+                run_length, run_end = run_length + length, cursor
+                focus += length
+                scheduled_minutes += length
+                sessions += 1
+                if (interval_end - cursor >= slot + config["break_minutes"] and focus_cap - focus >= slot
+                        and next_task(heap, today)):
+                    blocks.append(break_block(cursor, config["break_minutes"]))
+                    cursor += config["break_minutes"]
+                    run_length = 0
+
+        blocks.sort(key=lambda block: block["start"])
+        days.append({
+            "date": today.isoformat(),
+            "day": today.strftime("%A"),
+            "blocks": [{**block, "start": format_clock(block["start"]), "end": format_clock(block["end"])}
+                       for block in blocks],
+        })
+        today += timedelta(days=1)
+
+    unscheduled = [
+        {"task": e["name"], "priority": e["label"], "remaining_hours": round(e["remaining"] / 60, 2),
+         "deadline": e["deadline"].isoformat() if e["deadline"] else None,
+         "reason": "not enough free time before the deadline"}
+        for e in entries if e["remaining"] > 0
+    ]
+    return {
+        "days": days,
+        "unscheduled": unscheduled,
+        "skipped": skipped,
+        "stats": {
+            "tasks": len(entries) + len(skipped),
+            "sessions": sessions,
+            "scheduled_hours": round(scheduled_minutes / 60, 2),
+            "tasks_completed": sum(1 for e in entries if e["remaining"] == 0),
+            "tasks_unfinished": len(unscheduled),
+        },
+    }
+
+
+def render_markdown(schedule: dict) -> str:
+    """The schedule as one markdown table per day, in the format the timetable prompt asks for"""
+    lines = []
+    for day in schedule["days"]:
+        try:
+            when = datetime.strptime(day["date"], "%Y-%m-%d")
+            heading = f"{day['day']}, {when.strftime('%B')} {when.day}, {when.year}"
+        except ValueError:
+            heading = f"{day['day']}, {day['date']}"
+        lines += [f"## {heading}",
+                  "| Time | Activity | Task/Subject | Priority | Notes |",
+                  "|------|----------|--------------|----------|-------|"]
+        for block in day["blocks"]:
+            lines.append(f"| {block['start']} - {block['end']} | {block['activity']} | {block['task'] or '-'} "
+                         f"| {block['priority'] or '-'} | {block['notes']} |")
+        lines.append("")
+    if schedule.get("unscheduled"):
+        lines.append("**Not enough time before the deadline:** " + ", ".join(
+            f"{item['task']} ({item['remaining_hours']}h left)" for item in schedule["unscheduled"]))
+    if schedule.get("skipped"):
+        lines.append("**Not scheduled:** " + ", ".join(
+            f"{item['task']} ({item['action']})" for item in schedule["skipped"]))
+    return "\n".join(lines).strip() + "\n"
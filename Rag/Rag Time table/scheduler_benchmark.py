@@ -0,0 +1,59 @@
+"""
+Scheduler benchmark.
+Generates random task sets (ABCDE priorities, 1-10 difficulty/importance, 1-12 hour
+estimates, deadlines spread over the horizon) and reports how long the local
+scheduler takes and how much of the work it fits before the deadlines.
+
+Usage:
+    python scheduler_benchmark.py --tasks 100 500 --weeks 2 8 --runs 20
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from scheduler import schedule_tasks
+
+
+def random_tasks(count: int, weeks: int, start: date, rng: random.Random) -> list:
+    return [
+        {
+            "name": f"Task {i}",
+            "deadline": (start + timedelta(days=rng.randint(1, weeks * 7))).isoformat(),
+            "priority": rng.choices("ABCDE", weights=[3, 4, 3, 1, 1])[0],
+            "difficulty": rng.randint(1, 10),
+            "importance": rng.randint(1, 10),
+            "estimated_hours": rng.randint(1, 12),
+        }
+        for i in range(count)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the local timetable scheduler")
+    parser.add_argument("--tasks", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--weeks", type=int, nargs="+", default=[1, 4, 12])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    start = date(2025, 10, 7)
+    print(f"{'tasks':>6}{'weeks':>7}{'avg ms':>9}{'p95 ms':>9}{'sessions':>10}{'hours':>9}{'done':>7}{'late':>7}")
+    for count in args.tasks:
+        for weeks in args.weeks:
+            rng = random.Random(args.seed)
+            latencies, results = [], []
+            for _ in range(args.runs):
+                tasks = random_tasks(count, weeks, start, rng)
+                started = time.perf_counter()
+                results.append(schedule_tasks(tasks, start))
+                latencies.append((time.perf_counter() - started) * 1000)
+            latencies.sort()
+            p95 = latencies[int(0.95 * (len(latencies) - 1))]
+            stats = [result["stats"] for result in results]
+            print(f"{count:>6}{weeks:>7}{statistics.mean(latencies):>9.2f}{p95:>9.2f}"
+                  f"{statistics.mean(s['sessions'] for s in stats):>10.0f}"
+                  f"{statistics.mean(s['scheduled_hours'] for s in stats):>9.0f}"
+                  f"{statistics.mean(s['tasks_completed'] for s in stats):>7.0f}"
+                  f"{statistics.mean(s['tasks_unfinished'] for s in stats):>7.0f}")
@@ -0,0 +1,81 @@
+"""
+Pydantic models for Gemini's structured (JSON) replies.
+The models are also passed to Gemini as the response schema, but Gemini's Schema
+type only knows a subset of JSON Schema: it has no `default`, `title`, `$ref` or
+`anyOf`. gemini_schema() converts a model into that subset before it is sent.
+"""
+from typing import List, Optional, Type
+
+import google.generativeai as genai
+from pydantic import BaseModel
+
+# JSON Schema keywords that Gemini's Schema accepts as they are
+SCHEMA_KEYS = ("type", "description", "enum")
+
+
+class Task(BaseModel):
+    name: str
+    deadline: str
+    priority: str  # A, B, C, D, E (Eat That Frog ABCDE method)
+    difficulty: int  # 1-10 scale
+    importance: int  # 1-10 scale
+    estimated_hours: int
+    description: Optional[str] = ""
+
+class FrogAnalysis(BaseModel):
+    tasks: List[Task]
+    apply_eat_that_frog: bool = True
+
+class TimeBlock(BaseModel):
+    start: str  # e.g. "8:00 AM"
+    end: str
+    activity: str
+    task: Optional[str] = None  # None for breaks, meals and routines, as the local scheduler emits them
+    priority: Optional[str] = None
+    frog: bool = False
+    notes: str = ""
+
+class TimetableDay(BaseModel):
+    date: str  # YYYY-MM-DD
+    day: str
+    blocks: List[TimeBlock]
+
+class Timetable(BaseModel):
+    # Same shape as the local scheduler's output, so clients handle both alike
+    days: List[TimetableDay]
+
+class Plan(BaseModel):
+    analysis: FrogAnalysis
+    timetable: Timetable
+
+
+def _convert(node: dict, defs: dict) -> dict:
+    if "$ref" in node:
+        return _convert(defs[node["$ref"].rsplit("/", 1)[-1]], defs)
+    if "anyOf" in node:
+        # Optional[X] is anyOf [X, null]; Gemini spells that as X with nullable set
+        options = [option for option in node["anyOf"] if option.get("type") != "null"]
+        if len(options) != 1 or len(options) == len(node["anyOf"]):
+            raise TypeError(f"Gemini schemas can't express the union {node['anyOf']}")
+        converted = _convert(options[0], defs)
+        converted["nullable"] = True
+        return converted
+    converted = {key: node[key] for key in SCHEMA_KEYS if key in node}
+    if "properties" in node:
+        converted["properties"] = {name: _convert(prop, defs) for name, prop in node["properties"].items()}
+        if node.get("required"):
+            converted["required"] = list(node["required"])
+    if "items" in node:
+        converted["items"] = _convert(node["items"], defs)
+    return converted
+
+
+def gemini_schema(model: Type[BaseModel]) -> dict:
+    """JSON schema of `model` restricted to what Gemini's response_schema accepts"""
+    schema = model.model_json_schema()
+    return _convert(schema, schema.get("$defs", {}))
+
+
+def json_output(model: Type[BaseModel]) -> genai.GenerationConfig:
+    """Generation config that constrains Gemini's reply to JSON matching a pydantic model"""
+    return genai.GenerationConfig(response_mime_type="application/json", response_schema=gemini_schema(model))
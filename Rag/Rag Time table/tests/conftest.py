@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+import sys
+import uuid
+
+import pytest
+
+# The service's modules are imported as top-level modules, as main.py does
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+# Helpers shared by the RAG services live in Rag/common
+sys.path.append(os.path.dirname(SERVICE_DIR))
+
+PLAN = {
+    "analysis": {
+        "tasks": [{"name": "Thesis", "deadline": "2026-12-01", "priority": "A", "difficulty": 8,
+                   "importance": 9, "estimated_hours": 20, "description": None}],
+        "apply_eat_that_frog": True,
+    },
+    "timetable": {
+        "days": [{"date": "2026-10-19", "day": "Monday", "blocks": [
+            {"start": "8:00 AM", "end": "10:00 AM", "activity": "Focus", "task": "Thesis",
+             "priority": "A", "frog": True, "notes": ""},
+        ]}],
+    },
+}
+MARKDOWN_TIMETABLE = "| Time | Activity | Task/Subject | Priority | Notes |\n"
+
+
+def hash_embedding(texts):
+    """Deterministic stand-in for the sentence-transformers model"""
+    return [[byte / 256 for byte in hashlib.sha256(text.encode("utf-8")).digest()[:16]] for text in texts]
+
+
+class Reply:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGemini:
+    """Answers every prompt with PLAN (or its timetable, or markdown when no schema is given)"""
+    plan = PLAN
+
+    def __init__(self):
+        self.configs = []
+
+    async def generate_content(self, prompt, generation_config=None, **kwargs):
+        self.configs.append(generation_config)
+        if generation_config is None:
+            return Reply(MARKDOWN_TIMETABLE)
+        # The real client converts the config into its Schema proto before sending it
+        from google.generativeai.types.generation_types import to_generation_config_dict
+        to_generation_config_dict(generation_config)
+        if "analysis" in generation_config.response_schema["properties"]:
+            return Reply(json.dumps(PLAN))
+        return Reply(json.dumps(PLAN["timetable"]))
+
+
+@pytest.fixture
+def gemini(monkeypatch, tmp_path):
+    """Import the app with Gemini, the embedding model and its stores replaced by in-memory fakes"""
+    import chromadb
+    import main
+    from common.semantic_cache import SemanticCache
+    from preferences import PreferenceStore
+
+    async def get_etf_context(name):
+        return {"documents": [[]], "metadatas": [[]], "distances": [[]]}
+
+    fake = FakeGemini()
+    monkeypatch.setattr(main.embedding_function, "_function", hash_embedding)
+    memory = chromadb.EphemeralClient().create_collection(
+        name=f"test_memory_{uuid.uuid4().hex}", embedding_function=main.embedding_function
+    )
+    monkeypatch.setattr(main, "generate_content", fake.generate_content)
+    monkeypatch.setattr(main, "get_etf_context", get_etf_context)
+    monkeypatch.setattr(main, "get_user_memory", lambda user_id: memory)
+    monkeypatch.setattr(main, "preference_store", PreferenceStore(str(tmp_path / "preferences.sqlite3")))
+    monkeypatch.setattr(main, "response_cache", SemanticCache(embed=main.embedding_function))
+    return fake
@@ -0,0 +1,44 @@
+import asyncio
+import json
+
+import main
+from conftest import hash_embedding
+
+
+def run_batch(queries: list) -> list:
+    """Events of a /generate_timetable/batch call, as (event, data) pairs"""
+    async def collect():
+        batch = main.TimetableBatchInput(requests=[main.TaskInput(query=query, user_id="student") for query in queries])
+        response = await main.generate_timetable_batch(batch)
+        return "".join([chunk async for chunk in response.body_iterator])
+
+    events = []
+    for message in asyncio.run(collect()).strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in message.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_batch_retrieves_with_embeddings_of_the_raw_queries(gemini, monkeypatch):
+    seen = []
+
+    def retrieve(inputs, embeddings):
+        seen.extend(embeddings)
+        return retrieve_batch_candidates(inputs, embeddings)
+
+    retrieve_batch_candidates = main.retrieve_batch_candidates
+    monkeypatch.setattr(main, "retrieve_batch_candidates", retrieve)
+    queries = ["Thesis due December!", "Essay due Friday, maths exam Monday"]
+    events = run_batch(queries)
+
+    assert seen == hash_embedding(queries)
+    assert sorted(data["index"] for event, data in events if event == "result") == [0, 1]
+    assert events[-1] == ("done", {**events[-1][1], "succeeded": 2, "failed": 0, "cached": 0})
+
+
+def test_batch_serves_repeated_queries_from_the_cache(gemini):
+    run_batch(["Thesis due December!"])
+    events = run_batch(["thesis due december"])
+
+    assert events[0][0] == "result" and events[0][1]["cached"] is True
+    assert len(gemini.configs) == 1
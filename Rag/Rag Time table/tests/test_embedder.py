@@ -0,0 +1,31 @@
+import sqlite3
+
+import numpy as np
+
+from common.embedder import EmbeddingCache
+
+
+def stored_keys(path) -> set:
+    with sqlite3.connect(path) as db:
+        return {key for (key,) in db.execute("SELECT key FROM embeddings")}
+
+
+def test_evicted_embeddings_are_deleted_from_the_file(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(max_entries=3, path=path)
+    for start in range(0, 10, 2):
+        keys = [f"key-{i}" for i in range(start, start + 2)]
+        cache.put_many(keys, [np.full(4, i, dtype=np.float32) for i in range(start, start + 2)])
+        assert len(stored_keys(path)) <= 3
+
+    assert stored_keys(path) == {"key-7", "key-8", "key-9"}
+    reopened = EmbeddingCache(max_entries=3, path=path)
+    assert reopened.get_many(["key-9", "key-6"])[0].tolist() == [9.0] * 4
+    assert reopened.get_many(["key-6"]) == [None]
+
+
+def test_a_batch_larger_than_the_cache_keeps_only_its_newest_entries(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(max_entries=2, path=path)
+    cache.put_many([f"key-{i}" for i in range(5)], [np.zeros(4, dtype=np.float32)] * 5)
+    assert stored_keys(path) == {"key-3", "key-4"}
@@ -0,0 +1,59 @@
+import asyncio
+import threading
+
+from common.jobs import JobQueue
+
+
+def test_stop_cleans_up_only_after_the_running_handler_returns(tmp_path):
+    upload = tmp_path / "upload.pdf"
+    upload.write_bytes(b"%PDF")
+    started, release = threading.Event(), threading.Event()
+    seen = {}
+
+    def handler(job):
+        started.set()
+        release.wait(5)
+        # The upload must still be there while the handler reads it
+        seen["exists"] = upload.exists()
+        job.report(pages_processed=1)
+        return {}
+
+    def cleanup(job):
+        seen["cleaned_after_handler"] = "exists" in seen
+        upload.unlink()
+
+    async def scenario():
+        queue = JobQueue(str(tmp_path / "jobs.json"), workers=1)
+        queue.register("ingest", handler, cleanup)
+        await queue.start()
+        queue.submit("ingest", {})
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        # stop() cancels the worker while the handler is still running
+        threading.Timer(0.2, release.set).start()
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert seen == {"exists": True, "cleaned_after_handler": True}
+    assert not upload.exists()
+
+
+def test_jobs_cancelled_before_they_start_are_cleaned_up(tmp_path):
+    cleaned = []
+
+    async def scenario():
+        queue = JobQueue(str(tmp_path / "jobs.json"), workers=1)
+        queue.register("ingest", lambda job: {}, lambda job: cleaned.append(job.id))
+        await queue.start()
+        block = threading.Event()
+        queue.register("slow", lambda job: block.wait(5) and {}, None)
+        queue.submit("slow", {})
+        job = queue.submit("ingest", {})
+        queue.cancel(job.id)
+        block.set()
+        await queue._queue.join()
+        await queue.stop()
+        return job
+
+    job = asyncio.run(scenario())
+    assert cleaned == [job.id]
+    assert job.status == "cancelled"
@@ -0,0 +1,53 @@
+import asyncio
+import uuid
+
+import chromadb
+
+import main
+from common.keyword_index import KeywordIndex
+
+
+def test_plan_returns_analysis_and_timetable(gemini):
+    result = asyncio.run(main.plan(main.TaskInput(query="thesis due December", user_id="student")))
+
+    assert result["analysis"]["tasks"][0]["name"] == "Thesis"
+    assert result["schedule"] == gemini.plan["timetable"]
+    assert "Thesis" in result["timetable"]
+    assert result["analysis_cached"] is False
+    assert "analysis" in gemini.configs[0].response_schema["properties"]
+
+
+def test_plan_reuses_the_cached_analysis(gemini):
+    asyncio.run(main.plan(main.TaskInput(query="thesis due December", user_id="student")))
+    result = asyncio.run(main.plan(main.TaskInput(query="thesis due December", user_id="student")))
+
+    assert result["analysis_cached"] is True
+    assert result["schedule"] == gemini.plan["timetable"]
+    # Only the timetable is requested the second time
+    assert "days" in gemini.configs[1].response_schema["properties"]
+
+
+def test_plan_searches_memory_with_the_raw_query(gemini, monkeypatch):
+    queries = []
+    collection = type(main.get_user_memory("student"))
+    query = collection.query
+
+    def spy(self, **kwargs):
+        queries.append(kwargs.get("query_texts"))
+        return query(self, **kwargs)
+
+    monkeypatch.setattr(collection, "query", spy)
+    asyncio.run(main.plan(main.TaskInput(query="Thesis due December!", user_id="student")))
+    assert queries == [["Thesis due December!"]]
+
+
+def test_new_study_notes_drop_cached_analyses(gemini, monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "study_materials", chromadb.EphemeralClient().create_collection(
+        name=f"test_materials_{uuid.uuid4().hex}", embedding_function=main.embedding_function
+    ))
+    monkeypatch.setattr(main, "keyword_index", KeywordIndex(str(tmp_path / "keywords.sqlite3")))
+    asyncio.run(main.plan(main.TaskInput(query="thesis due December", user_id="student")))
+    asyncio.run(main.add_study_note("Do the hardest task first", subject="productivity"))
+    result = asyncio.run(main.plan(main.TaskInput(query="thesis due December", user_id="student")))
+
+    assert result["analysis_cached"] is False
@@ -0,0 +1,94 @@
+from datetime import date
+
+from scheduler import DEFAULT_CONFIG, config_from_preferences, fixed_blocks, free_intervals, parse_clock, schedule_tasks
+
+START = date(2026, 10, 19)
+
+
+def preferences(**values) -> dict:
+    return {key: {"value": value} for key, value in values.items()}
+
+
+def task(name="Thesis", priority="A", hours=20, deadline="2026-12-01"):
+    return {"name": name, "deadline": deadline, "priority": priority,
+            "difficulty": 8, "importance": 9, "estimated_hours": hours}
+
+
+def minutes(block: dict, key: str) -> int:
+    return parse_clock(block[key])
+
+
+def work_runs(day: dict) -> list:
+    """Lengths of stretches of focus sessions with no break or fixed block between them"""
+    runs, length, end = [], 0, None
+    for block in day["blocks"]:
+        if block["task"] is None:
+            continue
+        if minutes(block, "start") != end and length:
+            runs.append(length)
+            length = 0
+        length += minutes(block, "end") - minutes(block, "start")
+        end = minutes(block, "end")
+    return runs + [length] if length else runs
+
+
+def test_free_intervals_default_day():
+    assert free_intervals(DEFAULT_CONFIG) == [
+        (parse_clock("08:00"), parse_clock("11:00"), True),
+        (parse_clock("11:00"), parse_clock("12:30"), False),
+        (parse_clock("13:30"), parse_clock("19:00"), False),
+        (parse_clock("20:00"), parse_clock("22:00"), False),
+    ]
+
+
+def test_day_end_before_a_fixed_block_leaves_no_reversed_gaps():
+    config = config_from_preferences(preferences(day_end="12:00"))
+    intervals = free_intervals(config)
+    assert intervals == [(parse_clock("08:00"), parse_clock("11:00"), True),
+                         (parse_clock("11:00"), parse_clock("12:00"), False)]
+    assert all(start < end for start, end, _ in intervals)
+
+
+def test_fixed_blocks_outside_the_day_are_dropped_and_clipped():
+    config = config_from_preferences(preferences(day_start="7:30", day_end="18:00"))
+    assert [(name, start, end) for start, end, name, _ in fixed_blocks(config)] == [
+        ("Morning Routine", parse_clock("7:30"), parse_clock("8:00")),
+        ("Lunch", parse_clock("12:30"), parse_clock("13:30")),
+    ]
+
+
+def test_day_end_before_day_start_has_no_free_time():
+    config = config_from_preferences(preferences(day_start="10:00", day_end="9:00"))
+    assert free_intervals(config) == []
+
+
+def test_schedule_stays_within_a_short_day():
+    config = config_from_preferences(preferences(day_end="12:00"))
+    schedule = schedule_tasks([task()], START, config)
+    for day in schedule["days"]:
+        assert not {"Lunch", "Dinner"} & {block["activity"] for block in day["blocks"]}
+        assert all(minutes(block, "start") < minutes(block, "end") <= parse_clock("12:00") for block in day["blocks"])
+
+
+def test_session_continues_across_the_frog_window_edge_without_exceeding_the_limit():
+    schedule = schedule_tasks([task()], START)
+    first_day = schedule["days"][0]
+    assert max(work_runs(first_day)) <= DEFAULT_CONFIG["session_minutes"]
+    # 10:15-11:00 in the frog window runs on to 12:15 outside it, not to lunch at 12:30
+    starts = [(block["start"], block["end"]) for block in first_day["blocks"] if block["task"]]
+    assert ("10:15 AM", "11:00 AM") in starts
+    assert ("11:00 AM", "12:15 PM") in starts
+
+
+def test_runs_never_exceed_the_session_length_with_a_custom_frog_window():
+    for window in ("9AM-10:45AM", "8:00-11:30", "7:15-9:00"):
+        config = config_from_preferences(preferences(best_study_time=window, session_length="90 minutes"))
+        schedule = schedule_tasks([task(), task("Essay", "B", 12)], START, config)
+        for day in schedule["days"]:
+            assert max(work_runs(day)) <= 90, (window, day["date"])
+
+
+def test_delegated_and_eliminated_tasks_are_skipped():
+    schedule = schedule_tasks([task(hours=2), task("Email", "D", 1), task("Games", "E", 1)], START)
+    assert [item["action"] for item in schedule["skipped"]] == ["delegate", "eliminate"]
+    assert schedule["stats"]["tasks_completed"] == 1
@@ -0,0 +1,56 @@
+from datetime import date
+from typing import Union
+
+import pytest
+from google.generativeai.types.generation_types import to_generation_config_dict
+from pydantic import BaseModel
+
+from scheduler import schedule_tasks
+from schemas import FrogAnalysis, Plan, Task, TimeBlock, Timetable, TimetableDay, gemini_schema, json_output
+
+MODELS = [Task, FrogAnalysis, TimeBlock, TimetableDay, Timetable, Plan]
+
+
+def keys(schema) -> set:
+    """Every key used anywhere in a (nested) schema"""
+    if isinstance(schema, dict):
+        return set(schema).union(*(keys(value) for value in schema.values()))
+    if isinstance(schema, list):
+        return set().union(*(keys(value) for value in schema))
+    return set()
+
+
+@pytest.mark.parametrize("model", MODELS, ids=lambda model: model.__name__)
+def test_json_output_builds_a_gemini_schema(model):
+    # Converting to the Schema proto is what rejected `default` before
+    config = to_generation_config_dict(json_output(model))
+    assert config["response_mime_type"] == "application/json"
+    assert not keys(gemini_schema(model)) & {"default", "title", "$ref", "$defs", "anyOf"}
+
+
+def test_optional_fields_become_nullable():
+    assert gemini_schema(Task)["properties"]["description"] == {"type": "string", "nullable": True}
+
+
+def test_nested_models_are_inlined():
+    schema = gemini_schema(Plan)
+    tasks = schema["properties"]["analysis"]["properties"]["tasks"]
+    assert tasks["type"] == "array"
+    assert tasks["items"]["required"] == gemini_schema(Task)["required"]
+
+
+def test_unions_other_than_optional_are_rejected():
+    class Mixed(BaseModel):
+        value: Union[int, str, None] = None
+
+    with pytest.raises(TypeError):
+        gemini_schema(Mixed)
+
+
+def test_scheduler_output_matches_the_timetable_model():
+    # /schedule_timetable/ and the Gemini endpoints return the same block shape, breaks included
+    schedule = schedule_tasks([{"name": "Thesis", "deadline": "2026-12-01", "priority": "A", "difficulty": 8,
+                                "importance": 9, "estimated_hours": 6}], date(2026, 10, 19))
+    assert Timetable.model_validate(schedule).model_dump()["days"] == schedule["days"]
+    assert any(block["task"] is None for block in schedule["days"][0]["blocks"])
+    assert gemini_schema(TimeBlock)["properties"]["task"] == {"type": "string", "nullable": True}
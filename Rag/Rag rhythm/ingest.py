@@ -1,13 +1,63 @@
+"""
+Bulk ingest of books and papers into the circadian knowledge base.
+
+Files are streamed (text in blocks, PDFs page by page), split with the same
+splitter as the API, and embedded in fixed-size batches into the store (and
+keyword index) that main.py serves from. Progress is checkpointed after every
+batch, so a crashed or interrupted run picks up where it left off; finished
+files are skipped unless they change.
+
+Usage:
+    python ingest.py "books/*.txt" "papers/**/*.pdf" --workers 4 --batch-size 64
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import glob
+import json
 import os
-from typing import List
-import chromadb
+import sys
+import threading
+import time
+from typing import Iterator, List
+
 from chromadb import Client, Settings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
-def load_book_content(file_path: str) -> str:
-    """Load book content from a text file."""
-    with open(file_path, 'r', encoding='utf-8') as file:
-        return file.read()
+# Helpers shared by the RAG services live in Rag/common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.dedup import make_chunk_id, add_new_chunks
+from common.embedder import EMBEDDING_BACKENDS, create_embedding_function
+from common.keyword_index import KeywordIndex
+from common.pdf_extract import count_pages, iter_page_texts
+
+# Same store as main.py
+CHROMA_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "chroma_db")
+CHECKPOINT_PATH = os.path.join(os.path.dirname(CHROMA_DB_PATH), "ingest_checkpoint.json")
+KEYWORD_INDEX_PATH = os.path.join(os.path.dirname(CHROMA_DB_PATH), "keyword_index.sqlite3")
+COLLECTION_NAME = "circadian_knowledge"
+
+DEFAULT_PATTERNS = [
+    "../data/circadian_code.txt",
+    "../data/lifetime.txt"
+]
+DEFAULT_BATCH_SIZE = 64
+# Characters of text split at a time when streaming a file
+READ_BLOCK_SIZE = 50_000
+
+
+def get_collection(embedding_backend: str = "onnx"):
+    """Open the knowledge base collection the API serves from"""
+    client = Client(Settings(
+        persist_directory=CHROMA_DB_PATH,
+        is_persistent=True
+    ))
+    return client.get_or_create_collection(
+        name=COLLECTION_NAME,
+        metadata={"description": "Circadian rhythm and wellness knowledge base"},
+        embedding_function=create_embedding_function(embedding_backend)
+    )
+
 
 def split_text(text: str) -> List[str]:
     """Split text into chunks using LangChain's text splitter."""
@@ -18,42 +68,179 @@ def split_text(text: str) -> List[str]:
     )
     return text_splitter.split_text(text)
 
-def ingest_documents(file_paths: List[str]):
-    """Ingest documents into ChromaDB."""
-    # Initialize ChromaDB
-    client = Client(Settings(
-        persist_directory="../data/chroma_db"
-    ))
-    
-    # Create or get collection
-    collection = client.get_or_create_collection(
-        name="circadian_knowledge",
-        metadata={"description": "Circadian rhythm and wellness knowledge base"}
-    )
-    
-    for file_path in file_paths:
-        # Load and split content
-        content = load_book_content(file_path)
-        chunks = split_text(content)
-        
-        # Prepare documents for insertion
-        ids = [f"doc_{i}_{os.path.basename(file_path)}" for i in range(len(chunks))]
-        metadatas = [{"source": os.path.basename(file_path)} for _ in chunks]
-        
-        # Add documents to collection
-        collection.add(
-            documents=chunks,
+
+def iter_text_blocks(file_path: str) -> Iterator[str]:
+    """Yield a file's text in blocks of roughly READ_BLOCK_SIZE characters"""
+    if file_path.lower().endswith(".pdf"):
+        yield from iter_page_texts(file_path, count_pages(file_path))
+        return
+    with open(file_path, 'r', encoding='utf-8') as file:
+        while True:
+            block = file.read(READ_BLOCK_SIZE)
+            if not block:
+                return
+            yield block
+
+
+def iter_file_chunks(file_path: str) -> Iterator[str]:
+    """
+    Stream a file through the splitter without loading it whole. The last chunk of
+    each buffer may be cut off, so it is carried over into the next buffer.
+    """
+    buffer = ""
+    for block in iter_text_blocks(file_path):
+        buffer += block
+        if len(buffer) < READ_BLOCK_SIZE:
+            continue
+        chunks = split_text(buffer)
+        yield from chunks[:-1]
+        buffer = chunks[-1] if chunks else ""
+    if buffer:
+        yield from split_text(buffer)
+
+
+class Checkpoint:
+    """Per-file ingest progress, saved to disk after every batch"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.files = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.files = json.load(f)
+
+    @staticmethod
+    def fingerprint(file_path: str) -> dict:
+        stat = os.stat(file_path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def state(self, file_path: str) -> dict:
+        """Progress for a file, reset if the file changed since it was recorded"""
+        fingerprint = self.fingerprint(file_path)
+        with self.lock:
+            saved = self.files.get(file_path)
+            if saved and saved["size"] == fingerprint["size"] and saved["mtime"] == fingerprint["mtime"]:
+                return dict(saved)
+        return {**fingerprint, "chunks_done": 0, "complete": False}
+
+    def update(self, file_path: str, state: dict):
+        with self.lock:
+            self.files[file_path] = state
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.files, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def ingest_file(collection, file_path: str, checkpoint: Checkpoint, batch_size: int,
+                keyword_index: KeywordIndex) -> dict:
+    """Ingest one file in batches, resuming after the last checkpointed batch"""
+    state = checkpoint.state(file_path)
+    if state["complete"]:
+        return {"file": file_path, "chunks": state["chunks_done"], "embedded": 0, "skipped": True}
+
+    source = os.path.basename(file_path)
+    resume_from = state["chunks_done"]
+    embedded = 0
+    position = 0
+    batch = []
+
+    def flush():
+        nonlocal embedded
+        ids = [make_chunk_id(chunk) for chunk in batch]
+        embedded += add_new_chunks(
+            collection,
+            documents=batch,
             ids=ids,
-            metadatas=metadatas
+            metadatas=[{"source": source} for _ in batch]
         )
-        
-        print(f"Ingested {len(chunks)} chunks from {file_path}")
+        keyword_index.add(ids, batch)
+        state["chunks_done"] = position
+        checkpoint.update(file_path, state)
+        batch.clear()
+
+    for chunk in iter_file_chunks(file_path):
+        position += 1
+        # Chunks before the checkpoint were stored by an earlier run
+        if position <= resume_from:
+            continue
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    state["chunks_done"] = position
+    state["complete"] = True
+    checkpoint.update(file_path, state)
+    return {"file": file_path, "chunks": position, "embedded": embedded, "skipped": False}
+
+
+def expand_patterns(patterns: List[str]) -> List[str]:
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if not matches:
+            print(f"Warning: no files match {pattern}")
+        files.extend(os.path.abspath(path) for path in matches if os.path.abspath(path) not in files)
+    return files
+
+
+def ingest_documents(file_paths: List[str], batch_size: int = DEFAULT_BATCH_SIZE, workers: int = 1,
+                     checkpoint_path: str = CHECKPOINT_PATH, restart: bool = False,
+                     embedding_backend: str = "onnx") -> dict:
+    """Ingest documents into ChromaDB, `workers` files at a time."""
+    collection = get_collection(embedding_backend)
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = Checkpoint(checkpoint_path)
+    keyword_index = KeywordIndex(KEYWORD_INDEX_PATH)
+
+    started = time.perf_counter()
+    total_embedded = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(ingest_file, collection, path, checkpoint, batch_size, keyword_index): path for path in file_paths}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Failed to ingest {futures[future]}: {e} (rerun to resume)")
+                continue
+            total_embedded += result["embedded"]
+            if result["skipped"]:
+                print(f"Skipped {result['file']} (already ingested)")
+            else:
+                print(f"Ingested {result['embedded']} new chunks from {result['file']} ({result['chunks']} total)")
+
+    elapsed = time.perf_counter() - started
+    rate = total_embedded / elapsed if elapsed else 0.0
+    print(f"Embedded {total_embedded} chunks in {elapsed:.1f}s ({rate:.1f} chunks/sec); "
+          f"collection now holds {collection.count()} documents")
+    return {"embedded": total_embedded, "seconds": elapsed, "chunks_per_second": rate}
+
 
 if __name__ == "__main__":
-    # Specify the paths to your book text files
-    book_paths = [
-        "../data/circadian_code.txt",
-        "../data/lifetime.txt"
-    ]
-    
-    ingest_documents(book_paths)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Ingest books into the circadian knowledge base")
+    parser.add_argument("patterns", nargs="*", default=DEFAULT_PATTERNS,
+                        help="Files or glob patterns (.txt or .pdf); ** is supported")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Chunks embedded per ChromaDB add")
+    parser.add_argument("--workers", type=int, default=2,
+                        help="Files ingested in parallel")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH,
+                        help="Progress file used to resume interrupted runs")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignore the checkpoint and re-check every file")
+    parser.add_argument("--embedding-backend", default=os.getenv("EMBEDDING_BACKEND", "onnx"),
+                        choices=EMBEDDING_BACKENDS, help="How all-MiniLM-L6-v2 is run")
+    args = parser.parse_args()
+
+    ingest_documents(
+        expand_patterns(args.patterns),
+        batch_size=args.batch_size,
+        workers=args.workers,
+        checkpoint_path=args.checkpoint,
+        restart=args.restart,
+        embedding_backend=args.embedding_backend
+    )
@@ -0,0 +1,82 @@
+"""
+Concurrency load test for /analyze against a fake Gemini model.
+Replaces gemini_model.generate_content_async with a stub that sleeps for --latency
+seconds, fires --requests concurrent /analyze calls and compares the wall time with
+max(latency) and sum(latency). If Gemini or ChromaDB calls blocked the event loop,
+the requests would run one after another and take sum(latency); with LLM_CONCURRENCY
+slots they should take about ceil(N / slots) × latency. A ticker task also reports
+the longest event-loop stall seen during the run.
+
+Usage:
+    python load_benchmark.py --requests 20 --latency 2 --concurrency 8
+"""
+import argparse
+import asyncio
+import math
+import os
+import time
+
+TICK_SECONDS = 0.01
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+async def watch_loop(stop: asyncio.Event) -> float:
+    """Longest delay (seconds) between when a tick was due and when it ran"""
+    worst = 0.0
+    while not stop.is_set():
+        due = time.perf_counter() + TICK_SECONDS
+        await asyncio.sleep(TICK_SECONDS)
+        worst = max(worst, time.perf_counter() - due)
+    return worst
+
+
+async def run(main, count: int) -> tuple:
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch_loop(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        main.analyze_query(main.Query(
+            text=f"I can't fall asleep after {i + 1} hours on my phone",
+            screen_time=60 + i,
+            current_time="23:30",
+            bypass_cache=True
+        ))
+        for i in range(count)
+    ))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return elapsed, await watcher
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent /analyze requests against a fake Gemini model")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=2.0, help="Seconds each fake Gemini call takes")
+    parser.add_argument("--concurrency", type=int, default=8, help="LLM_CONCURRENCY for this run")
+    args = parser.parse_args()
+
+    # Read by main at import time
+    os.environ["LLM_CONCURRENCY"] = str(args.concurrency)
+    import main
+
+    async def fake_generate_content_async(prompt, **kwargs):
+        await asyncio.sleep(args.latency)
+        return FakeResponse("1. QUICK ASSESSMENT: put the phone away")
+
+    main.gemini_model.generate_content_async = fake_generate_content_async
+    # Load the embedding model first so it isn't part of the measurement
+    main.embedding_function.warm_up()
+
+    elapsed, stall = asyncio.run(run(main, args.requests))
+
+    expected = math.ceil(args.requests / args.concurrency) * args.latency
+    print(f"{args.requests} requests, {args.latency:.2f}s fake latency, LLM_CONCURRENCY={args.concurrency}")
+    print(f"wall time           {elapsed:8.2f}s")
+    print(f"max(latency)        {args.latency:8.2f}s")
+    print(f"expected (slots)    {expected:8.2f}s")
+    print(f"sum(latency)        {args.requests * args.latency:8.2f}s")
+    print(f"longest loop stall  {stall * 1000:8.1f}ms")
@@ -1,28 +1,97 @@
-from typing import Optional, List
 import os
+import sys
+
+if __name__ == "__main__":
+    # `python main.py` serves the app like `python -m uvicorn main:app`, with uvicorn as the
+    # __main__ module. PDF extraction workers are spawned processes, and spawn re-runs the
+    # launching script (as __mp_main__) in every worker; started from here, each worker
+    # would repeat all of the setup below (ChromaDB client, job queue, models).
+    import runpy
+    sys.argv = [sys.argv[0], "main:app", "--host", "0.0.0.0", "--port", "8000",
+                "--app-dir", os.path.dirname(os.path.abspath(__file__))]
+    runpy.run_module("uvicorn", run_name="__main__", alter_sys=True)
+    sys.exit()
+
+from typing import Optional, List
 import shutil
+import asyncio
+import functools
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import google.generativeai as genai
 from chromadb import Client, Settings
 from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from PyPDF2 import PdfReader
+
+# Helpers shared with the other RAG service live in Rag/common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.metrics import metrics
+from common.embedder import EMBEDDING_BACKENDS, MODEL_NAME, EmbeddingCache, LazyEmbeddingFunction, create_embedding_function
+from common.semantic_cache import SemanticCache
+from common.prompt_budget import ContextBudget, count_tokens
+from common.jobs import Job, JobQueue, QueueFull
+from common.dedup import make_chunk_id, add_new_chunks, remove_stale_chunks
+from common.pdf_extract import count_pages, iter_page_texts
+from common.keyword_index import KeywordIndex, hybrid_query
+from common.singleflight import SingleFlight, normalize_text, request_key
 
 # Load environment variables
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if EMBEDDING_LOAD == "eager":
+        await run_chroma(warm_up_embedder)
+    elif EMBEDDING_LOAD == "background":
+        asyncio.get_running_loop().run_in_executor(None, warm_up_embedder)
+    reindexed = await run_chroma(keyword_index.sync, collection)
+    if reindexed:
+        print(f"Rebuilt the keyword index over {reindexed} chunks")
+    # Background ingestion workers live as long as the app
+    await job_queue.start()
+    try:
+        yield
+    finally:
+        await job_queue.stop()
+
 # Initialize FastAPI app
-app = FastAPI(title="Circadian RAG API")
+app = FastAPI(title="Circadian RAG API", lifespan=lifespan)
 
 # Configure Gemini API
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 genai.configure(api_key=GOOGLE_API_KEY)
 
-# List available models
-print("Available models:")
-for m in genai.list_models():
-    print(f"- {m.name}")
+# Gemini model shared by all requests
+GEMINI_MODEL = "gemini-pro-latest"
+gemini_model = genai.GenerativeModel(GEMINI_MODEL)
+
+# Concurrency limits for blocking work so one slow request can't stall the event loop
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+CHROMA_WORKERS = int(os.getenv("CHROMA_WORKERS", "4"))
+llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+chroma_executor = ThreadPoolExecutor(max_workers=CHROMA_WORKERS, thread_name_prefix="chromadb")
+
+# Processes used to extract text from large PDFs (1 = always serial)
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+# Token budget for retrieved context in the /analyze prompt
+ANALYZE_CONTEXT_TOKENS = int(os.getenv("ANALYZE_CONTEXT_TOKENS", "800"))
+
+
+async def generate_content(prompt: str, **kwargs):
+    """Call Gemini through the async API, capped at LLM_CONCURRENCY in-flight requests"""
+    async with llm_semaphore:
+        return await gemini_model.generate_content_async(prompt, **kwargs)
+
+
+async def run_chroma(func, *args, **kwargs):
+    """Run a synchronous ChromaDB call on the bounded worker pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(chroma_executor, functools.partial(func, *args, **kwargs))
 
 # Initialize ChromaDB with default embeddings
 import os
@@ -37,29 +106,79 @@ chroma_client = Client(Settings(
     is_persistent=True
 ))
 
+# When the embedding model is loaded: "background" (warm up after startup; /ready reports 503
+# until done), "eager" (warm up before serving) or "lazy" (on the first request that needs it)
+EMBEDDING_LOAD = os.getenv("EMBEDDING_LOAD", "background")
+# How all-MiniLM-L6-v2 is run: "onnx" (ChromaDB's default embedder), "onnx-int8" or "sentence-transformers".
+# Vectors are compatible across backends, so it can be switched without re-embedding the collection.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "onnx")
+if EMBEDDING_BACKEND not in EMBEDDING_BACKENDS:
+    raise ValueError(f"EMBEDDING_BACKEND must be one of {', '.join(EMBEDDING_BACKENDS)}")
+
+# One all-MiniLM-L6-v2 embedder shared by the collection and the response cache, loaded outside of import.
+# Its cache means text that was embedded recently (repeated queries, fixed strings) isn't embedded again.
+embedding_function = LazyEmbeddingFunction(
+    functools.partial(create_embedding_function, EMBEDDING_BACKEND),
+    model_id=f"{MODEL_NAME}/{EMBEDDING_BACKEND}",
+    cache=EmbeddingCache(
+        max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+        path=os.getenv("EMBEDDING_CACHE_PATH") or None
+    )
+)
+
 # Create or get collection
 try:
     # Try to get existing collection
     collection = chroma_client.get_collection(
-        name="circadian_knowledge"
+        name="circadian_knowledge",
+        embedding_function=embedding_function
     )
     print("Found existing collection")
 except:
     # Create new collection if it doesn't exist
     collection = chroma_client.create_collection(
         name="circadian_knowledge",
-        metadata={"description": "Circadian rhythm and wellness knowledge base"}
+        metadata={"description": "Circadian rhythm and wellness knowledge base"},
+        embedding_function=embedding_function
     )
     print("Created new collection")
 
-def extract_text_from_pdf(file_path: str) -> str:
-    """Extract text from a PDF file."""
-    with open(file_path, 'rb') as file:
-        pdf_reader = PdfReader(file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-    return text
+# BM25 keyword index over the collection (shared with ingest.py), fused with vector search
+keyword_index = KeywordIndex(os.path.join(os.path.dirname(CHROMA_DB_PATH), "keyword_index.sqlite3"))
+# Candidates taken from each retriever before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+
+def warm_up_embedder():
+    try:
+        embedding_function.warm_up()
+    except Exception as e:
+        print(f"Warning: embedding model warm-up failed: {e}")
+        return
+    metrics.observe("embedder_warm_up_ms", embedding_function.warm_up_seconds * 1000)
+    print(f"Embedding model ready in {embedding_function.warm_up_seconds:.1f}s")
+
+# Cache of recommendations for repeated or near-duplicate questions,
+# embedded with the same model the collection uses
+response_cache = SemanticCache(
+    embed=embedding_function,
+    max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "256")),
+    ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL", "3600")),
+    similarity_threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+)
+
+# Identical /analyze requests that arrive while one is being answered share its result
+inflight = SingleFlight()
+
+def extract_text_from_pdf(file_path: str, progress=None) -> str:
+    """Extract text from a PDF file, using a process pool for large files.
+    `progress(pages_done, total_pages)` is called after each page."""
+    total_pages = count_pages(file_path)
+    pages = []
+    for text in iter_page_texts(file_path, total_pages, workers=PDF_EXTRACT_WORKERS):
+        pages.append(text)
+        if progress:
+            progress(len(pages), total_pages)
+    return "".join(pages)
 
 def split_text(text: str) -> List[str]:
     """Split text into chunks using LangChain's text splitter."""
@@ -70,132 +189,224 @@ def split_text(text: str) -> List[str]:
     )
     return text_splitter.split_text(text)
 
-@app.post("/upload")
-async def upload_pdf(file: UploadFile = File(...)):
+# Background ingestion jobs: uploads are saved to disk and processed by a worker pool
+UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+job_queue = JobQueue(
+    state_path=os.path.join(os.path.dirname(__file__), "data", "ingest_jobs.json"),
+    workers=int(os.getenv("INGEST_WORKERS", "2")),
+    max_pending=int(os.getenv("INGEST_QUEUE_SIZE", "16")),
+)
+
+def run_pdf_job(job: Job) -> dict:
+    """Extract, chunk and embed an uploaded PDF into the collection, reporting progress on the job"""
+    filename = job.params["filename"]
+    print(f"Processing PDF file: {job.params['path']}")
+
+    content = extract_text_from_pdf(
+        job.params["path"],
+        progress=lambda pages, total: job.report(pages_processed=pages, total_pages=total)
+    )
+    chunks = split_text(content)
+    print(f"Extracted {len(chunks)} text chunks from PDF")
+
+    # Add documents to the collection in batches so progress can be reported;
+    # content-hash ids mean chunks that are already stored are not embedded again
+    ids = [make_chunk_id(chunk) for chunk in chunks]
+    embedded = 0
+    try:
+        for start in range(0, len(chunks), INGEST_BATCH_SIZE):
+            end = min(start + INGEST_BATCH_SIZE, len(chunks))
+            embedded += add_new_chunks(
+                collection,
+                documents=chunks[start:end],
+                ids=ids[start:end],
+                metadatas=[{
+                    "source": filename,
+                    "page": i // 2,  # Approximate page number
+                    "chunk": i,
+                    "total_chunks": len(chunks)
+                } for i in range(start, end)]
+            )
+            keyword_index.add(ids[start:end], chunks[start:end])
+            job.report(chunks_embedded=end)
+
+        removed = remove_stale_chunks(collection, filename, set(ids), keyword_index) if job.params.get("replace") else 0
+    finally:
+        # Cached recommendations were retrieved from the collection as it was before this upload
+        # (chunks stored by a cancelled or failed job stay, so they count as well)
+        response_cache.clear()
+
+    print(f"Added {embedded} new chunks to ChromaDB ({len(chunks) - embedded} already stored)")
+
+    return {
+        "message": f"Successfully processed and stored {filename}",
+        "chunks": len(chunks),
+        "embedded": embedded,
+        "skipped_existing": len(chunks) - embedded,
+        "removed_stale": removed,
+        "total_documents_in_collection": collection.count(),
+        "collection_name": "circadian_knowledge"
+    }
+
+def remove_uploaded_file(job: Job):
+    if os.path.exists(job.params["path"]):
+        os.remove(job.params["path"])
+
+job_queue.register("pdf_upload", run_pdf_job, cleanup=remove_uploaded_file)
+
+@app.post("/upload", status_code=202)
+async def upload_pdf(file: UploadFile = File(...), replace: bool = False):
     """
-    Upload and process a PDF file.
+    Upload a PDF file for background processing.
+    Returns a job id; poll /jobs/{job_id} for progress.
+    Chunks already stored are skipped; `replace` also drops chunks of an earlier version of this file.
     """
     try:
         # Create upload directory if it doesn't exist
-        upload_dir = os.path.join(os.path.dirname(__file__), "uploads")
-        os.makedirs(upload_dir, exist_ok=True)
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
         
-        # Save the uploaded file
-        file_path = os.path.join(upload_dir, file.filename)
+        # Save the uploaded file so the job can read it after this request ends
+        filename = os.path.basename(file.filename)
+        file_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}_{filename}")
         with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        print(f"Processing PDF file: {file_path}")
-        
-        # Extract text from PDF
-        content = extract_text_from_pdf(file_path)
-        chunks = split_text(content)
-        
-        print(f"Extracted {len(chunks)} text chunks from PDF")
-        
-        # Prepare documents for insertion
-        ids = [f"doc_{i}_{file.filename}" for i in range(len(chunks))]
-        metadatas = [{
-            "source": file.filename,
-            "page": i // 2,  # Approximate page number
-            "chunk": i,
-            "total_chunks": len(chunks)
-        } for i in range(len(chunks))]
-        
-        # Add documents to collection
-        collection.add(
-            documents=chunks,
-            ids=ids,
-            metadatas=metadatas
-        )
-        
-        print(f"Added {len(chunks)} chunks to ChromaDB")
-        
-        # Verify the data was added
-        count = len(collection.get(
-            include=['documents', 'metadatas'])['ids']
-        )
-        
-        # Clean up the uploaded file
-        os.remove(file_path)
+            await asyncio.to_thread(shutil.copyfileobj, file.file, buffer)
+
+        try:
+            job = job_queue.submit("pdf_upload", {"path": file_path, "filename": filename, "replace": replace})
+        except QueueFull as e:
+            os.remove(file_path)
+            raise HTTPException(status_code=503, detail=str(e))
         
         return {
-            "message": f"Successfully processed and stored {file.filename}",
-            "chunks": len(chunks),
-            "total_documents_in_collection": count,
+            "message": f"Queued {filename} for processing",
+            "job_id": job.id,
+            "status_url": f"/jobs/{job.id}",
             "collection_name": "circadian_knowledge"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/jobs")
+async def list_jobs():
+    """List recent background ingestion jobs"""
+    return {"jobs": [job.to_dict() for job in reversed(list(job_queue.jobs.values()))]}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Progress of a background ingestion job: pages processed, chunks embedded and throughput"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running ingestion job (chunks already stored are kept)"""
+    job = job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
 class Query(BaseModel):
     text: str
     screen_time: Optional[int] = None  # Screen time in minutes
     current_time: Optional[str] = None  # Current time in HH:MM format
+    bypass_cache: bool = False  # Force a fresh Gemini call even if a similar question was answered recently
+
+def cache_scope(query: Query) -> str:
+    """Cached answers are only reused for the same hour of day and a similar amount of screen time"""
+    hour = query.current_time.split(":")[0] if query.current_time else ""
+    screen_bucket = query.screen_time // 30 if query.screen_time is not None else ""
+    return f"{hour}|{screen_bucket}"
 
 @app.post("/analyze")
 async def analyze_query(query: Query):
     try:
-        # Search relevant context from ChromaDB
-        results = collection.query(
-            query_texts=[query.text],
-            n_results=3,
-            include=['documents', 'metadatas', 'distances']
-        )
+        scope = cache_scope(query)
+        embedding = None
+        if not query.bypass_cache:
+            cached, embedding = await run_chroma(response_cache.get, query.text, scope)
+            if cached is not None:
+                return {**cached, "cached": True}
+
+        async def answer():
+            # Search relevant context from ChromaDB: vector and keyword matches, fused
+            results = await run_chroma(
+                hybrid_query,
+                collection,
+                keyword_index,
+                query.text,
+                3,
+                HYBRID_CANDIDATES
+            )
         
-        # Prepare context for Gemini by joining the most relevant documents
-        context = "\n".join(results['documents'][0] if results['documents'] else [])
+            # Prepare context for Gemini by joining the most relevant documents, within the token budget
+            budget = ContextBudget(ANALYZE_CONTEXT_TOKENS)
+            context = "\n".join(budget.take(results['documents'][0] if results['documents'] else []))
         
-        # Create optimized prompt for faster, more focused responses
-        prompt = f"""Analyze screen time impact and provide quick, actionable advice based on circadian science.
+            # Create optimized prompt for faster, more focused responses
+            prompt = f"""Analyze screen time impact and provide quick, actionable advice based on circadian science.
 
-        CONTEXT: {context}
+            CONTEXT: {context}
 
-        CURRENT STATUS:
-        - Time: {query.current_time}
-        - Screen Time: {query.screen_time} min
-        - Issue: {query.text}
+            CURRENT STATUS:
+            - Time: {query.current_time}
+            - Screen Time: {query.screen_time} min
+            - Issue: {query.text}
 
-        Provide a fast, structured response:
+            Provide a fast, structured response:
 
-        1. QUICK ASSESSMENT:
-        • Screen impact
-        • Time-specific risks
-        • Alertness concerns
+            1. QUICK ASSESSMENT:
+            • Screen impact
+            • Time-specific risks
+            • Alertness concerns
 
-        2. IMMEDIATE ACTIONS (2-3 key steps):
-        • What to do now
-        • Next 30 minutes
-        • Screen adjustments
+            2. IMMEDIATE ACTIONS (2-3 key steps):
+            • What to do now
+            • Next 30 minutes
+            • Screen adjustments
 
-        3. QUICK HABITS:
-        • Daily timing guide
-        • Prevention tips
+            3. QUICK HABITS:
+            • Daily timing guide
+            • Prevention tips
 
-        Keep responses concise and actionable. Use bullet points."""
+            Keep responses concise and actionable. Use bullet points."""
+            metrics.observe("prompt_tokens_analyze", count_tokens(prompt))
+            metrics.incr("prompt_context_duplicates_dropped", budget.dropped_duplicates)
+            metrics.incr("prompt_context_truncated", budget.truncated)
 
-        # Use the latest stable Gemini Pro model
-        model = genai.GenerativeModel('gemini-pro-latest')
-        
-        # Configure the model for stable, focused responses
-        generation_config = {
-            "temperature": 0.3,  # Lower temperature for more focused outputs
-            "top_p": 0.8,
-            "max_output_tokens": 1024,  # Shorter responses for faster generation
-        }
+            # Configure the model for stable, focused responses
+            generation_config = {
+                "temperature": 0.3,  # Lower temperature for more focused outputs
+                "top_p": 0.8,
+                "max_output_tokens": 1024,  # Shorter responses for faster generation
+            }
         
-        # Generate response
-        response = model.generate_content(
-            prompt,
-            generation_config=generation_config
-        )
+            # Generate response
+            response = await generate_content(
+                prompt,
+                generation_config=generation_config
+            )
         
-        # Use the response directly as gemini-1.0-pro doesn't require streaming handling
+            # Use the response directly as gemini-1.0-pro doesn't require streaming handling
 
-        return {
-            "recommendation": response.text,
-            "sources": results['metadatas'][0] if results['metadatas'] else []
-        }
+            result = {
+                "recommendation": response.text,
+                "sources": results['metadatas'][0] if results['metadatas'] else []
+            }
+            await run_chroma(response_cache.put, query.text, result, scope, embedding)
+            return result
+
+        # Requests for the same question while it is being answered wait for that answer
+        key = request_key("analyze", normalize_text(query.text), query.current_time, query.screen_time)
+        result, coalesced = await inflight.do(key, answer)
+        if coalesced:
+            metrics.incr("analyze_requests_coalesced")
+
+        return {**result, "cached": False, "coalesced": coalesced}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -205,6 +416,19 @@ async def analyze_query(query: Query):
 async def health_check():
     return {"status": "healthy", "collection_name": "circadian_knowledge"}
 
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+@app.get("/ready")
+async def readiness():
+    """Readiness probe: 503 until the embedding model is loaded (unless it is loaded lazily)"""
+    ready = embedding_function.ready or EMBEDDING_LOAD == "lazy"
+    body = {"ready": ready, "embedding_load": EMBEDDING_LOAD, "embedder": embedding_function.status()}
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prompt size counters, response cache and embedding cache statistics"""
+    return {
+        **metrics.snapshot(),
+        "response_cache": response_cache.stats(),
+        "embedding_cache": embedding_function.cache.stats(),
+        "coalescing": inflight.stats(),
+    }
\ No newline at end of file
@@ -0,0 +1,4 @@
+"""
+Helpers shared by the RAG services (Rag Time table, Rag rhythm) and the backend.
+Each service puts the Rag directory on sys.path and imports them as `common.<module>`.
+"""
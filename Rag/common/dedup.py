@@ -0,0 +1,90 @@
+"""
+Content-hash chunk ids shared by the RAG services' ingestion.
+Ids are derived from chunk text, so re-ingesting the same file maps onto the
+same ids and already-stored chunks are skipped instead of erroring or duplicating.
+Because identical text in two files is stored once, every chunk is also tagged with
+each file it appears in (a `<key>:<file>` metadata flag next to the first file's
+`key`), and replacing one file only deletes chunks that no other file still contains.
+"""
+import hashlib
+from typing import Optional
+
+
+def make_chunk_id(text: str, prefix: str = "doc") -> str:
+    """Stable id for a chunk, derived from its content"""
+    return f"{prefix}_{hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]}"
+
+
+def source_flag(source: str, key: str = "source") -> str:
+    """Metadata key marking a chunk as part of `source`"""
+    return f"{key}:{source}"
+
+
+def add_new_chunks(collection, documents: list, metadatas: list, ids: list, key: str = "source") -> int:
+    """
+    Add only the chunks whose ids are not stored yet (one bulk lookup), and tag stored ones
+    with the source (metadata[key]) they were found in again; returns how many were added
+    """
+    unique = {}
+    for document, metadata, chunk_id in zip(documents, metadatas, ids):
+        unique.setdefault(chunk_id, (document, {**metadata, source_flag(metadata[key], key): True}))
+    existing = collection.get(ids=list(unique), include=["metadatas"])
+
+    retag_ids, retag_metadatas = [], []
+    for chunk_id, stored in zip(existing["ids"], existing["metadatas"]):
+        flag = source_flag(unique[chunk_id][1][key], key)
+        if not (stored or {}).get(flag):
+            retag_ids.append(chunk_id)
+            retag_metadatas.append({flag: True})
+    if retag_ids:
+        collection.update(ids=retag_ids, metadatas=retag_metadatas)
+
+    stored_ids = set(existing["ids"])
+    new_ids = [chunk_id for chunk_id in unique if chunk_id not in stored_ids]
+    if new_ids:
+        collection.add(
+            documents=[unique[chunk_id][0] for chunk_id in new_ids],
+            metadatas=[unique[chunk_id][1] for chunk_id in new_ids],
+            ids=new_ids
+        )
+    return len(new_ids)
+
+
+def other_source(metadata: dict, source: str, key: str = "source") -> Optional[str]:
+    """A source other than `source` that the chunk with `metadata` belongs to, if any"""
+    if metadata.get(key) != source:
+        return metadata.get(key)
+    prefix = source_flag("", key)
+    for name, value in metadata.items():
+        if value and name.startswith(prefix) and name != source_flag(source, key):
+            return name[len(prefix):]
+    return None
+
+
+def remove_stale_chunks(collection, source: str, current_ids: set, keyword_index=None, key: str = "source") -> int:
+    """
+    Drop `source` from chunks that are not part of its latest ingest; chunks no other source
+    contains are deleted. Returns how many were deleted.
+    """
+    flag = source_flag(source, key)
+    # Chunks stored before sources were tagged only carry the first file's `key`
+    previous = collection.get(where={"$or": [{key: source}, {flag: True}]}, include=["metadatas"])
+
+    stale, untag_ids, untag_metadatas = [], [], []
+    for chunk_id, metadata in zip(previous["ids"], previous["metadatas"]):
+        if chunk_id in current_ids:
+            continue
+        remaining = other_source(metadata or {}, source, key)
+        if remaining is None:
+            stale.append(chunk_id)
+        else:
+            untag_ids.append(chunk_id)
+            # Metadata keys can't be removed through update, so the flag is cleared instead
+            untag_metadatas.append({flag: False, key: remaining})
+    if untag_ids:
+        collection.update(ids=untag_ids, metadatas=untag_metadatas)
+    if stale:
+        collection.delete(ids=stale)
+        if keyword_index is not None:
+            keyword_index.delete(stale)
+    return len(stale)
@@ -0,0 +1,204 @@
+"""
+Lazily loaded embedding function shared by a service's collections and caches.
+Loading the embedding model takes seconds, so it is not done at import: the
+model is loaded once, by an explicit warm-up (started from the app's lifespan)
+or by the first call, whichever comes first.
+
+all-MiniLM-L6-v2 can run on one of several backends, all producing vectors that
+are compatible with collections embedded by any of the others:
+  - "sentence-transformers": PyTorch
+  - "onnx": ONNX Runtime, using the export ChromaDB ships as its default embedder
+  - "onnx-int8": the same ONNX model with dynamically quantized int8 weights
+
+An optional EmbeddingCache keeps recent embeddings (optionally on disk), so text
+that was embedded before - repeated queries, fixed retrieval strings - is not
+run through the model again by any collection query or add.
+"""
+from collections import OrderedDict
+from functools import cached_property
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from chromadb.utils import embedding_functions
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_BACKENDS = ("sentence-transformers", "onnx", "onnx-int8")
+
+
+class QuantizedONNXMiniLM(embedding_functions.ONNXMiniLM_L6_V2):
+    """ChromaDB's ONNX all-MiniLM-L6-v2 with int8 weights, quantized once next to the downloaded model"""
+
+    @cached_property
+    def model(self):
+        folder = os.path.join(self.DOWNLOAD_PATH, self.EXTRACTED_FOLDER_NAME)
+        quantized_path = os.path.join(folder, "model_int8.onnx")
+        if not os.path.exists(quantized_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            tmp_path = f"{quantized_path}.tmp"
+            quantize_dynamic(os.path.join(folder, "model.onnx"), tmp_path, weight_type=QuantType.QInt8)
+            os.replace(tmp_path, quantized_path)
+
+        options = self.ort.SessionOptions()
+        options.log_severity_level = 3
+        return self.ort.InferenceSession(
+            quantized_path,
+            providers=getattr(self, "_preferred_providers", None) or ["CPUExecutionProvider"],
+            sess_options=options
+        )
+
+
+def create_embedding_function(backend: str) -> EmbeddingFunction:
+    """all-MiniLM-L6-v2 on the given backend (one of EMBEDDING_BACKENDS)"""
+    if backend == "sentence-transformers":
+        return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=MODEL_NAME)
+    if backend == "onnx":
+        return embedding_functions.ONNXMiniLM_L6_V2()
+    if backend == "onnx-int8":
+        return QuantizedONNXMiniLM()
+    raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(EMBEDDING_BACKENDS)}")
+
+
+class EmbeddingCache:
+    """
+    LRU cache of embeddings keyed by a hash of the model id and text. With a `path`,
+    entries are also written to a SQLite file and the most recent ones reloaded on start.
+    """
+
+    def __init__(self, max_entries: int = 10000, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self._open(path)
+
+    @staticmethod
+    def key(model_id: str, text: str) -> str:
+        return hashlib.sha256(f"{model_id}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _open(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+            # Only the newest max_entries rows are kept
+            self._db.execute(
+                "DELETE FROM embeddings WHERE rowid NOT IN "
+                "(SELECT rowid FROM embeddings ORDER BY rowid DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+        for key, blob in self._db.execute("SELECT key, vector FROM embeddings ORDER BY rowid"):
+            self._entries[key] = np.frombuffer(blob, dtype=np.float32)
+
+    def get_many(self, keys: List[str]) -> list:
+        """Cached vector (or None) for every key"""
+        with self._lock:
+            vectors = []
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                vectors.append(vector)
+            return vectors
+
+    def put_many(self, keys: List[str], vectors: List[np.ndarray]):
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._entries[key] = vector
+                self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+            if self._db is not None:
+                # The file holds the same entries as memory, so it stays at max_entries rows
+                with self._db:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                        [(key, vector.tobytes()) for key, vector in zip(keys, vectors) if key in self._entries]
+                    )
+                    self._db.executemany("DELETE FROM embeddings WHERE key = ?", [(key,) for key in evicted])
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "persisted": self._db is not None,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+class LazyEmbeddingFunction(EmbeddingFunction):
+    def __init__(self, factory: Callable[[], EmbeddingFunction], model_id: str = MODEL_NAME,
+                 cache: Optional[EmbeddingCache] = None):
+        self._factory = factory
+        self.model_id = model_id
+        self.cache = cache
+        self._function = None
+        self._lock = threading.Lock()
+        self.load_seconds = None
+        self.warm_up_seconds = None
+        self.error = None
+
+    def load(self) -> EmbeddingFunction:
+        """Create the underlying embedding function if that hasn't happened yet"""
+        if self._function is None:
+            with self._lock:
+                if self._function is None:
+                    started = time.perf_counter()
+                    self._function = self._factory()
+                    self.load_seconds = time.perf_counter() - started
+        return self._function
+
+    def warm_up(self):
+        """Load the model and embed one text, so the first request pays for neither"""
+        started = time.perf_counter()
+        try:
+            self.load()(["warm up"])
+        except Exception as e:
+            self.error = str(e)
+            raise
+        self.error = None
+        self.warm_up_seconds = time.perf_counter() - started
+
+    @property
+    def ready(self) -> bool:
+        return self.warm_up_seconds is not None
+
+    def status(self) -> dict:
+        return {
+            "loaded": self._function is not None,
+            "warmed_up": self.ready,
+            "backend": type(self._function).__name__ if self._function is not None else None,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "warm_up_seconds": round(self.warm_up_seconds, 3) if self.warm_up_seconds is not None else None,
+            "error": self.error,
+        }
+
+    def __call__(self, input: Documents) -> Embeddings:
+        if self.cache is None:
+            return self.load()(input)
+        keys = [self.cache.key(self.model_id, text) for text in input]
+        vectors = self.cache.get_many(keys)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            embedded = self.load()([input[i] for i in missing])
+            for i, vector in zip(missing, embedded):
+                vectors[i] = np.asarray(vector, dtype=np.float32)
+            self.cache.put_many([keys[i] for i in missing], [vectors[i] for i in missing])
+        return [vector.tolist() for vector in vectors]
@@ -0,0 +1,102 @@
+"""
+Embedding backend benchmark.
+Embeds the same chunks with every all-MiniLM-L6-v2 backend and reports, relative
+to the PyTorch (sentence-transformers) backend:
+  - throughput in embeddings/sec (model load time excluded)
+  - recall@k of nearest-neighbour search when documents and queries use the backend
+  - recall@k when only queries use it against PyTorch-embedded documents, i.e. an
+    existing collection queried after switching backends
+  - mean cosine similarity between the backend's vectors and PyTorch's
+
+Usage (from the Rag directory):
+    python -m common.embedding_benchmark notes.txt syllabus.pdf --queries 100 --k 5
+"""
+import argparse
+import time
+from typing import List
+
+import numpy as np
+
+from .embedder import EMBEDDING_BACKENDS, create_embedding_function
+from .pdf_extract import count_pages, iter_page_texts
+
+REFERENCE_BACKEND = "sentence-transformers"
+CHUNK_SIZE = 1000
+CHUNK_STEP = 800
+BATCH_SIZE = 64
+
+
+def load_chunks(paths: List[str]) -> List[str]:
+    chunks = []
+    for path in paths:
+        if path.lower().endswith(".pdf"):
+            text = "".join(iter_page_texts(path, count_pages(path)))
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        chunks += [text[start:start + CHUNK_SIZE] for start in range(0, len(text), CHUNK_STEP)]
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def make_queries(chunks: List[str], count: int) -> List[str]:
+    """A short passage from the middle of evenly spaced chunks"""
+    step = max(1, len(chunks) // count)
+    return [chunk[len(chunk) // 3:len(chunk) // 3 + 120] for chunk in chunks[::step][:count]]
+
+
+def embed(function, texts: List[str]) -> np.ndarray:
+    vectors = []
+    for start in range(0, len(texts), BATCH_SIZE):
+        vectors += function(texts[start:start + BATCH_SIZE])
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def top_k(queries: np.ndarray, documents: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-(queries @ documents.T), axis=1)[:, :k]
+
+
+def recall(found: np.ndarray, expected: np.ndarray) -> float:
+    return float(np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(found, expected)]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare embedding backends")
+    parser.add_argument("files", nargs="+", help="Text or PDF files to embed")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.files)
+    queries = make_queries(chunks, args.queries)
+    print(f"{len(chunks)} chunks, {len(queries)} queries, k={args.k}")
+
+    backends = [REFERENCE_BACKEND] + [b for b in args.backends if b != REFERENCE_BACKEND]
+    results = {}
+    for backend in backends:
+        started = time.perf_counter()
+        function = create_embedding_function(backend)
+        function(["warm up"])
+        load_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        documents = embed(function, chunks)
+        elapsed = time.perf_counter() - started
+        results[backend] = {
+            "documents": documents,
+            "queries": embed(function, queries),
+            "load_seconds": load_seconds,
+            "per_second": len(chunks) / elapsed,
+        }
+
+    reference = results[REFERENCE_BACKEND]
+    expected = top_k(reference["queries"], reference["documents"], args.k)
+    print(f"{'backend':<22}{'load s':>8}{'emb/sec':>10}{'speedup':>9}{'recall':>9}{'recall*':>9}{'cosine':>9}")
+    for backend, result in results.items():
+        own = recall(top_k(result["queries"], result["documents"], args.k), expected)
+        mixed = recall(top_k(result["queries"], reference["documents"], args.k), expected)
+        cosine = float(np.mean(np.sum(result["documents"] * reference["documents"], axis=1)))
+        print(f"{backend:<22}{result['load_seconds']:>8.2f}{result['per_second']:>10.1f}"
+              f"{result['per_second'] / reference['per_second']:>8.2f}x{own:>9.3f}{mixed:>9.3f}{cosine:>9.4f}")
+    print("recall* = queries on this backend against documents embedded with sentence-transformers")
@@ -0,0 +1,45 @@
+"""
+PDF extraction scaling benchmark.
+Writes a synthetic PDF (--pages pages of text) and extracts it with iter_page_texts
+at each worker count in --workers, reporting pages/sec and the speed-up over the
+smallest count (serial extraction for 1). Pool start-up is included, since ingestion pays it on every file.
+
+Usage (from the Rag directory):
+    python -m common.extract_benchmark --pages 500 --workers 1 2 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from .pdf_extract import iter_page_texts
+from .sample_pdf import write_sample_pdf
+
+
+def extract(path: str, pages: int, workers: int) -> float:
+    """Seconds to extract every page with `workers` processes"""
+    started = time.perf_counter()
+    extracted = sum(1 for _ in iter_page_texts(path, pages, workers=workers))
+    elapsed = time.perf_counter() - started
+    if extracted != pages:
+        raise RuntimeError(f"Extracted {extracted} of {pages} pages with {workers} workers")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pages/sec of PDF extraction against the number of workers")
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--runs", type=int, default=3, help="Best of this many runs per worker count")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sample.pdf")
+        write_sample_pdf(path, args.pages)
+        print(f"{args.pages} pages, {os.cpu_count()} CPUs, best of {args.runs}")
+        print(f"{'workers':>7}{'seconds':>10}{'pages/sec':>12}{'speed-up':>10}")
+        serial = None
+        for workers in sorted(set(args.workers)):
+            elapsed = min(extract(path, args.pages, workers) for _ in range(args.runs))
+            serial = serial or elapsed
+            print(f"{workers:>7}{elapsed:>10.2f}{args.pages / elapsed:>12.1f}{serial / elapsed:>9.2f}x")
@@ -0,0 +1,246 @@
+"""
+In-process background job queue for long-running ingestion work.
+Jobs are run by a small worker pool fed from a bounded queue, and their state is
+persisted to a JSON file so progress survives a restart (interrupted jobs are
+marked as failed). Work functions report progress through `job.report(...)`,
+which is also where cooperative cancellation is raised.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+# Finished jobs kept in the state file
+MAX_FINISHED_JOBS = 200
+# Minimum seconds between state-file writes caused by progress reports
+PROGRESS_SAVE_INTERVAL = 1.0
+
+FINISHED_STATES = ("completed", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind: str, params: dict, job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = "queued"
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.pages_processed = 0
+        self.total_pages = None
+        self.chunks_embedded = 0
+        self.result = None
+        self.error = None
+        self.cancel_requested = False
+        self._started = None
+        self._elapsed = None
+        self._on_change = None
+
+    def report(self, pages_processed: Optional[int] = None, total_pages: Optional[int] = None,
+               chunks_embedded: Optional[int] = None):
+        """Update progress from the work function; raises JobCancelled once cancellation is requested"""
+        if pages_processed is not None:
+            self.pages_processed = pages_processed
+        if total_pages is not None:
+            self.total_pages = total_pages
+        if chunks_embedded is not None:
+            self.chunks_embedded = chunks_embedded
+        if self._on_change:
+            self._on_change(self)
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    def to_dict(self) -> dict:
+        elapsed = self._elapsed
+        if elapsed is None and self._started is not None:
+            elapsed = time.perf_counter() - self._started
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "pages_processed": self.pages_processed,
+            "total_pages": self.total_pages,
+            "chunks_embedded": self.chunks_embedded,
+            "elapsed_seconds": round(elapsed, 3) if elapsed else None,
+            "pages_per_second": round(self.pages_processed / elapsed, 2) if elapsed else None,
+            "chunks_per_second": round(self.chunks_embedded / elapsed, 2) if elapsed else None,
+            "result": self.result,
+            "error": self.error,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Job":
+        job = cls(data["kind"], data.get("params", {}), job_id=data["job_id"])
+        for field in ("status", "created_at", "started_at", "finished_at", "pages_processed",
+                      "total_pages", "chunks_embedded", "result", "error"):
+            setattr(job, field, data.get(field))
+        job._elapsed = data.get("elapsed_seconds")
+        return job
+
+
+class JobQueue:
+    def __init__(self, state_path: str, workers: int = 2, max_pending: int = 16):
+        self.state_path = state_path
+        self.workers = workers
+        self.max_pending = max_pending
+        self.jobs = {}
+        self._handlers = {}
+        self._queue = None
+        self._tasks = []
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest-job")
+        self._save_lock = threading.Lock()
+        self._last_progress_save = 0.0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: could not read job state from {self.state_path}: {e}")
+            return
+        for data in saved:
+            job = Job.from_dict(data)
+            if job.status not in FINISHED_STATES:
+                job.status = "failed"
+                job.error = "Interrupted by service restart"
+            self.jobs[job.id] = job
+
+    def save(self):
+        """Write all job states to disk (atomically)"""
+        with self._save_lock:
+            jobs = list(self.jobs.values())
+            finished = [j for j in jobs if j.status in FINISHED_STATES]
+            for old in finished[:-MAX_FINISHED_JOBS]:
+                self.jobs.pop(old.id, None)
+            snapshot = [j.to_dict() for j in list(self.jobs.values())]
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.state_path)
+
+    def register(self, kind: str, handler: Callable[[Job], dict],
+                 cleanup: Optional[Callable[[Job], None]] = None):
+        """
+        Register the blocking work function for a job kind. `cleanup(job)` runs once
+        the job has finished for any reason, including cancellation before it started.
+        """
+        self._handlers[kind] = (handler, cleanup)
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for job in self.jobs.values():
+            if job.status in ("queued", "running"):
+                job.cancel_requested = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+        self.save()
+
+    def submit(self, kind: str, params: dict) -> Job:
+        """Queue a job and return it immediately; raises QueueFull when the queue is at capacity"""
+        job = Job(kind, params)
+        job._on_change = self._on_progress
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull(f"Job queue is full ({self.max_pending} pending)")
+        self.jobs[job.id] = job
+        self.save()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued job outright, or ask a running one to stop at its next progress report"""
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED_STATES:
+            return job
+        job.cancel_requested = True
+        if job.status == "queued":
+            job.status = "cancelled"
+            job.finished_at = datetime.now().isoformat()
+        self.save()
+        return job
+
+    def _on_progress(self, job: Job):
+        now = time.monotonic()
+        if now - self._last_progress_save >= PROGRESS_SAVE_INTERVAL:
+            self._last_progress_save = now
+            self.save()
+
+    @staticmethod
+    def _cleanup(cleanup: Optional[Callable[[Job], None]], job: Job):
+        if cleanup:
+            try:
+                cleanup(job)
+            except Exception as e:
+                print(f"Warning: cleanup for job {job.id} failed: {e}")
+
+    def _run(self, handler: Callable[[Job], dict], cleanup: Optional[Callable[[Job], None]], job: Job) -> dict:
+        """
+        Run a job on the executor, followed by its cleanup. Cleanup happens in the same
+        thread so it can't remove files the handler still uses, even when stop() cancels
+        the worker that is awaiting the result.
+        """
+        try:
+            return handler(job)
+        finally:
+            self._cleanup(cleanup, job)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            handler, cleanup = self._handlers[job.kind]
+            submitted = False
+            try:
+                if job.status == "cancelled":
+                    continue
+                job.status = "running"
+                job.started_at = datetime.now().isoformat()
+                job._started = time.perf_counter()
+                self.save()
+                try:
+                    future = loop.run_in_executor(self._executor, self._run, handler, cleanup, job)
+                    submitted = True
+                    job.result = await future
+                    job.status = "completed"
+                except JobCancelled:
+                    job.status = "cancelled"
+                except Exception as e:
+                    job.status = "failed"
+                    job.error = str(e)
+                job._elapsed = time.perf_counter() - job._started
+                job.finished_at = datetime.now().isoformat()
+                self.save()
+            finally:
+                # Jobs that never reached the executor are cleaned up here
+                if not submitted:
+                    self._cleanup(cleanup, job)
+                self._queue.task_done()
@@ -0,0 +1,137 @@
+"""
+BM25 keyword retrieval kept alongside a ChromaDB collection.
+Dense retrieval misses exact terms (course codes, chapter names), so documents are
+also indexed in an SQLite FTS5 table, which is an inverted index with built-in BM25
+ranking. It is updated incrementally as chunks are added or removed, and keyword
+and vector rankings are combined with reciprocal rank fusion.
+"""
+from collections import defaultdict
+import os
+import re
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+# Standard RRF constant: damps the influence of the very top ranks of any one retriever
+RRF_K = 60
+# Documents read from the collection at a time when rebuilding the index
+SYNC_PAGE_SIZE = 500
+
+
+def keyword_query(text: str) -> str:
+    """FTS5 query matching any of the words in `text` (quoted, so no operator syntax leaks through)"""
+    words = dict.fromkeys(re.findall(r"\w+", text.lower()))
+    return " OR ".join(f'"{word}"' for word in words)
+
+
+class KeywordIndex:
+    def __init__(self, path: str):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._db:
+            # docs maps chunk ids to the rowids of the FTS table
+            self._db.execute("CREATE TABLE IF NOT EXISTS docs (rowid INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL)")
+            self._db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(document, tokenize='porter unicode61')"
+            )
+
+    def add(self, ids: List[str], documents: List[str]) -> int:
+        """Index documents whose ids aren't indexed yet; returns how many were added"""
+        added = 0
+        with self._lock, self._db:
+            for doc_id, document in zip(ids, documents):
+                cursor = self._db.execute("INSERT OR IGNORE INTO docs (id) VALUES (?)", (doc_id,))
+                if cursor.rowcount:
+                    self._db.execute("INSERT INTO chunks (rowid, document) VALUES (?, ?)", (cursor.lastrowid, document))
+                    added += 1
+        return added
+
+    def delete(self, ids: List[str]):
+        with self._lock, self._db:
+            for doc_id in ids:
+                row = self._db.execute("SELECT rowid FROM docs WHERE id = ?", (doc_id,)).fetchone()
+                if row:
+                    self._db.execute("DELETE FROM chunks WHERE rowid = ?", row)
+                    self._db.execute("DELETE FROM docs WHERE rowid = ?", row)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def search(self, text: str, n_results: int = 10) -> List[Tuple[str, float]]:
+        """Best-matching (id, BM25 score) pairs, highest score first"""
+        query = keyword_query(text)
+        if not query:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT docs.id, bm25(chunks) FROM chunks JOIN docs ON docs.rowid = chunks.rowid "
+                "WHERE chunks MATCH ? ORDER BY bm25(chunks) LIMIT ?",
+                (query, n_results)
+            ).fetchall()
+        # SQLite's bm25() is negated so that smaller is better
+        return [(doc_id, -score) for doc_id, score in rows]
+
+    def sync(self, collection) -> int:
+        """Rebuild the index from `collection` when their sizes differ (first run, or missed updates)"""
+        total = collection.count()
+        if self.count() == total:
+            return 0
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM docs")
+            self._db.execute("DELETE FROM chunks")
+        for offset in range(0, total, SYNC_PAGE_SIZE):
+            page = collection.get(include=["documents"], limit=SYNC_PAGE_SIZE, offset=offset)
+            self.add(page["ids"], [document or "" for document in page["documents"]])
+        return total
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in"""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def hybrid_query(collection, index: Optional[KeywordIndex], query_text: str, n_results: int,
+                 candidates: int = 20) -> dict:
+    """
+    Vector and keyword retrieval fused with RRF; blocking. Returns a single-query result in
+    ChromaDB's shape (ids, documents, metadatas, distances - None for keyword-only hits)
+    plus the fused `scores`. Without an index this is a plain vector query.
+    """
+    vector = collection.query(
+        query_texts=[query_text],
+        n_results=candidates if index else n_results,
+        include=["documents", "metadatas", "distances"]
+    )
+    if index is None:
+        return vector
+
+    hits = {
+        doc_id: (document, metadata, distance)
+        for doc_id, document, metadata, distance in zip(
+            vector["ids"][0], vector["documents"][0], vector["metadatas"][0], vector["distances"][0]
+        )
+    }
+    keyword_ids = [doc_id for doc_id, _ in index.search(query_text, candidates)]
+    fused = reciprocal_rank_fusion([vector["ids"][0], keyword_ids])[:n_results]
+
+    missing = [doc_id for doc_id, _ in fused if doc_id not in hits]
+    if missing:
+        fetched = collection.get(ids=missing, include=["documents", "metadatas"])
+        for doc_id, document, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+            hits[doc_id] = (document, metadata, None)
+
+    fused = [(doc_id, score) for doc_id, score in fused if doc_id in hits]
+    return {
+        "ids": [[doc_id for doc_id, _ in fused]],
+        "documents": [[hits[doc_id][0] for doc_id, _ in fused]],
+        "metadatas": [[hits[doc_id][1] for doc_id, _ in fused]],
+        "distances": [[hits[doc_id][2] for doc_id, _ in fused]],
+        "scores": [[round(score, 5) for _, score in fused]],
+    }
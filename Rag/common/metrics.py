@@ -0,0 +1,49 @@
+"""
+Lightweight in-process metrics for the RAG services.
+Counters and timing samples are kept in memory and exposed through /metrics/.
+"""
+from collections import defaultdict, deque
+import threading
+
+# Keep only the most recent samples per timing so memory stays bounded
+MAX_SAMPLES = 1000
+
+
+class Metrics:
+    def __init__(self, max_samples: int = MAX_SAMPLES):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._timings = defaultdict(lambda: deque(maxlen=max_samples))
+
+    def incr(self, name: str, value: int = 1):
+        """Increase a counter"""
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value: float):
+        """Record a timing/size sample (milliseconds, tokens, ...)"""
+        with self._lock:
+            self._timings[name].append(value)
+
+    def snapshot(self) -> dict:
+        """Counters plus count/avg/p50/p99/max for every timing"""
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {name: list(samples) for name, samples in self._timings.items()}
+
+        summary = {}
+        for name, samples in timings.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            summary[name] = {
+                "count": len(ordered),
+                "avg": round(sum(ordered) / len(ordered), 2),
+                "p50": round(ordered[int(0.50 * (len(ordered) - 1))], 2),
+                "p99": round(ordered[int(0.99 * (len(ordered) - 1))], 2),
+                "max": round(ordered[-1], 2),
+            }
+        return {"counters": counters, "timings": summary}
+
+
+metrics = Metrics()
@@ -0,0 +1,62 @@
+"""
+Multi-process PDF text extraction.
+PyPDF2's extract_text() is CPU-bound, so large files are split into page ranges
+that are extracted by a process pool and yielded back in page order. Small files
+(or workers=1) are extracted serially, where pool start-up would cost more than it saves.
+This module only depends on PyPDF2 so spawned workers start quickly. Spawned workers
+also re-run the launching script as __mp_main__, so a service must not be started from
+a script that does its setup at import time (see `python main.py` in Rag rhythm).
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+from typing import Iterator, List
+
+import PyPDF2
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+# Files shorter than this are extracted serially
+DEFAULT_MIN_PARALLEL_PAGES = 64
+PAGES_PER_TASK = 16
+
+
+def count_pages(path: str) -> int:
+    return len(PyPDF2.PdfReader(path).pages)
+
+
+def extract_page_range(path: str, start: int, end: int) -> List[str]:
+    """Extract pages [start, end) of a PDF; runs inside a worker process"""
+    reader = PyPDF2.PdfReader(path)
+    return [(reader.pages[i].extract_text() or "") + "\n" for i in range(start, end)]
+
+
+def iter_page_texts(
+    path: str,
+    total_pages: int,
+    workers: int = DEFAULT_WORKERS,
+    min_parallel_pages: int = DEFAULT_MIN_PARALLEL_PAGES,
+) -> Iterator[str]:
+    """Yield the text of every page in order, extracting in parallel for large files"""
+    if workers <= 1 or total_pages < min_parallel_pages:
+        reader = PyPDF2.PdfReader(path)
+        for page in reader.pages:
+            yield (page.extract_text() or "") + "\n"
+        return
+
+    ranges = [(start, min(start + PAGES_PER_TASK, total_pages)) for start in range(0, total_pages, PAGES_PER_TASK)]
+    # Only keep a couple of ranges per worker in flight so extracted text doesn't pile up
+    # in memory while the consumer (embedding) is slower than extraction
+    window = workers * 2
+
+    # spawn rather than fork: the services run threads (uvicorn, ChromaDB, torch) that fork can deadlock
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = [pool.submit(extract_page_range, path, start, end) for start, end in ranges[:window]]
+        next_range = len(pending)
+        while pending:
+            texts = pending.pop(0).result()
+            if next_range < len(ranges):
+                start, end = ranges[next_range]
+                pending.append(pool.submit(extract_page_range, path, start, end))
+                next_range += 1
+            yield from texts
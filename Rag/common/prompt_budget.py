@@ -0,0 +1,81 @@
+"""
+Token-budgeted context for prompts.
+Retrieved documents are packed into a fixed per-prompt token budget: documents
+that mostly repeat text already in the prompt (overlapping chunks) are skipped
+and the rest are trimmed to fit, so prompt size - and Gemini latency and cost -
+no longer depends on what the collection happens to return.
+Tokens are estimated at ~4 characters each, which is close enough for English
+text with Gemini's tokenizer and needs no network round-trip.
+"""
+from typing import Iterable, List, Optional
+
+CHARS_PER_TOKEN = 4
+# Word n-grams compared when looking for overlapping chunks
+SHINGLE_WORDS = 5
+# A document is skipped when this fraction of its n-grams is already in the prompt
+DEFAULT_OVERLAP_THRESHOLD = 0.5
+# Don't bother adding a document that would have to be cut below this size
+MIN_DOC_TOKENS = 32
+
+
+def count_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most `max_tokens`, on a word boundary where possible"""
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit - 3]
+    space = cut.rfind(" ")
+    if space > limit // 2:
+        cut = cut[:space]
+    return cut.rstrip() + "..."
+
+
+def shingles(text: str) -> set:
+    words = text.lower().split()
+    if len(words) < SHINGLE_WORDS:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+class ContextBudget:
+    """Token budget shared by all retrieved sections of one prompt"""
+
+    def __init__(self, tokens: int, overlap_threshold: float = DEFAULT_OVERLAP_THRESHOLD):
+        self.tokens = tokens
+        self.remaining = tokens
+        self.overlap_threshold = overlap_threshold
+        self.dropped_duplicates = 0
+        self.truncated = 0
+        self._seen = set()
+
+    def take(self, documents: Iterable[str], max_tokens: Optional[int] = None,
+             max_doc_tokens: Optional[int] = None) -> List[str]:
+        """
+        Keep documents in order until the budget (or this section's `max_tokens`) runs out,
+        skipping near-duplicates of anything already taken and trimming the rest to fit.
+        """
+        limit = self.remaining if max_tokens is None else min(max_tokens, self.remaining)
+        kept = []
+        for document in documents:
+            text = (document or "").strip()
+            if not text:
+                continue
+            if limit < MIN_DOC_TOKENS:
+                break
+            doc_shingles = shingles(text)
+            if doc_shingles and len(doc_shingles & self._seen) >= self.overlap_threshold * len(doc_shingles):
+                self.dropped_duplicates += 1
+                continue
+            fitted = truncate_to_tokens(text, limit if max_doc_tokens is None else min(max_doc_tokens, limit))
+            if fitted != text:
+                self.truncated += 1
+            kept.append(fitted)
+            self._seen |= doc_shingles
+            used = count_tokens(fitted)
+            limit -= used
+            self.remaining -= used
+        return kept
@@ -0,0 +1,40 @@
+"""
+Synthetic text PDFs for the ingestion and extraction benchmarks.
+"""
+import random
+
+WORDS = ("integral derivative matrix vector entropy enzyme photosynthesis mitochondria "
+         "electron orbital theorem proof lemma algorithm recursion graph tree heap queue "
+         "revolution treaty empire parliament climate erosion tectonic sediment poetry metaphor "
+         "velocity momentum friction torque circuit voltage current resistance").split()
+LINES_PER_PAGE = 45
+WORDS_PER_LINE = 12
+
+
+def write_sample_pdf(path: str, pages: int, seed: int = 0) -> None:
+    """Minimal PDF with `pages` pages of pseudo-random text, readable by PyPDF2"""
+    rng = random.Random(seed)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for number in range(1, pages + 1):
+        lines = [f"Page {number}"] + [" ".join(rng.choice(WORDS) for _ in range(WORDS_PER_LINE))
+                                      for _ in range(LINES_PER_PAGE)]
+        text = " T* ".join(f"({line}) Tj" for line in lines)
+        stream = f"BT /F1 10 Tf 14 TL 40 800 Td {text} ET".encode("ascii")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids))
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        f.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
@@ -0,0 +1,129 @@
+"""
+Semantic response cache for LLM calls.
+A request hits the cache when its normalized text matches a stored entry exactly,
+or when its embedding is within a cosine-similarity threshold of one.
+Entries expire after a TTL and the least recently used entry is evicted when full.
+"""
+from collections import OrderedDict
+import threading
+import time
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .singleflight import normalize_text
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        embed: Callable[[List[str]], List[List[float]]],
+        max_entries: int = 256,
+        ttl_seconds: float = 3600,
+        similarity_threshold: float = 0.92,
+    ):
+        self.embed = embed
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        # key -> (value, unit-length embedding, scope, stored_at)
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(text: str, scope: str) -> str:
+        return f"{scope}\x00{normalize_text(text)}"
+
+    def _embed(self, text: str) -> np.ndarray:
+        return self.embed_many([text])[0]
+
+    def embed_many(self, texts: List[str]) -> List[np.ndarray]:
+        """Unit-length embeddings for several texts in one call, for pre-computing a batch of lookups"""
+        vectors = np.asarray(self.embed([normalize_text(text) for text in texts]), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return list(vectors / np.where(norms == 0, 1, norms))
+
+    def _expire(self, now: float):
+        expired = [key for key, entry in self._entries.items() if now - entry[3] > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self, text: str, scope: str = "",
+            embedding: Optional[np.ndarray] = None) -> Tuple[Optional[Any], Optional[np.ndarray]]:
+        """
+        Look up a cached value. Entries only match within the same scope (e.g. extra
+        request fields that must be identical). Returns (value, embedding); the
+        embedding is passed back to put() on a miss so the text is embedded once.
+        A unit-length `embedding` from embed_many() can be passed in to skip embedding here.
+        """
+        key = self._key(text, scope)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0], None
+
+        if embedding is None:
+            embedding = self._embed(text)
+
+        with self._lock:
+            best_key, best_score = None, -1.0
+            for entry_key, (_, entry_embedding, entry_scope, _) in self._entries.items():
+                if entry_scope != scope:
+                    continue
+                score = float(np.dot(embedding, entry_embedding))
+                if score > best_score:
+                    best_key, best_score = entry_key, score
+
+            if best_key is not None and best_score >= self.similarity_threshold:
+                self._entries.move_to_end(best_key)
+                self.hits += 1
+                self.semantic_hits += 1
+                return self._entries[best_key][0], embedding
+
+            self.misses += 1
+            return None, embedding
+
+    def put(self, text: str, value: Any, scope: str = "", embedding: Optional[np.ndarray] = None):
+        """Store a value, evicting the least recently used entry when full"""
+        if embedding is None:
+            embedding = self._embed(text)
+        key = self._key(text, scope)
+        with self._lock:
+            self._entries[key] = (value, embedding, scope, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def drop_scopes(self, scopes: Iterable[str]) -> int:
+        """Remove every entry in the given scopes, e.g. after the data they were built from changed"""
+        scopes = set(scopes)
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if entry[2] in scopes]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,68 @@
+"""
+Single-flight coalescing of identical in-flight requests.
+When many clients send the same request within seconds (a whole class submitting
+the same query), only the first one - the leader - does the work; the others await
+the leader's result instead of making their own LLM call. Requests are matched by a
+hash of their payload, with free text (queries, notes) folded by normalize_text but
+identifiers such as user ids kept exact. A key is forgotten as soon as its leader
+finishes, so results are never reused after the fact (that is the cache's job).
+"""
+import asyncio
+import hashlib
+import json
+import re
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+
+def normalize_text(text: Optional[str]) -> Optional[str]:
+    """
+    Lowercase, drop punctuation and collapse whitespace so trivial edits of free text
+    match; None stays None. The semantic cache folds its keys the same way.
+    """
+    if not isinstance(text, str):
+        return text
+    text = re.sub(r"[^\w\s:]", " ", text.lower())
+    return " ".join(text.split())
+
+
+def request_key(*parts: Any) -> str:
+    """
+    Stable hash of a request's payload (e.g. endpoint name and body). Parts are hashed as
+    given: fold free-text fields with normalize_text first, but never ids, whose case matters.
+    """
+    payload = json.dumps(list(parts), sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run `func()` unless a call with the same key is already in flight, in which case
+        wait for that one. Returns (result, shared); errors reach every waiter. The work
+        runs in its own task, so a leader whose client disconnects doesn't cancel it for
+        the followers.
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task), True
+
+        self.leaders += 1
+        task = asyncio.ensure_future(func())
+        self._calls[key] = task
+        task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task), False
+
+    def stats(self) -> dict:
+        requests = self.leaders + self.coalesced
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": round(self.coalesced / requests, 3) if requests else 0.0,
+        }
@@ -0,0 +1,89 @@
+"""
+Startup-time benchmark for a RAG service.
+Starts the service's app with uvicorn several times and reports how long it takes until
+the server accepts requests and until /ready reports the embedding model is warm.
+
+Usage (from the Rag directory):
+    python -m common.startup_benchmark --service timetable --runs 5 --embedding-load background
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+RAG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICE_DIRS = {
+    "timetable": os.path.join(RAG_DIR, "Rag Time table"),
+    "rhythm": os.path.join(RAG_DIR, "Rag rhythm"),
+}
+
+
+def poll_ready(url: str) -> int:
+    """HTTP status of the readiness probe, or 0 while the server isn't listening"""
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return 0
+
+
+def measure_startup(service_dir: str, port: int, embedding_load: str, timeout: float) -> dict:
+    env = {**os.environ, "EMBEDDING_LOAD": embedding_load}
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        cwd=service_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    listening, ready = None, None
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"Service exited with code {process.returncode}")
+            status = poll_ready(f"http://127.0.0.1:{port}/ready")
+            elapsed = time.perf_counter() - started
+            if status and listening is None:
+                listening = elapsed
+            if status == 200:
+                ready = elapsed
+                break
+            time.sleep(0.05)
+    finally:
+        process.terminate()
+        process.wait()
+    return {"listening": listening, "ready": ready}
+
+
+def seconds(value) -> str:
+    return f"{value:.2f}s" if value is not None else "timed out"
+
+
+def summarize(samples: list) -> str:
+    samples = [sample for sample in samples if sample is not None]
+    if not samples:
+        return "n/a"
+    return f"median {statistics.median(samples):.2f}s, min {min(samples):.2f}s, max {max(samples):.2f}s"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure service startup time")
+    parser.add_argument("--service", default="timetable", choices=sorted(SERVICE_DIRS))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--embedding-load", default="background", choices=["background", "eager", "lazy"])
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for each start")
+    args = parser.parse_args()
+
+    results = []
+    for run in range(1, args.runs + 1):
+        result = measure_startup(SERVICE_DIRS[args.service], args.port, args.embedding_load, args.timeout)
+        results.append(result)
+        print(f"Run {run}: listening after {seconds(result['listening'])}, ready after {seconds(result['ready'])}")
+
+    print(f"Accepting requests: {summarize([r['listening'] for r in results])}")
+    print(f"Ready:              {summarize([r['ready'] for r in results])}")